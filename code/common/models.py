@@ -10,6 +10,15 @@ from common.constants import UserType
 from common.managers import UserManager
 
 
+class BaseHistoricalRecords(HistoricalRecords):
+    """HistoricalRecords of every BaseModel subclass, except those setting ``track_history = False``"""
+
+    def finalize(self, sender, **kwargs):
+        if not getattr(sender, "track_history", True):
+            return
+        super().finalize(sender, **kwargs)
+
+
 class BaseModel(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     # created_on and updated_on are intended only for database audits.
@@ -17,7 +26,9 @@ class BaseModel(models.Model):
     created_on = models.DateTimeField(auto_now_add=True)
     updated_on = models.DateTimeField(auto_now=True)
     is_deleted = models.BooleanField(default=False, editable=False)
-    history = HistoricalRecords(inherit=True)
+    history = BaseHistoricalRecords(inherit=True)
+    #: whether to keep history records; off for data derived from other models, which have their own history
+    track_history = True
 
     def update(self, update_dict=None, **kwargs):
         """ Helper method to update objects """
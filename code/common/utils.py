@@ -15,3 +15,10 @@ def csrf_exempt_localhost(view_func):
     if settings.LOCALHOST:
         wrapped_view.csrf_exempt = True
     return wraps(view_func)(wrapped_view)
+
+
+class Echo:
+    """File-like object that returns what is written to it, for streaming csv.writer rows in a response."""
+
+    def write(self, value):
+        return value
@@ -1,13 +1,12 @@
 from django.contrib import admin
+from django.db import transaction
 
 from esp.models import (course_scheduling_models, program_models,
                         program_registration_models)
 
 admin.site.site_header = 'MIT ESP Database Administration'
 admin.site.register(course_scheduling_models.CourseSection)
-admin.site.register(course_scheduling_models.ClassroomTimeSlot)
 # admin.site.register(course_scheduling_models.ClassroomConstraint)
-admin.site.register(program_models.Classroom)
 admin.site.register(program_models.ClassroomTag)
 admin.site.register(program_models.Course)
 admin.site.register(program_models.CourseCategory)
@@ -22,10 +21,38 @@ admin.site.register(program_models.TimeSlot)
 admin.site.register(program_models.ExternalProgramForm)
 admin.site.register(program_registration_models.ClassPreference)
 admin.site.register(program_registration_models.CompletedStudentRegistrationStep)
+admin.site.register(program_registration_models.LotteryJob)
+admin.site.register(program_registration_models.LotteryRun)
+admin.site.register(program_registration_models.WaitlistEntry)
 admin.site.register(program_registration_models.StudentProfile)
 admin.site.register(program_registration_models.TeacherProfile)
 
 
+@admin.register(course_scheduling_models.ClassroomTimeSlot)
+class ClassroomTimeSlotAdmin(admin.ModelAdmin):
+    def delete_queryset(self, request, queryset):
+        from esp.schedule_changes import resync_schedules
+
+        with transaction.atomic():
+            changed = list(queryset.values_list("time_slot__program_id", "course_section_id").distinct())
+            super().delete_queryset(request, queryset)
+            resync_schedules(changed)
+
+
+@admin.register(program_models.Classroom)
+class ClassroomAdmin(admin.ModelAdmin):
+    def delete_queryset(self, request, queryset):
+        from esp.schedule_changes import resync_schedules
+
+        with transaction.atomic():
+            # Deleting classrooms deletes their ClassroomTimeSlots without calling ClassroomTimeSlot.delete
+            changed = list(course_scheduling_models.ClassroomTimeSlot.objects.filter(
+                classroom__in=queryset
+            ).values_list("time_slot__program_id", "course_section_id").distinct())
+            super().delete_queryset(request, queryset)
+            resync_schedules(changed)
+
+
 class StudentProgramRegistrationStepInline(admin.StackedInline):
     extra = 0
     model = program_models.StudentProgramRegistrationStep
@@ -0,0 +1,139 @@
+"""
+Checking students in on program day by scanning their barcode or QR code.
+
+Whether a student may be checked in is stored in the readiness fields of their StudentRegistration (forms_complete,
+required_purchases_complete and amount_owed), which refresh_checkin_readiness() recomputes with a single UPDATE for
+any number of registrations. It runs wherever forms or payments change: when a student submits forms or pays, when a
+registration is created, and for every student of a program when its student forms or purchaseable items change. A
+scan only reads the stored readiness: it looks the student up by primary key and checks them in with one conditional
+UPDATE, so any number of scanners can check students in at once without checking anyone in twice.
+
+For lobbies without a reliable connection, devices can download the program's roster with checkin_roster_rows(),
+check students in locally, and later send the scanned codes to sync_check_ins(), which applies them in one
+transaction; sending the same codes again changes nothing.
+"""
+from uuid import UUID
+
+from django.db import transaction
+from django.db.models import DecimalField, Exists, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from common.constants import UserType
+from esp.constants import CheckinSyncResult
+from esp.models.program_models import ExternalProgramForm, PurchaseableItem
+from esp.models.program_registration_models import CompletedStudentForm, PurchaseLineItem, StudentRegistration
+
+
+def refresh_checkin_readiness(registrations):
+    """Recompute the check-in readiness fields of a queryset of StudentRegistrations, with one UPDATE."""
+    registrations.update(
+        forms_complete=~Exists(ExternalProgramForm.objects.filter(
+            program_id=OuterRef("program_id"), user_type=UserType.student
+        ).filter(~Exists(CompletedStudentForm.objects.filter(
+            program_registration_id=OuterRef(OuterRef("id")), form_id=OuterRef("id"), completed_on__isnull=False
+        )))),
+        required_purchases_complete=~Exists(PurchaseableItem.objects.filter(
+            program_id=OuterRef("program_id"), required_for_registration=True
+        ).filter(~Exists(PurchaseLineItem.objects.filter(
+            user_id=OuterRef(OuterRef("user_id")), item_id=OuterRef("id"), purchase_confirmed_on__isnull=False
+        )))),
+        amount_owed=Coalesce(
+            Subquery(
+                PurchaseLineItem.objects.filter(
+                    user_id=OuterRef("user_id"), item__program_id=OuterRef("program_id"),
+                    purchase_confirmed_on__isnull=True,
+                ).order_by().values("user_id").annotate(total=Sum("charge_amount")).values("total")
+            ),
+            Value(0),
+            output_field=DecimalField(max_digits=8, decimal_places=2),
+        ),
+    )
+
+
+def parse_checkin_code(code):
+    """
+    The StudentRegistration id encoded by a scanned code: either its barcode ID (see
+    StudentRegistration.get_barcode_id) or the registration's UUID, as in QR codes. Raises ValueError otherwise.
+    """
+    return UUID(code.strip())
+
+
+def check_in_student(program_id, code):
+    """
+    Check in the program's student whose barcode or QR code was scanned. Returns the StudentRegistration, with its
+    user, whether this scan checked the student in, and the check_registration_requirements() dict. Raises ValueError
+    if the code is not a registration code and StudentRegistration.DoesNotExist if it is not one of the program's.
+    """
+    registration = StudentRegistration.objects.select_related("user").get(
+        id=parse_checkin_code(code), program_id=program_id
+    )
+    requirements = registration.check_checkin_readiness()
+    if registration.checked_in or not requirements["requirements_satisfied"]:
+        return registration, False, requirements
+    # Only one of several scanners reading the same code at once gets to check the student in
+    checked_in = bool(StudentRegistration.objects.filter(id=registration.id, checked_in=False).update(checked_in=True))
+    registration.checked_in = True
+    return registration, checked_in, requirements
+
+
+def checkin_roster_rows(program_id):
+    """
+    Yield a header and then one row per StudentRegistration of the program, ordered by name: registration id,
+    barcode ID, username, first and last name, checked in, forms complete, required purchases complete and amount
+    owed, with one query however large the program is.
+    """
+    registrations = StudentRegistration.objects.filter(program_id=program_id)
+    yield [
+        "registration", "barcode_id", "username", "first_name", "last_name", "checked_in", "forms_complete",
+        "required_purchases_complete", "amount_owed",
+    ]
+    for registration_id, *row in registrations.order_by("user__last_name", "user__first_name", "id").values_list(
+        "id", "user__username", "user__first_name", "user__last_name", "checked_in", "forms_complete",
+        "required_purchases_complete", "amount_owed",
+    ).iterator(chunk_size=2000):
+        # Same as StudentRegistration.get_barcode_id
+        yield [registration_id, registration_id.hex.upper(), *row]
+
+
+def sync_check_ins(program_id, codes):
+    """
+    Check in the program's students whose barcode or QR codes were scanned offline, in one transaction. Students
+    are only checked in if their registration requirements are satisfied at the time of syncing. Returns a
+    {"code", "result", "registration", "errors"} dict per distinct code, in the order given, where ``result`` is a
+    CheckinSyncResult.
+    """
+    registration_ids = {}
+    for code in codes:
+        try:
+            registration_ids[code] = parse_checkin_code(code)
+        except (ValueError, AttributeError):
+            registration_ids[code] = None
+
+    with transaction.atomic():
+        registrations = StudentRegistration.objects.filter(
+            program_id=program_id, id__in={id_ for id_ in registration_ids.values() if id_ is not None}
+        )
+        registrations = {registration.id: registration for registration in registrations.select_for_update()}
+        to_check_in = {
+            registration.id for registration in registrations.values()
+            if not registration.checked_in and registration.check_checkin_readiness()["requirements_satisfied"]
+        }
+        StudentRegistration.objects.filter(id__in=to_check_in).update(checked_in=True)
+
+    results = []
+    for code, registration_id in registration_ids.items():
+        registration = registrations.get(registration_id)
+        errors = []
+        if registration_id is None:
+            result = CheckinSyncResult.invalid_code
+        elif registration is None:
+            result = CheckinSyncResult.not_found
+        elif registration_id in to_check_in:
+            result = CheckinSyncResult.checked_in
+        elif registration.checked_in:
+            result = CheckinSyncResult.already_checked_in
+        else:
+            result = CheckinSyncResult.not_ready
+            errors = registration.check_checkin_readiness()["errors"]
+        results.append({"code": code, "result": result, "registration": registration_id, "errors": errors})
+    return results
@@ -0,0 +1,92 @@
+"""
+Which time slots of a program each classroom is available for, i.e. which ClassroomTimeSlots exist.
+
+Changes are computed as set differences against one read of the program's classroom x time slot matrix, then written
+with one bulk insert and one bulk delete, however many classrooms and time slots they touch.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from esp.models.course_scheduling_models import ClassroomTimeSlot
+from esp.models.program_models import Classroom, TimeSlot
+from esp.schedule_changes import next_schedule_version
+from esp.section_meetings import rebuild_section_meetings
+
+#: most ClassroomTimeSlots inserted or deleted per statement
+BULK_BATCH_SIZE = 1000
+
+
+def classroom_availability(program_id):
+    """{(classroom_id, time_slot_id): (classroom_time_slot_id, course_section_id)} of the program, with one query."""
+    return {
+        (classroom_id, time_slot_id): (classroom_time_slot_id, section_id)
+        for classroom_time_slot_id, classroom_id, time_slot_id, section_id in ClassroomTimeSlot.objects.filter(
+            time_slot__program_id=program_id
+        ).values_list("id", "classroom_id", "time_slot_id", "course_section_id")
+    }
+
+
+def availability_pattern(program_id, classroom_ids=None, weekdays=None, start_times=None):
+    """
+    The (classroom_id, time_slot_id) pairs of the given classrooms and the program's time slots starting on the given
+    weekdays (0 is Monday) and local times of day; each left as None matches all.
+    """
+    if classroom_ids is None:
+        classroom_ids = Classroom.objects.values_list("id", flat=True)
+    time_slot_ids = [
+        time_slot_id
+        for time_slot_id, start in TimeSlot.objects.filter(program_id=program_id).values_list("id", "start_datetime")
+        if (weekdays is None or timezone.localtime(start).weekday() in weekdays)
+        and (start_times is None or timezone.localtime(start).time() in start_times)
+    ]
+    return {(classroom_id, time_slot_id) for classroom_id in classroom_ids for time_slot_id in time_slot_ids}
+
+
+def _delete_classroom_time_slots(classroom_time_slot_ids):
+    # QuerySet.delete() would load every row to send delete signals for history records; like bulk_create, this
+    # writes none
+    id_field = ClassroomTimeSlot._meta.pk
+    table = connection.ops.quote_name(ClassroomTimeSlot._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(classroom_time_slot_ids), BULK_BATCH_SIZE):
+            chunk = classroom_time_slot_ids[start:start + BULK_BATCH_SIZE]
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                [id_field.get_db_prep_value(classroom_time_slot_id, connection) for classroom_time_slot_id in chunk],
+            )
+
+
+def set_classroom_availability(program_id, available, existing=None):
+    """
+    Make the program's ClassroomTimeSlots exactly the ``available`` (classroom_id, time_slot_id) pairs: create the
+    missing ones and delete the others, even if a section was scheduled in them. Pairs of unknown classrooms or of
+    time slots of other programs are ignored. ``existing`` is the program's classroom_availability(), if the caller
+    has already read it. Returns (created count, deleted count, ids of the sections that lost a time slot).
+    """
+    if existing is None:
+        existing = classroom_availability(program_id)
+    classroom_ids = set(Classroom.objects.values_list("id", flat=True))
+    time_slot_ids = set(TimeSlot.objects.filter(program_id=program_id).values_list("id", flat=True))
+    to_create = [
+        (classroom_id, time_slot_id) for classroom_id, time_slot_id in set(available) - existing.keys()
+        if classroom_id in classroom_ids and time_slot_id in time_slot_ids
+    ]
+    to_delete = [existing[pair] for pair in existing.keys() - set(available)]
+    if not to_create and not to_delete:
+        return 0, 0, set()
+
+    unscheduled_section_ids = {section_id for _id, section_id in to_delete if section_id is not None}
+    with transaction.atomic():
+        schedule_version = next_schedule_version(program_id, reset=bool(to_delete))
+        ClassroomTimeSlot.objects.bulk_create(
+            [
+                ClassroomTimeSlot(
+                    classroom_id=classroom_id, time_slot_id=time_slot_id, schedule_version=schedule_version
+                )
+                for classroom_id, time_slot_id in to_create
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        _delete_classroom_time_slots([classroom_time_slot_id for classroom_time_slot_id, _section_id in to_delete])
+        rebuild_section_meetings(unscheduled_section_ids)
+    return len(to_create), len(to_delete), unscheduled_section_ids
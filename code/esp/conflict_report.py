@@ -0,0 +1,131 @@
+"""
+Problems in a program's schedule that nothing stops the scheduler from making: a teacher in two places at once, a
+section outside its teachers' availability, a classroom too small for the course, or meetings that are not as long as
+one session of the course. The report takes two queries and one pass over the program's assigned
+ClassroomTimeSlots, so the scheduler can refresh it after every edit.
+"""
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from common.constants import Weekday
+from esp.constants import ScheduleConflictType
+from esp.models.course_scheduling_models import ClassroomTimeSlot
+from esp.models.program_registration_models import TeacherAvailability
+
+
+def _time_label(start, end):
+    start, end = timezone.localtime(start), timezone.localtime(end)
+    return (
+        f"{start.strftime('%I:%M%p').lstrip('0')} - {end.strftime('%I:%M%p').lstrip('0')} "
+        f"({Weekday(start.weekday()).label})"
+    )
+
+
+def _conflict(conflict_type, message, course_section_ids, classroom_time_slot_ids):
+    return {
+        "type": conflict_type,
+        "message": message,
+        "course_sections": sorted(set(course_section_ids)),
+        "classroom_time_slots": classroom_time_slot_ids,
+    }
+
+
+def schedule_conflict_report(program):
+    """
+    Return every conflict in the program's schedule as a dict with its ``type`` (a ScheduleConflictType), a
+    ``message`` for admins, and the ids of the ``course_sections`` and ``classroom_time_slots`` involved.
+    Teachers who never entered their availability are not reported as unavailable.
+    """
+    teacher = "course_section__course__course_teachers__teacher_registration"
+    # One row per assigned ClassroomTimeSlot and teacher of its course, or with no teacher if the course has none
+    rows = ClassroomTimeSlot.objects.filter(
+        time_slot__program=program, course_section__isnull=False
+    ).annotate(
+        teacher_available=Exists(TeacherAvailability.objects.filter(
+            registration_id=OuterRef(f"{teacher}_id"), time_slot_id=OuterRef("time_slot_id")
+        ))
+    ).order_by("course_section_id", "time_slot__start_datetime", "classroom__name", "id").values_list(
+        "id", "course_section_id", "course_section__display_id", "course_section__course__name",
+        "course_section__course__max_section_size", "course_section__course__time_slots_per_session",
+        "classroom_id", "classroom__name", "classroom__max_occupants", "time_slot_id", "time_slot__start_datetime",
+        "time_slot__end_datetime", f"{teacher}_id", f"{teacher}__user__first_name", f"{teacher}__user__last_name",
+        f"{teacher}__user__username", "teacher_available",
+    )
+    registrations_with_availability = set(TeacherAvailability.objects.filter(
+        registration__program=program, time_slot__program=program
+    ).values_list("registration_id", flat=True).distinct())
+
+    # Same rule as esp.section_meetings uses to merge consecutive slots into one meeting
+    gap = timedelta(minutes=program.time_block_minutes - 1)
+    section_labels = {}
+    session_lengths = {}  # section id -> time_slots_per_session of its course
+    meetings = {}  # section id -> [[classroom time slot id, ...] for each meeting]
+    time_slots = {}  # time slot id -> (start, end)
+    teacher_names = {}
+    too_small = {}  # (section id, classroom name) -> classroom time slot ids
+    unavailable = {}  # (section id, teacher registration id) -> classroom time slot ids
+    teacher_slots = {}  # (teacher registration id, time slot id) -> [(classroom time slot id, section id)]
+    previous = None
+    for (
+        classroom_time_slot_id, section_id, section_display_id, course_name, max_section_size, time_slots_per_session,
+        classroom_id, classroom_name, max_occupants, time_slot_id, start, end, registration_id, first_name,
+        last_name, username, teacher_available,
+    ) in rows:
+        if registration_id is not None:
+            teacher_names[registration_id] = " ".join(name for name in (first_name, last_name) if name) or username
+            teacher_slots.setdefault((registration_id, time_slot_id), []).append((classroom_time_slot_id, section_id))
+            if not teacher_available and registration_id in registrations_with_availability:
+                unavailable.setdefault((section_id, registration_id), []).append(classroom_time_slot_id)
+        if previous and previous[0] == classroom_time_slot_id:
+            # Another teacher of the same ClassroomTimeSlot
+            continue
+        section_labels[section_id] = f"{course_name} (section {section_display_id})"
+        session_lengths[section_id] = time_slots_per_session
+        time_slots[time_slot_id] = (start, end)
+        if previous and previous[1] == section_id and previous[2] == classroom_id and start <= previous[3] + gap:
+            meetings[section_id][-1].append(classroom_time_slot_id)
+        else:
+            meetings.setdefault(section_id, []).append([classroom_time_slot_id])
+        previous = (classroom_time_slot_id, section_id, classroom_id, end)
+        if max_occupants < max_section_size:
+            too_small.setdefault((section_id, classroom_name), []).append(classroom_time_slot_id)
+
+    conflicts = []
+    for (registration_id, time_slot_id), placements in teacher_slots.items():
+        if len(placements) > 1:
+            conflicts.append(_conflict(
+                ScheduleConflictType.teacher_double_booked,
+                f"{teacher_names[registration_id]} is scheduled in {len(placements)} classrooms at "
+                f"{_time_label(*time_slots[time_slot_id])}, for "
+                f"{', '.join(sorted({section_labels[section_id] for _id, section_id in placements}))}",
+                [section_id for _id, section_id in placements],
+                [classroom_time_slot_id for classroom_time_slot_id, _section_id in placements],
+            ))
+    for (section_id, registration_id), classroom_time_slot_ids in unavailable.items():
+        conflicts.append(_conflict(
+            ScheduleConflictType.teacher_unavailable,
+            f"{section_labels[section_id]} meets in {len(classroom_time_slot_ids)} time slots for which "
+            f"{teacher_names[registration_id]} is not available",
+            [section_id],
+            classroom_time_slot_ids,
+        ))
+    for (section_id, classroom_name), classroom_time_slot_ids in too_small.items():
+        conflicts.append(_conflict(
+            ScheduleConflictType.classroom_too_small,
+            f"{classroom_name} does not seat the maximum section size of {section_labels[section_id]}",
+            [section_id],
+            classroom_time_slot_ids,
+        ))
+    for section_id, section_meetings in meetings.items():
+        lengths = [len(meeting) for meeting in section_meetings]
+        if any(length != session_lengths[section_id] for length in lengths):
+            conflicts.append(_conflict(
+                ScheduleConflictType.wrong_session_length,
+                f"{section_labels[section_id]} has sessions of {session_lengths[section_id]} time slots, but meets "
+                f"for {', '.join(str(length) for length in lengths)} consecutive time slots",
+                [section_id],
+                [classroom_time_slot_id for meeting in section_meetings for classroom_time_slot_id in meeting],
+            ))
+    return conflicts
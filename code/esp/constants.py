@@ -28,6 +28,40 @@ class TeacherRegistrationStepType(TextChoices):
     confirm_course_schedule = "teacher_confirm_course_schedule"
 
 
+class LotteryMode(TextChoices):
+    greedy = "greedy", "Greedy (first come, first served by time slot)"
+    weighted = "weighted", "Weighted (strongest preferences first, one time slot at a time)"
+
+
+class LotteryJobStatus(TextChoices):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+class LotteryPhase(TextChoices):
+    loading = "loading", "Loading preferences"
+    matching = "matching", "Matching students to sections"
+    writing = "writing", "Writing course registrations"
+
+
+class ScheduleConflictType(TextChoices):
+    teacher_double_booked = "teacher_double_booked", "Teacher in two places at once"
+    teacher_unavailable = "teacher_unavailable", "Teacher not available"
+    classroom_too_small = "classroom_too_small", "Classroom too small"
+    wrong_session_length = "wrong_session_length", "Meetings not as long as a session"
+
+
+class CheckinSyncResult(TextChoices):
+    checked_in = "checked_in", "Checked in"
+    already_checked_in = "already_checked_in", "Already checked in"
+    not_ready = "not_ready", "Registration requirements not satisfied"
+    not_found = "not_found", "No registration for this program"
+    invalid_code = "invalid_code", "Not a registration code"
+
+
 class CourseStatus(TextChoices):
     unreviewed = "unreviewed"
     accepted = "accepted"
@@ -0,0 +1,71 @@
+"""
+Which teachers of each course are available in each time slot of a program, as used by the scheduler to only offer
+time slots that a course's teachers can make.
+
+The map of time slots to courses to teachers is built for the whole program at once and cached under the program's
+ProgramSchedule.teacher_version, which saving or deleting a TeacherAvailability or CourseTeacher increments; bulk
+writers call invalidate_course_teacher_availability. Reading the map then takes one query for the version and one for
+the teachers' Users, which are always read fresh.
+"""
+from django.core.cache import cache
+from django.db.models import F
+
+from common.models import User
+from esp.models.course_scheduling_models import ProgramSchedule
+from esp.models.program_registration_models import TeacherAvailability
+from esp.serializers import UserSerializer
+
+#: seconds a built map is kept; stale maps are never read, as their key no longer matches
+CACHE_TIMEOUT = 60 * 60
+
+
+def _cache_key(program_id):
+    version = ProgramSchedule.objects.filter(program_id=program_id).values_list("teacher_version", flat=True).first()
+    return f"course_teacher_availability:{program_id}:{version or 0}"
+
+
+def invalidate_course_teacher_availability(program_ids):
+    """Make the next read of these programs' maps rebuild them, after writing their availability or course teachers."""
+    for program_id in program_ids:
+        ProgramSchedule.objects.get_or_create(program_id=program_id)
+    ProgramSchedule.objects.filter(program_id__in=program_ids).update(teacher_version=F("teacher_version") + 1)
+
+
+def _serialize_users(user_ids):
+    # A list, as UserSerializer queries a queryset's first row twice more to look for search strings
+    users = list(User.objects.filter(id__in=user_ids))
+    return {user["id"]: dict(user) for user in UserSerializer(users, many=True).data}
+
+
+def build_course_teacher_availability(program_id):
+    """
+    Return {"time_slots": {time_slot_id: {course_id: [user_id, ...]}}, "users": {user_id: user}}, where each
+    available teacher's user is serialized once, with UserSerializer, in ``users``. All IDs are strings. Time slots
+    without available teachers are left out.
+    """
+    time_slots = {}
+    for time_slot_id, course_id, user_id in (
+        TeacherAvailability.objects
+        .filter(time_slot__program_id=program_id, registration__course_teachers__course__program_id=program_id)
+        .values_list("time_slot_id", "registration__course_teachers__course_id", "registration__user_id")
+        .order_by("time_slot_id", "registration__course_teachers__course_id", "registration__user_id")
+        .distinct()
+    ):
+        time_slots.setdefault(str(time_slot_id), {}).setdefault(str(course_id), []).append(str(user_id))
+    user_ids = {user_id for courses in time_slots.values() for users in courses.values() for user_id in users}
+    return {"time_slots": time_slots, "users": _serialize_users(user_ids)}
+
+
+def course_teacher_availability(program_id):
+    """
+    The program's :func:`build_course_teacher_availability` map, whose time slots are only rebuilt when its
+    availability or course teachers have changed.
+    """
+    key = _cache_key(program_id)
+    time_slots = cache.get(key)
+    if time_slots is None:
+        availability = build_course_teacher_availability(program_id)
+        cache.set(key, availability["time_slots"], CACHE_TIMEOUT)
+        return availability
+    user_ids = {user_id for courses in time_slots.values() for users in courses.values() for user_id in users}
+    return {"time_slots": time_slots, "users": _serialize_users(user_ids)}
@@ -5,8 +5,10 @@ import pytz
 from factory import SubFactory, Faker
 from factory.django import DjangoModelFactory
 
-from esp.models.program_models import Program, Course, TimeSlot, Classroom, ClassroomTag
-from esp.models.program_registration_models import TeacherRegistration, TeacherAvailability, CourseTeacher
+from esp.models.program_models import (Program, Course, TimeSlot, Classroom, ClassroomTag, PreferenceEntryCategory,
+                                       PreferenceEntryRound, ProgramConfiguration)
+from esp.models.program_registration_models import (TeacherRegistration, TeacherAvailability, CourseTeacher,
+                                                    ClassPreference, StudentRegistration)
 
 
 class ClassroomFactory(DjangoModelFactory):
@@ -26,8 +28,7 @@ class ClassroomTagFactory(DjangoModelFactory):
 
 class CourseFactory(DjangoModelFactory):
     program = SubFactory("esp.factories.program_factories.ProgramFactory")
-    start_date = Faker("date_time", tzinfo=pytz.UTC)
-    end_date = Faker("date_time", tzinfo=pytz.UTC)
+    description = Faker("paragraph")
     max_section_size = Faker("random_int")
     name = Faker("bs")
 
@@ -76,3 +77,45 @@ class TeacherRegistrationFactory(DjangoModelFactory):
 
     class Meta:
         model = TeacherRegistration
+
+
+class ProgramConfigurationFactory(DjangoModelFactory):
+    name = Faker("bs")
+
+    class Meta:
+        model = ProgramConfiguration
+
+
+class PreferenceEntryRoundFactory(DjangoModelFactory):
+    program_configuration = SubFactory("esp.factories.program_factories.ProgramConfigurationFactory")
+    title = Faker("bs")
+    help_text = Faker("sentence")
+
+    class Meta:
+        model = PreferenceEntryRound
+
+
+class PreferenceEntryCategoryFactory(DjangoModelFactory):
+    preference_entry_round = SubFactory("esp.factories.program_factories.PreferenceEntryRoundFactory")
+    tag = Faker("word")
+    help_text = Faker("sentence")
+
+    class Meta:
+        model = PreferenceEntryCategory
+
+
+class StudentRegistrationFactory(DjangoModelFactory):
+    program = SubFactory("esp.factories.program_factories.ProgramFactory")
+    user = SubFactory("common.factories.UserFactory")
+
+    class Meta:
+        model = StudentRegistration
+
+
+class ClassPreferenceFactory(DjangoModelFactory):
+    registration = SubFactory("esp.factories.program_factories.StudentRegistrationFactory")
+    course_section = SubFactory("esp.factories.course_scheduling_factories.CourseSectionFactory")
+    category = SubFactory("esp.factories.program_factories.PreferenceEntryCategoryFactory")
+
+    class Meta:
+        model = ClassPreference
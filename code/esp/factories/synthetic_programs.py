@@ -0,0 +1,153 @@
+"""
+Bulk generator for realistic, arbitrarily large programs, used for benchmarking the lottery and scheduler.
+Instances are built (not saved) with the model factories and written with one bulk insert per model.
+"""
+import datetime
+import math
+import random
+
+import pytz
+from django.db import transaction
+
+from common.constants import UserType
+from common.factories import UserFactory
+from common.models import User
+from esp.constants import CourseStatus
+from esp.course_teacher_availability import invalidate_course_teacher_availability
+from esp.factories.course_scheduling_factories import ClassroomTimeSlotFactory, CourseSectionFactory
+from esp.factories.program_factories import (ClassPreferenceFactory, ClassroomFactory, CourseFactory,
+                                             CourseTeacherFactory, PreferenceEntryCategoryFactory,
+                                             PreferenceEntryRoundFactory, ProgramFactory, StudentRegistrationFactory,
+                                             TeacherAvailabilityFactory, TeacherRegistrationFactory, TimeSlotFactory)
+from esp.models.course_scheduling_models import ClassroomTimeSlot, CourseSection
+from esp.models.program_models import Classroom, Course, TimeSlot
+from esp.models.program_registration_models import (ClassPreference, CourseTeacher, StudentRegistration,
+                                                    TeacherAvailability, TeacherRegistration)
+from esp.schedule_changes import next_schedule_version
+from esp.section_meetings import rebuild_section_meetings
+
+BULK_BATCH_SIZE = 5000
+
+
+def create_synthetic_program(students, sections, time_slots, preferences_per_student, seed=None,
+                             starred_fraction=0.25, teacher_availability=0.7):
+    """
+    Create a program with the given number of students, course sections and time slots. Sections are placed in
+    classrooms for one or two consecutive slots wherever room allows, and every student submits up to
+    ``preferences_per_student`` preferences, some of them "starred", biased towards a few popular sections.
+    Courses have one or two teachers, each available for about ``teacher_availability`` of the time slots.
+    Returns the Program.
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2030, 11, 16, 9, 0, 0, tzinfo=pytz.UTC)
+    preference_round = PreferenceEntryRoundFactory()
+    program = ProgramFactory(
+        name=f"Synthetic program ({students} students, {sections} sections)",
+        program_configuration=preference_round.program_configuration, start_date=start,
+        end_date=start + datetime.timedelta(days=1), number_of_weeks=1, time_block_minutes=60,
+    )
+    interested = PreferenceEntryCategoryFactory(
+        preference_entry_round=preference_round, tag="interested", lottery_weight=1
+    )
+    starred = PreferenceEntryCategoryFactory(preference_entry_round=preference_round, tag="starred", lottery_weight=3)
+
+    slots = TimeSlot.objects.bulk_create([
+        TimeSlotFactory.build(
+            program=program,
+            start_datetime=start + datetime.timedelta(hours=index),
+            end_datetime=start + datetime.timedelta(hours=index, minutes=50),
+        )
+        for index in range(time_slots)
+    ], batch_size=BULK_BATCH_SIZE)
+
+    section_lengths = [1 if rng.random() < 0.7 else 2 for _ in range(sections)]
+    classroom_count = math.ceil(sum(section_lengths) * 1.2 / time_slots) + 1
+    classrooms = Classroom.objects.bulk_create([
+        ClassroomFactory.build(name=f"{program.id.hex[:6]}-{index}", max_occupants=rng.randint(15, 60))
+        for index in range(classroom_count)
+    ], batch_size=BULK_BATCH_SIZE)
+
+    courses = []
+    course_sections = []
+    base_display_id = (start.year % 1000) * 1000
+    while len(course_sections) < sections:
+        course = CourseFactory.build(
+            program=program, display_id=base_display_id + len(courses), status=CourseStatus.accepted,
+            max_section_size=rng.randint(10, 30), time_slots_per_session=section_lengths[len(course_sections)],
+        )
+        courses.append(course)
+        for display_id in range(1, min(rng.randint(1, 3), sections - len(course_sections)) + 1):
+            course_sections.append(CourseSectionFactory.build(course=course, display_id=display_id))
+    Course.objects.bulk_create(courses, batch_size=BULK_BATCH_SIZE)
+    CourseSection.objects.bulk_create(course_sections, batch_size=BULK_BATCH_SIZE)
+
+    # Place each section at a random start slot in any classroom that is free for the whole session
+    grid = {
+        (classroom.id, slot.id): ClassroomTimeSlotFactory.build(
+            classroom=classroom, time_slot=slot, course_section=None
+        )
+        for classroom in classrooms for slot in slots
+    }
+    for section in course_sections:
+        length = section.course.time_slots_per_session
+        first_slot = rng.randrange(time_slots - length + 1)
+        for classroom in rng.sample(classrooms, len(classrooms)):
+            run = [grid[(classroom.id, slot.id)] for slot in slots[first_slot:first_slot + length]]
+            if all(classroom_slot.course_section is None for classroom_slot in run):
+                for classroom_slot in run:
+                    classroom_slot.course_section = section
+                break
+    with transaction.atomic():
+        # Stamped like set_classroom_availability's rows, so that scheduler clients see them as changes
+        schedule_version = next_schedule_version(program.id)
+        for classroom_slot in grid.values():
+            classroom_slot.schedule_version = schedule_version
+        ClassroomTimeSlot.objects.bulk_create(grid.values(), batch_size=BULK_BATCH_SIZE)
+        rebuild_section_meetings(section.id for section in course_sections)
+
+    teacher_users = User.objects.bulk_create([
+        UserFactory.build(username=f"synthetic-{program.id.hex[:8]}-teacher-{index}", user_type=UserType.teacher)
+        for index in range(math.ceil(len(courses) * 0.8))
+    ], batch_size=BULK_BATCH_SIZE)
+    teacher_registrations = TeacherRegistration.objects.bulk_create([
+        TeacherRegistrationFactory.build(program=program, user=user) for user in teacher_users
+    ], batch_size=BULK_BATCH_SIZE)
+    course_teachers = []
+    for course in courses:
+        teacher_count = min(1 if rng.random() < 0.8 else 2, len(teacher_registrations))
+        for index, registration in enumerate(rng.sample(teacher_registrations, teacher_count)):
+            course_teachers.append(CourseTeacherFactory.build(
+                course=course, teacher_registration=registration, is_course_creator=index == 0
+            ))
+    CourseTeacher.objects.bulk_create(course_teachers, batch_size=BULK_BATCH_SIZE)
+    TeacherAvailability.objects.bulk_create([
+        TeacherAvailabilityFactory.build(registration=registration, time_slot=slot)
+        for registration in teacher_registrations for slot in slots if rng.random() < teacher_availability
+    ], batch_size=BULK_BATCH_SIZE)
+    invalidate_course_teacher_availability([program.id])
+
+    users = User.objects.bulk_create([
+        UserFactory.build(username=f"synthetic-{program.id.hex[:8]}-{index}", user_type=UserType.student)
+        for index in range(students)
+    ], batch_size=BULK_BATCH_SIZE)
+    # Ready to check in, as synthetic programs have no forms or items to buy
+    registrations = StudentRegistration.objects.bulk_create([
+        StudentRegistrationFactory.build(
+            program=program, user=user, forms_complete=True, required_purchases_complete=True
+        )
+        for user in users
+    ], batch_size=BULK_BATCH_SIZE)
+
+    # Heavy-tailed popularity, as a few classes always get most of the interest
+    popularity = [rng.paretovariate(1.2) for _ in course_sections]
+    preferences = []
+    for registration in registrations:
+        chosen = set(rng.choices(range(len(course_sections)), weights=popularity, k=preferences_per_student))
+        for section_index in chosen:
+            preferences.append(ClassPreferenceFactory.build(
+                registration=registration,
+                course_section=course_sections[section_index],
+                category=starred if rng.random() < starred_fraction else interested,
+            ))
+    ClassPreference.objects.bulk_create(preferences, batch_size=BULK_BATCH_SIZE)
+    return program
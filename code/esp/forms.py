@@ -1,29 +1,33 @@
+import datetime
+
 from crispy_forms import layout
 from crispy_forms.helper import FormHelper
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.core.exceptions import FieldError, ValidationError
-from django.db import transaction
 from django.forms import ModelForm, inlineformset_factory
 from django.urls import reverse_lazy
+from django.utils import timezone
 
 from common.constants import (REGISTRATION_USER_TYPE_CHOICES, GradeLevel,
-                              USStateEquiv)
+                              USStateEquiv, Weekday)
 from common.forms import (CrispyFormMixin, HiddenOrderingInputFormset,
                           MultiFormMixin)
 from common.models import User
-from esp.constants import (CourseDifficulty,
+from esp.classroom_availability import availability_pattern
+from esp.constants import (CourseDifficulty, LotteryMode,
                            StudentRegistrationStepType,
                            TeacherRegistrationStepType)
 from esp.models.course_scheduling_models import (ClassroomTimeSlot,
                                                  CourseSection)
-from esp.models.program_models import Course, CourseCategory, CourseFlag, Program, ProgramStage
+from esp.models.program_models import Classroom, Course, CourseCategory, CourseFlag, Program, ProgramStage
 from esp.models.program_registration_models import (Comment,
                                                     FinancialAidRequest,
                                                     StudentProfile,
                                                     StudentProgramRegistrationStep,
                                                     TeacherProfile,
                                                     TeacherRegistration)
+from esp.schedule_changes import assign_classroom_time_slots
 from esp.serializers import AssignClassroomTimeSlotSerializer
 
 
@@ -298,6 +302,9 @@ class StudentSendEmailForm(MultiFormMixin, forms.Form):
         required=False, choices=[('', '---------'), *StudentRegistrationStepType.choices],
         label='Completed this registration step'
     )
+    program_stage = forms.ModelChoiceField(
+        required=False, queryset=ProgramStage.objects.select_related("program"), label='Currently at this program stage'
+    )
 
     subject = forms.CharField(label='Subject Line')
     body = forms.CharField(
@@ -307,10 +314,21 @@ class StudentSendEmailForm(MultiFormMixin, forms.Form):
         })
     )
 
+    def clean(self):
+        cleaned_data = super().clean()
+        program, program_stage = cleaned_data.get("program"), cleaned_data.get("program_stage")
+        if program and program_stage and program_stage.program_id != program.id:
+            self.add_error("program_stage", "This stage is not a stage of the selected program.")
+        return cleaned_data
+
 
 class AssignClassroomTimeSlotsForm(forms.Form):
     data = forms.JSONField()
 
+    def __init__(self, *args, program=None, **kwargs):
+        self.program = program
+        super().__init__(*args, **kwargs)
+
     def clean_data(self):
         """
         Validate data json structure.
@@ -320,33 +338,71 @@ class AssignClassroomTimeSlotsForm(forms.Form):
         if not serializer.is_valid():
             # Todo: Add sentry notification; this error is not intended for the user
             raise ValidationError("Sorry, something went wrong")
-        self._validate_ids(ClassroomTimeSlot, 'classroom_time_slot_id', serializer.data)
-        self._validate_ids(CourseSection, 'course_section_id', serializer.data, ignore_none=True)
+        self._validate_ids(
+            ClassroomTimeSlot.objects.filter(time_slot__program=self.program), 'classroom_time_slot_id', serializer.data
+        )
+        self._validate_ids(
+            CourseSection.objects.filter(course__program=self.program), 'course_section_id', serializer.data,
+            ignore_none=True,
+        )
         return serializer.data
 
     def save(self):
         """
-        Save ClassroomTimeSlot assignments. This is intentionally not optimized for readability since
-        we don't expect any single call to affect that many ClassroomTimeSlot objects.
+        Save ClassroomTimeSlot assignments in bulk. Raises ScheduleConflictError, saving nothing, if any of them has
+        changed since the ``expected_version`` given with it. Returns the new schedule version.
         """
-        with transaction.atomic():
-            for datum in self.cleaned_data["data"]:
-                (
-                    ClassroomTimeSlot.objects
-                    .filter(id=datum["classroom_time_slot_id"])
-                    .update(course_section_id=datum["course_section_id"])
-                )
+        return assign_classroom_time_slots(self.program.id, [
+            (datum["classroom_time_slot_id"], datum["course_section_id"], datum.get("expected_version"))
+            for datum in self.cleaned_data["data"]
+        ])
 
-    def _validate_ids(self, Model, id_field_name, data, ignore_none=False):
+    def _validate_ids(self, queryset, id_field_name, data, ignore_none=False):
         model_ids = [datum.get(id_field_name, None) for datum in data]
         if ignore_none:
             model_ids = [_id for _id in model_ids if _id is not None]
-        model_count = Model.objects.filter(id__in=[_id for _id in model_ids if _id is not None]).count()
+        model_count = queryset.filter(id__in=[_id for _id in model_ids if _id is not None]).count()
         if len(set(model_ids)) != model_count:
             # Todo: Add sentry notification; this error is not intended for the user
             raise ValidationError("Sorry, something went wrong")
 
 
+class ProgramLotteryForm(forms.Form):
+    """Settings posted from the lottery page; the seed reproduces a simulated run, or is drawn if left empty"""
+    mode = forms.ChoiceField(choices=LotteryMode.choices, label="Assignment mode")
+    seed = forms.IntegerField(required=False, min_value=0, max_value=2 ** 63 - 1)
+    runs = forms.IntegerField(required=False, min_value=1, max_value=100, label="Simulation runs")
+
+
+class ClassroomAvailabilityPatternForm(CrispyFormMixin, forms.Form):
+    """Make every matching classroom available or unavailable at every matching time slot; empty fields match all"""
+    submit_label = "Apply"
+    submit_name = "pattern"
+
+    action = forms.ChoiceField(choices=[("add", "Make available"), ("remove", "Make unavailable")])
+    classrooms = forms.ModelMultipleChoiceField(queryset=Classroom.objects.order_by("name"), required=False)
+    weekdays = forms.TypedMultipleChoiceField(choices=Weekday.choices, coerce=int, required=False)
+    start_times = forms.TypedMultipleChoiceField(coerce=datetime.time.fromisoformat, required=False)
+
+    def __init__(self, *args, program=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        start_times = sorted({
+            timezone.localtime(start).time() for start in program.time_slots.values_list("start_datetime", flat=True)
+        })
+        self.fields["start_times"].choices = [
+            (start_time.isoformat(), start_time.strftime("%I:%M%p").lstrip("0")) for start_time in start_times
+        ]
+
+    def pattern(self, program_id):
+        """The (classroom_id, time_slot_id) pairs matched by the form"""
+        return availability_pattern(
+            program_id,
+            classroom_ids=[classroom.id for classroom in self.cleaned_data["classrooms"]] or None,
+            weekdays=self.cleaned_data["weekdays"] or None,
+            start_times=self.cleaned_data["start_times"] or None,
+        )
+
+
 class FinancialAidRequestForm(CrispyFormMixin, forms.ModelForm):
     submit_label = "Submit request"
 
@@ -1,40 +1,851 @@
-from django.db.models import Count
+import datetime
+import heapq
+import logging
+import multiprocessing
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
+from django.db import connection, connections, transaction
+from django.db.models import Count, Exists, Max, OuterRef
+from django.utils import timezone
+
+from esp.constants import LotteryJobStatus, LotteryMode, LotteryPhase
 from esp.models.course_scheduling_models import CourseSection
-from esp.models.program_registration_models import ClassRegistration
+from esp.models.program_models import Program
+from esp.models.program_registration_models import (ClassPreference, ClassRegistration, LotteryJob, LotteryRun,
+                                                    StudentRegistration, WaitlistEntry)
+from esp.time_slot_bitsets import TimeSlotBitsets, lowest_slot
+
+logger = logging.getLogger(__name__)
+
+#: how long a LotteryJob may run before its worker is presumed dead; lotteries take seconds to minutes
+LOTTERY_JOB_TIMEOUT = datetime.timedelta(minutes=30)
 
 
 class LotteryDisallowedError(Exception):
     pass
 
 
-def run_program_lottery(program):
-    # TODO: Actual lottery/preference-matching algorithm
-    # This placeholder makes no distinction between class preference categories,
-    # fills slots greedily, and also makes many database calls.
-    if ClassRegistration.objects.filter(course_section__course__program_id=program.id).exists():
-        raise LotteryDisallowedError("Course assignments already exist")
-    registrations_count = 0
-    for time_slot in program.time_slots.all():
-        for section in CourseSection.objects.filter(time_slots__time_slot=time_slot).distinct():
-            interested_students = (
-                section.preferences.values("registration_id").annotate(num=Count("id")).order_by("num")
+class LotterySnapshot:
+    """
+    Integer-indexed copy of everything the lottery needs to know about a program.
+
+    Students (registrations), sections, courses and time slots are each numbered from 0 in load order so that
+    matching can run on plain lists and sets of ints. The ``*_ids`` lists map indexes back to database ids. Sets of
+    time slots are bitsets over the slot indexes (see esp.time_slot_bitsets).
+    """
+
+    def __init__(self, student_ids, section_ids, section_course, section_capacity, section_footprints, slot_ids,
+                 preferences, assignments, top_preferences=frozenset(), student_availability=None):
+        self.student_ids = student_ids  #: StudentRegistration id for each student index
+        self.section_ids = section_ids  #: CourseSection id for each section index
+        self.section_course = section_course  #: course index for each section index
+        self.section_capacity = section_capacity  #: seats available to the loaded students in each section
+        self.section_footprints = section_footprints  #: bitset of the time slots each section meets in
+        self.slot_ids = slot_ids  #: TimeSlot id for each slot index, in chronological order
+        all_slots = (1 << len(slot_ids)) - 1
+        #: bitset of the time slots each student can attend; everyone is available everywhere unless given
+        self.student_availability = student_availability or [all_slots] * len(student_ids)
+        self.preferences = preferences  #: (student index, section index, weight) triples, one per pair
+        self.assignments = assignments  #: (student index, section index) pairs for existing ClassRegistrations
+        self.top_preferences = top_preferences  #: (student, section) pairs in the highest-weighted category
+
+    @classmethod
+    def load(cls, program, registration_ids=None):
+        """
+        Load a program's lottery inputs with one query each for slots, sections, meetings, preferences, existing
+        registrations and student availability. If ``registration_ids`` is given, only those students are loaded and
+        section capacities are reduced by the seats everyone else already holds (one more, grouped, query).
+        """
+        bitsets = TimeSlotBitsets.for_program(program.id)
+
+        section_ids = []
+        section_course = []
+        section_capacity = []
+        section_index = {}
+        course_index = {}
+        for section_id, course_id, max_section_size in (
+            CourseSection.objects.filter(course__program_id=program.id)
+            .order_by("course_id", "display_id")
+            .values_list("id", "course_id", "course__max_section_size")
+        ):
+            section_index[section_id] = len(section_ids)
+            section_ids.append(section_id)
+            section_course.append(course_index.setdefault(course_id, len(course_index)))
+            section_capacity.append(max_section_size)
+
+        footprints = bitsets.section_footprints()
+        section_footprints = [footprints.get(section_id, 0) for section_id in section_ids]
+
+        program_preferences = ClassPreference.objects.filter(
+            registration__program_id=program.id, course_section__course__program_id=program.id, is_deleted=False
+        )
+        program_registrations = ClassRegistration.objects.filter(course_section__course__program_id=program.id)
+        if registration_ids is not None:
+            program_preferences = program_preferences.filter(registration_id__in=registration_ids)
+            for section_id, seats_taken in (
+                program_registrations.exclude(program_registration_id__in=registration_ids)
+                .values("course_section_id").annotate(count=Count("id")).values_list("course_section_id", "count")
+            ):
+                section_capacity[section_index[section_id]] -= seats_taken
+            program_registrations = program_registrations.filter(program_registration_id__in=registration_ids)
+
+        student_ids = []
+        student_index = {}
+
+        def index_student(registration_id):
+            if registration_id not in student_index:
+                student_index[registration_id] = len(student_ids)
+                student_ids.append(registration_id)
+            return student_index[registration_id]
+
+        # A student may have preferences for the same section in several rounds; the strongest one counts.
+        # Rows are ordered so that indexes, and therefore seeded lottery results, are reproducible.
+        preference_weights = {}
+        category_weights = {}
+        for registration_id, section_id, category_weight, value in program_preferences.order_by(
+            "registration_id", "course_section_id"
+        ).values_list(
+            "registration_id", "course_section_id", "category__lottery_weight", "value"
+        ):
+            key = (index_student(registration_id), section_index[section_id])
+            weight = category_weight * value if value is not None else category_weight
+            preference_weights[key] = max(weight, preference_weights.get(key, weight))
+            category_weights[key] = max(category_weight, category_weights.get(key, category_weight))
+        preferences = [(student, section, weight) for (student, section), weight in preference_weights.items()]
+        top_category_weight = max(category_weights.values(), default=None)
+        top_preferences = frozenset(key for key, weight in category_weights.items() if weight == top_category_weight)
+        assignments = [
+            (index_student(registration_id), section_index[section_id])
+            for registration_id, section_id in program_registrations.order_by(
+                "program_registration_id", "course_section_id"
+            ).values_list(
+                "program_registration_id", "course_section_id"
             )
-            interested_students = interested_students.exclude(
-                registration_id__in=ClassRegistration.objects.filter(
-                    course_section__course_id=section.course_id
-                ).values("program_registration_id")
-            ).exclude(
-                registration_id__in=ClassRegistration.objects.filter(
-                    course_section__time_slots__time_slot=time_slot
-                ).values("program_registration_id")
+        ]
+        available = bitsets.student_availability(registration_ids)
+        return cls(
+            student_ids, section_ids, section_course, section_capacity, section_footprints, bitsets.slot_ids,
+            preferences, assignments, top_preferences,
+            [available.get(registration_id, bitsets.all_slots) for registration_id in student_ids],
+        )
+
+    def split_components(self):
+        """
+        Split students and sections into independent sub-problems: the connected components of the graph linking
+        each student to the sections they prefer or are registered in. Students in different components never compete
+        for a seat, so each component can be matched on its own. Components without preferences are left out.
+        Returns (student indexes, section indexes, snapshot) triples, largest first, where each snapshot holds just
+        that component renumbered from 0 in the order of the index lists.
+        """
+        student_count = len(self.student_ids)
+        parent = list(range(student_count + len(self.section_ids)))
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for student, section, *_weight in list(self.preferences) + list(self.assignments):
+            student_root, section_root = find(student), find(student_count + section)
+            if student_root != section_root:
+                parent[section_root] = student_root
+
+        component_of = {}
+        for student, _section, _weight in self.preferences:
+            component_of.setdefault(find(student), len(component_of))
+        students = [[] for _ in component_of]
+        sections = [[] for _ in component_of]
+        local_index = [None] * len(parent)
+        for node in range(len(parent)):
+            component = component_of.get(find(node))
+            if component is None:
+                continue
+            members = students[component] if node < student_count else sections[component]
+            local_index[node] = len(members)
+            members.append(node if node < student_count else node - student_count)
+
+        preferences = [[] for _ in component_of]
+        for student, section, weight in self.preferences:
+            preferences[component_of[find(student)]].append(
+                (local_index[student], local_index[student_count + section], weight)
             )
-            registrations = [
-                ClassRegistration(
-                    course_section=section, program_registration_id=student["registration_id"], created_by_lottery=True
-                )
-                for student in interested_students[:section.course.max_section_size]
-            ]
-            ClassRegistration.objects.bulk_create(registrations)
-            registrations_count += len(registrations)
-    return registrations_count
+        assignments = [[] for _ in component_of]
+        for student, section in self.assignments:
+            component = component_of.get(find(student))
+            if component is not None:
+                assignments[component].append((local_index[student], local_index[student_count + section]))
+        top_preferences = [set() for _ in component_of]
+        for student, section in self.top_preferences:
+            top_preferences[component_of[find(student)]].add(
+                (local_index[student], local_index[student_count + section])
+            )
+
+        components = [
+            (students[component], sections[component], LotterySnapshot(
+                [self.student_ids[student] for student in students[component]],
+                [self.section_ids[section] for section in sections[component]],
+                [self.section_course[section] for section in sections[component]],
+                [self.section_capacity[section] for section in sections[component]],
+                [self.section_footprints[section] for section in sections[component]],
+                self.slot_ids,
+                preferences[component],
+                assignments[component],
+                frozenset(top_preferences[component]),
+                [self.student_availability[student] for student in students[component]],
+            ))
+            for component in range(len(component_of))
+        ]
+        return sorted(components, key=lambda component: len(component[2].preferences), reverse=True)
+
+    def to_class_registrations(self, matches, lottery_run=None):
+        """Build unsaved ClassRegistrations for (student index, section index) pairs, tagged with ``lottery_run``."""
+        return [
+            ClassRegistration(
+                course_section_id=self.section_ids[section],
+                program_registration_id=self.student_ids[student],
+                created_by_lottery=True,
+                lottery_run=lottery_run,
+            )
+            for student, section in matches
+        ]
+
+    def to_waitlist_entries(self, waitlist, lottery_run=None, last_positions=None):
+        """
+        Build unsaved WaitlistEntries for (student index, section index) pairs in waitlist order, numbered after
+        ``last_positions`` (the highest existing position per section id).
+        """
+        next_position = dict(last_positions or {})
+        entries = []
+        for student, section in waitlist:
+            section_id = self.section_ids[section]
+            next_position[section_id] = next_position.get(section_id, 0) + 1
+            entries.append(WaitlistEntry(
+                course_section_id=section_id,
+                program_registration_id=self.student_ids[student],
+                position=next_position[section_id],
+                lottery_run=lottery_run,
+            ))
+        return entries
+
+
+def _initial_state(snapshot):
+    """
+    Remaining seats per section and, per student, the bitset of slots they cannot take (already busy or not
+    available) and the set of courses they are enrolled in, after existing registrations.
+    """
+    all_slots = (1 << len(snapshot.slot_ids)) - 1
+    remaining = list(snapshot.section_capacity)
+    blocked_slots = [all_slots & ~available for available in snapshot.student_availability]
+    enrolled_courses = [set() for _ in snapshot.student_ids]
+    for student, section in snapshot.assignments:
+        remaining[section] -= 1
+        blocked_slots[student] |= snapshot.section_footprints[section]
+        enrolled_courses[student].add(snapshot.section_course[section])
+    return remaining, blocked_slots, enrolled_courses
+
+
+def match_greedy(snapshot, seed=None):
+    """
+    Fill sections in chronological order of their first time slot. Students interested in a section are taken in
+    random order and placed while the section has room, skipping students already enrolled in the same course,
+    busy during any of the section's time slots or unavailable for any of them.
+    Returns a list of (student index, section index) pairs.
+    """
+    rng = random.Random(seed)
+    remaining, blocked_slots, enrolled_courses = _initial_state(snapshot)
+
+    interested = [[] for _ in snapshot.section_ids]
+    for student, section, _weight in snapshot.preferences:
+        interested[section].append(student)
+
+    section_order = sorted(
+        (section for section, footprint in enumerate(snapshot.section_footprints) if footprint and interested[section]),
+        key=lambda section: lowest_slot(snapshot.section_footprints[section]),
+    )
+    matches = []
+    for section in section_order:
+        footprint = snapshot.section_footprints[section]
+        course = snapshot.section_course[section]
+        candidates = interested[section]
+        rng.shuffle(candidates)
+        for student in candidates:
+            if remaining[section] <= 0:
+                break
+            if course in enrolled_courses[student] or blocked_slots[student] & footprint:
+                continue
+            matches.append((student, section))
+            remaining[section] -= 1
+            blocked_slots[student] |= footprint
+            enrolled_courses[student].add(course)
+    return matches
+
+
+class _MinCostFlow:
+    """
+    Min-cost flow on integer costs using the primal-dual method: each phase runs one Dijkstra pass over reduced costs
+    and then augments along as many zero-reduced-cost paths as it can find. Edge ``e`` and its residual ``e ^ 1``
+    are stored in parallel lists.
+    """
+
+    def __init__(self, node_count):
+        self.adjacency = [[] for _ in range(node_count)]
+        self.to = []
+        self.capacity = []
+        self.cost = []
+
+    def add_edge(self, source, target, capacity, cost):
+        self.adjacency[source].append(len(self.to))
+        self.to.append(target)
+        self.capacity.append(capacity)
+        self.cost.append(cost)
+        self.adjacency[target].append(len(self.to))
+        self.to.append(source)
+        self.capacity.append(0)
+        self.cost.append(-cost)
+        return len(self.to) - 2
+
+    def augment_negative_paths(self, source, sink, potential):
+        """
+        Push flow from source to sink while the cheapest augmenting path has negative cost, which yields a
+        minimum-cost flow of any size. ``potential`` must make all residual reduced costs non-negative.
+        """
+        node_count = len(self.adjacency)
+        adjacency, to, capacity, cost = self.adjacency, self.to, self.capacity, self.cost
+        while True:
+            distance = [None] * node_count
+            distance[source] = 0
+            heap = [(0, source)]
+            while heap:
+                dist, node = heapq.heappop(heap)
+                if dist > distance[node]:
+                    continue
+                for edge in adjacency[node]:
+                    if capacity[edge] <= 0:
+                        continue
+                    target = to[edge]
+                    candidate = dist + cost[edge] + potential[node] - potential[target]
+                    if distance[target] is None or candidate < distance[target]:
+                        distance[target] = candidate
+                        heapq.heappush(heap, (candidate, target))
+            if distance[sink] is None:
+                return
+            for node in range(node_count):
+                if distance[node] is not None:
+                    potential[node] += min(distance[node], distance[sink])
+                else:
+                    potential[node] += distance[sink]
+            if potential[sink] - potential[source] >= 0:
+                return
+            self._augment_admissible_paths(source, sink, potential)
+
+    def _augment_admissible_paths(self, source, sink, potential):
+        """Augment along zero-reduced-cost paths (iterative DFS with per-node edge pointers) until none remain."""
+        adjacency, to, capacity, cost = self.adjacency, self.to, self.capacity, self.cost
+        next_edge = [0] * len(adjacency)
+        dead = [False] * len(adjacency)
+        on_path = [False] * len(adjacency)
+        while True:
+            path = []
+            node = source
+            on_path[source] = True
+            while node != sink:
+                edges = adjacency[node]
+                while next_edge[node] < len(edges):
+                    edge = edges[next_edge[node]]
+                    target = to[edge]
+                    if (
+                        capacity[edge] > 0 and not dead[target] and not on_path[target]
+                        and cost[edge] + potential[node] - potential[target] == 0
+                    ):
+                        break
+                    next_edge[node] += 1
+                else:
+                    dead[node] = True
+                    on_path[node] = False
+                    if not path:
+                        return
+                    node = to[path.pop() ^ 1]
+                    next_edge[node] += 1
+                    continue
+                path.append(edge)
+                node = target
+                on_path[node] = True
+            flow = min(capacity[edge] for edge in path)
+            for edge in path:
+                capacity[edge] -= flow
+                capacity[edge ^ 1] += flow
+                on_path[to[edge]] = False
+            on_path[source] = False
+
+
+def match_weighted(snapshot, seed=None):
+    """
+    Place students by preference weight, one time slot at a time. Sections are grouped by their first time slot;
+    since every student can take at most one section from such a group, each group is solved exactly as a min-cost
+    flow (source -> student -> section -> sink, costed by negative preference weight), maximizing the group's total
+    weight. Groups are solved in chronological order and their placements kept, so later groups respect the time
+    slots and courses already assigned.
+
+    This is a greedy heuristic across groups, not a global optimum: a placement in an early group is never undone,
+    even when a section spanning several slots, or another section of the same course, blocks a heavier preference in
+    a later group. A single network cannot express those constraints, as a student's place in a multi-slot section
+    uses up several slots at once. Ties are broken randomly by ``seed``. Returns a list of (student index,
+    section index) pairs.
+    """
+    rng = random.Random(seed)
+    remaining, blocked_slots, enrolled_courses = _initial_state(snapshot)
+
+    interested = [[] for _ in snapshot.section_ids]
+    for student, section, weight in snapshot.preferences:
+        if weight > 0:
+            interested[section].append((student, weight))
+
+    groups = {}
+    for section, footprint in enumerate(snapshot.section_footprints):
+        if footprint and interested[section]:
+            groups.setdefault(lowest_slot(footprint), []).append(section)
+
+    matches = []
+    for first_slot in sorted(groups):
+        candidate_edges = []
+        for section in groups[first_slot]:
+            if remaining[section] <= 0:
+                continue
+            footprint = snapshot.section_footprints[section]
+            course = snapshot.section_course[section]
+            for student, weight in interested[section]:
+                if course not in enrolled_courses[student] and not blocked_slots[student] & footprint:
+                    candidate_edges.append((student, section, weight))
+        if not candidate_edges:
+            continue
+        rng.shuffle(candidate_edges)
+
+        # Node layout: 0 = source, 1 = sink, then one node per student and per section in this group
+        node_of = {}
+        for student, section, _weight in candidate_edges:
+            node_of.setdefault(("student", student), len(node_of) + 2)
+            node_of.setdefault(("section", section), len(node_of) + 2)
+        flow = _MinCostFlow(len(node_of) + 2)
+        potential = [0] * (len(node_of) + 2)
+        for (kind, index), node in node_of.items():
+            if kind == "student":
+                flow.add_edge(0, node, 1, 0)
+        assignment_edges = []
+        for student, section, weight in candidate_edges:
+            section_node = node_of[("section", section)]
+            edge = flow.add_edge(node_of[("student", student)], section_node, 1, -weight)
+            assignment_edges.append((edge, student, section))
+            potential[section_node] = min(potential[section_node], -weight)
+        for (kind, index), node in node_of.items():
+            if kind == "section":
+                flow.add_edge(node, 1, remaining[index], 0)
+                potential[1] = min(potential[1], potential[node])
+
+        flow.augment_negative_paths(0, 1, potential)
+        for edge, student, section in assignment_edges:
+            if flow.capacity[edge] == 0:
+                matches.append((student, section))
+                remaining[section] -= 1
+                blocked_slots[student] |= snapshot.section_footprints[section]
+                enrolled_courses[student].add(snapshot.section_course[section])
+    return matches
+
+
+def overflow_waitlists(snapshot, matches, seed=None):
+    """
+    Waitlist the overflow demand for every scheduled section the lottery left full: interested students who were not
+    placed in it or in another section of the same course, strongest preference first, ties broken randomly by
+    ``seed``. Returns (student index, section index) pairs, in waitlist order within each section.
+    """
+    rng = random.Random(seed)
+    remaining, _blocked_slots, enrolled_courses = _initial_state(snapshot)
+    for student, section in matches:
+        remaining[section] -= 1
+        enrolled_courses[student].add(snapshot.section_course[section])
+    waiting = [[] for _ in snapshot.section_ids]
+    for student, section, weight in snapshot.preferences:
+        if (
+            snapshot.section_footprints[section] and remaining[section] <= 0
+            and snapshot.section_course[section] not in enrolled_courses[student]
+        ):
+            waiting[section].append((-weight, rng.random(), student))
+    return [
+        (student, section)
+        for section, candidates in enumerate(waiting)
+        for _weight, _tie_break, student in sorted(candidates)
+    ]
+
+
+LOTTERY_ENGINES = {
+    LotteryMode.greedy: match_greedy,
+    LotteryMode.weighted: match_weighted,
+}
+
+
+def _match_component_batch(mode, batch):
+    """Solve a batch of (component snapshot, seed) pairs in a worker process."""
+    return [LOTTERY_ENGINES[mode](component, seed=seed) for component, seed in batch]
+
+
+def match_decomposed(snapshot, mode=LotteryMode.greedy, seed=None, max_workers=None):
+    """
+    Match each independent component of the snapshot (see LotterySnapshot.split_components) with the engine for
+    ``mode``, in a process pool when there is more than one component, and merge the results. Components get seeds
+    derived from ``seed``, so the result does not depend on how many workers are used; with ``max_workers=1``
+    everything runs in this process. Small components are batched so that the largest one bounds the wall-clock time.
+    Returns a list of (student index, section index) pairs.
+    """
+    rng = random.Random(seed)
+    components = snapshot.split_components()
+    tasks = [(component, rng.randrange(2 ** 31)) for _students, _sections, component in components]
+    max_workers = max_workers or multiprocessing.cpu_count()
+    # Forking is only safe outside transactions, since the database connections are closed first
+    if max_workers == 1 or len(tasks) < 2 or any(connection.in_atomic_block for connection in connections.all()):
+        results = _match_component_batch(mode, tasks)
+    else:
+        # Largest components first, each into the batch with the least work so far
+        batches = [[] for _ in range(min(max_workers, len(tasks)))]
+        sizes = [0] * len(batches)
+        for task_index, task in enumerate(tasks):
+            batch = sizes.index(min(sizes))
+            batches[batch].append((task_index, task))
+            sizes[batch] += len(task[0].preferences)
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=len(batches), mp_context=multiprocessing.get_context("fork")) as executor:
+            batch_results = executor.map(
+                _match_component_batch, [mode] * len(batches), [[task for _index, task in batch] for batch in batches]
+            )
+            results = [None] * len(tasks)
+            for batch, matches_per_task in zip(batches, batch_results):
+                for (task_index, _task), matches in zip(batch, matches_per_task):
+                    results[task_index] = matches
+    return [
+        (students[student], sections[section])
+        for (students, sections, _component), matches in zip(components, results)
+        for student, section in matches
+    ]
+
+
+def summarize_matches(snapshot, matches):
+    """Outcome metrics for one lottery result, used to compare simulated runs."""
+    scheduled_sections = [section for section, footprint in enumerate(snapshot.section_footprints) if footprint]
+    enrollment = [0] * len(snapshot.section_ids)
+    for _student, section in snapshot.assignments:
+        enrollment[section] += 1
+    for _student, section in matches:
+        enrollment[section] += 1
+    capacity = sum(snapshot.section_capacity[section] for section in scheduled_sections)
+    students_with_preferences = {student for student, _section, _weight in snapshot.preferences}
+    students_with_top_choice = {match[0] for match in matches if match in snapshot.top_preferences}
+    weights = {(student, section): weight for student, section, weight in snapshot.preferences}
+    return {
+        "placed": len(matches),
+        "fill_rate": sum(enrollment[section] for section in scheduled_sections) / capacity if capacity else 0,
+        "top_choice_rate": (
+            len(students_with_top_choice) / len(students_with_preferences) if students_with_preferences else 0
+        ),
+        "empty_sections": sum(1 for section in scheduled_sections if not enrollment[section]),
+        "total_weight": sum(weights[match] for match in matches),
+    }
+
+
+_simulation_snapshot = None
+
+
+def _init_simulation_worker(snapshot):
+    global _simulation_snapshot
+    _simulation_snapshot = snapshot
+
+
+def _simulate(mode, seed):
+    matches = match_decomposed(_simulation_snapshot, mode, seed=seed, max_workers=1)
+    return dict(summarize_matches(_simulation_snapshot, matches), seed=seed, mode=mode)
+
+
+def simulate_program_lottery(program, mode=LotteryMode.greedy, runs=20, max_workers=None, report_phase=None):
+    """
+    Dry-run the lottery with ``runs`` random seeds in a process pool without writing anything. The program is read
+    once; each worker receives the snapshot a single time when it starts. Returns one metrics dict per run, best first
+    (most students with a top-category class, then highest fill rate, then fewest empty sections). Committing a run
+    means calling run_program_lottery with its mode and seed, which reproduces it if preferences have not changed.
+    Forking closes every database connection of this process, so this is meant for the `run_lottery_worker` command
+    (see enqueue_lottery_job); like match_decomposed, it runs in this process inside a transaction.
+    """
+    report_phase = report_phase or (lambda phase: None)
+    report_phase(LotteryPhase.loading)
+    snapshot = LotterySnapshot.load(program)
+    seeds = random.SystemRandom().sample(range(2 ** 31), runs)
+    report_phase(LotteryPhase.matching)
+    if max_workers == 1 or any(connection.in_atomic_block for connection in connections.all()):
+        _init_simulation_worker(snapshot)
+        results = [_simulate(mode, seed) for seed in seeds]
+    else:
+        # Forked workers must not share the parent's database connections, and they never need one.
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=context, initializer=_init_simulation_worker, initargs=(snapshot,)
+        ) as executor:
+            results = list(executor.map(_simulate, [mode] * runs, seeds))
+    return sorted(
+        results,
+        key=lambda result: (result["top_choice_rate"], result["fill_rate"], -result["empty_sections"]),
+        reverse=True,
+    )
+
+
+def _record_lottery_run(program, mode, seed, registration_ids=None, report_phase=None):
+    """
+    Load, match and write one lottery, timing each phase on a new LotteryRun. Loading and matching happen outside any
+    transaction (unless the caller holds one), so that ``report_phase(phase)`` calls can commit progress that other
+    connections see; only the writes share a transaction.
+    """
+    report_phase = report_phase or (lambda phase: None)
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 31)
+    report_phase(LotteryPhase.loading)
+    start = time.perf_counter()
+    snapshot = LotterySnapshot.load(program, registration_ids=registration_ids)
+    loaded = time.perf_counter()
+    report_phase(LotteryPhase.matching)
+    matches = match_decomposed(snapshot, mode, seed=seed)
+    waitlist = overflow_waitlists(snapshot, matches, seed=seed)
+    if registration_ids is not None:
+        # Late registrants may already be waiting for some sections; they keep their place
+        already_waiting = set(WaitlistEntry.objects.filter(program_registration_id__in=registration_ids).values_list(
+            "program_registration_id", "course_section_id"
+        ))
+        waitlist = [
+            (student, section) for student, section in waitlist
+            if (snapshot.student_ids[student], snapshot.section_ids[section]) not in already_waiting
+        ]
+    matched = time.perf_counter()
+    report_phase(LotteryPhase.writing)
+    with transaction.atomic():
+        # Checked again, as somebody may have run the lottery while this one was loading and matching
+        if registration_ids is None and _program_has_registrations(program):
+            raise LotteryDisallowedError("Course assignments already exist")
+        lottery_run = LotteryRun.objects.create(
+            program=program, mode=mode, seed=seed, incremental=registration_ids is not None,
+            student_count=len(snapshot.student_ids), section_count=len(snapshot.section_ids),
+            preference_count=len(snapshot.preferences), placed_count=len(matches), waitlisted_count=len(waitlist),
+            section_placements={
+                str(snapshot.section_ids[section]): count
+                for section, count in Counter(section for _student, section in matches).items()
+            },
+            load_seconds=loaded - start, match_seconds=matched - loaded,
+        )
+        ClassRegistration.objects.bulk_create(snapshot.to_class_registrations(matches, lottery_run))
+        last_positions = dict(
+            WaitlistEntry.objects.filter(course_section__course__program_id=program.id)
+            .values("course_section_id").annotate(last_position=Max("position"))
+            .values_list("course_section_id", "last_position")
+        )
+        WaitlistEntry.objects.bulk_create(snapshot.to_waitlist_entries(waitlist, lottery_run, last_positions))
+        # update() rather than save(), so that the run keeps a single history entry for its creation
+        lottery_run.write_seconds = time.perf_counter() - matched
+        LotteryRun.objects.filter(id=lottery_run.id).update(write_seconds=lottery_run.write_seconds)
+    return lottery_run
+
+
+def _program_has_registrations(program):
+    return ClassRegistration.objects.filter(course_section__course__program_id=program.id).exists()
+
+
+def run_program_lottery(program, mode=LotteryMode.greedy, seed=None, report_phase=None):
+    """
+    Assign students to course sections based on their preferences. All lottery inputs are read up front with a
+    handful of queries, matching is done in memory by the engine for ``mode`` and the results are written with a
+    single bulk insert. A random seed is drawn if none is given, so that every run can be reproduced.
+    Returns the LotteryRun, whose ClassRegistrations are tagged with it.
+    """
+    if _program_has_registrations(program):
+        raise LotteryDisallowedError("Course assignments already exist")
+    return _record_lottery_run(program, mode, seed, report_phase=report_phase)
+
+
+def run_incremental_lottery(program, mode=LotteryMode.greedy, seed=None, report_phase=None):
+    """
+    Place students who have submitted preferences but hold no lottery-created registrations (e.g. late registrants)
+    into the seats that are still open, leaving every existing registration untouched. Only the new students'
+    preferences and registrations are loaded, so the cost grows with the number of new students.
+    Returns the LotteryRun, or None if there was nobody to place.
+    """
+    registration_ids = list(
+        StudentRegistration.objects.filter(
+            Exists(ClassPreference.objects.filter(registration_id=OuterRef("id"), is_deleted=False)),
+            ~Exists(ClassRegistration.objects.filter(program_registration_id=OuterRef("id"), created_by_lottery=True)),
+            program_id=program.id,
+        ).values_list("id", flat=True)
+    )
+    if not registration_ids:
+        return None
+    return _record_lottery_run(program, mode, seed, registration_ids=registration_ids, report_phase=report_phase)
+
+
+def enqueue_lottery_job(program, mode=LotteryMode.greedy, seed=None, incremental=False, simulation_runs=None,
+                        requested_by=None):
+    """
+    Queue a lottery for the `run_lottery_worker` command, or a dry run of ``simulation_runs`` seeds if given. Only one
+    job per program may be pending at a time.
+    """
+    with transaction.atomic():
+        # Locking the program makes concurrent requests for it queue up here rather than both passing the check below
+        Program.objects.select_for_update().get(id=program.id)
+        fail_stale_lottery_jobs(program)
+        if LotteryJob.objects.filter(
+            program_id=program.id, status__in=[LotteryJobStatus.queued, LotteryJobStatus.running]
+        ).exists():
+            raise LotteryDisallowedError("A lottery is already queued or running for this program")
+        if not incremental and _program_has_registrations(program):
+            raise LotteryDisallowedError("Course assignments already exist")
+        return LotteryJob.objects.create(
+            program=program, mode=mode, seed=seed, incremental=incremental, simulation_runs=simulation_runs,
+            requested_by=requested_by,
+        )
+
+
+def fail_stale_lottery_jobs(program=None):
+    """
+    Mark LotteryJobs that have been running for longer than LOTTERY_JOB_TIMEOUT as failed, as their worker must have
+    been killed (e.g. by a deploy or for running out of memory) before it could record the outcome. Only the
+    program's jobs are checked if ``program`` is given. Returns the number of jobs failed.
+    """
+    jobs = LotteryJob.objects.filter(
+        status=LotteryJobStatus.running, started_on__lt=timezone.now() - LOTTERY_JOB_TIMEOUT
+    )
+    if program is not None:
+        jobs = jobs.filter(program_id=program.id)
+    stale_jobs = list(jobs)
+    for job in stale_jobs:
+        job.status = LotteryJobStatus.failed
+        job.error = "The lottery worker stopped before finishing this job"
+        job.finished_on = timezone.now()
+        job.save()
+    return len(stale_jobs)
+
+
+def cancel_lottery_job(job):
+    """
+    Cancel a queued or running LotteryJob, so that another lottery can be queued for the program. A queued job will
+    never start. A running job's worker is not interrupted: if it is still alive, whatever lottery it writes is
+    recorded as a LotteryRun that can be rolled back, while the job stays cancelled.
+    """
+    with transaction.atomic():
+        job = LotteryJob.objects.select_for_update().get(id=job.id)
+        if job.status not in [LotteryJobStatus.queued, LotteryJobStatus.running]:
+            raise LotteryDisallowedError("This lottery job has already finished")
+        job.status = LotteryJobStatus.cancelled
+        job.finished_on = timezone.now()
+        job.save()
+    return job
+
+
+def run_next_lottery_job():
+    """
+    Claim the oldest queued LotteryJob and run it, storing each phase on the job as it starts, and the results on the
+    job if it is a dry run. Phase changes are written with update() so that polling them stays cheap and does not fill
+    the job's history. Jobs left running by a dead worker are failed first (see fail_stale_lottery_jobs).
+    Returns the finished job, or None if nothing was queued.
+    """
+    fail_stale_lottery_jobs()
+    with transaction.atomic():
+        job = LotteryJob.objects.select_for_update(skip_locked=True).filter(
+            status=LotteryJobStatus.queued
+        ).order_by("created_on").first()
+        if job is None:
+            return None
+        job.status = LotteryJobStatus.running
+        job.started_on = timezone.now()
+        job.save()
+
+    def report_phase(phase):
+        job.phase = phase
+        LotteryJob.objects.filter(id=job.id).update(phase=phase)
+
+    run_lottery = run_incremental_lottery if job.incremental else run_program_lottery
+    lottery_run = None
+    simulations = []
+    error = ""
+    try:
+        if job.simulation_runs:
+            simulations = simulate_program_lottery(
+                job.program, mode=job.mode, runs=job.simulation_runs, report_phase=report_phase
+            )
+        else:
+            lottery_run = run_lottery(job.program, mode=job.mode, seed=job.seed, report_phase=report_phase)
+        status = LotteryJobStatus.succeeded
+    except Exception as e:
+        status = LotteryJobStatus.failed
+        error = str(e) or e.__class__.__name__
+        if not isinstance(e, LotteryDisallowedError):
+            logger.exception("Lottery job %s failed", job.id)
+
+    with transaction.atomic():
+        job = LotteryJob.objects.select_for_update().get(id=job.id)
+        # A job cancelled, or failed as stale, while it ran keeps that status, but still links what it wrote
+        if job.status == LotteryJobStatus.running:
+            job.status = status
+            job.error = error
+            job.finished_on = timezone.now()
+        job.lottery_run = lottery_run
+        job.simulations = simulations
+        job.save()
+    return job
+
+
+def _delete_lottery_run_rows(model, lottery_run_id):
+    # QuerySet.delete() would load every row to send delete signals for history records; like bulk_create, this
+    # writes none
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.get_field("lottery_run").column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {column} = %s",
+            [LotteryRun._meta.pk.get_db_prep_value(lottery_run_id, connection)],
+        )
+        return cursor.rowcount
+
+
+def roll_back_lottery_run(lottery_run):
+    """
+    Delete every ClassRegistration and WaitlistEntry created by ``lottery_run`` with one DELETE statement each and mark
+    the run as rolled back. Per-row delete signals (and so per-row history) are skipped on purpose; the run's own
+    history entry records the rollback. Returns the number of ClassRegistrations deleted.
+    """
+    with transaction.atomic():
+        lottery_run = LotteryRun.objects.select_for_update().get(id=lottery_run.id)
+        if lottery_run.rolled_back_on:
+            raise LotteryDisallowedError("This lottery run has already been rolled back")
+        deleted_count = _delete_lottery_run_rows(ClassRegistration, lottery_run.id)
+        _delete_lottery_run_rows(WaitlistEntry, lottery_run.id)
+        lottery_run.rolled_back_on = timezone.now()
+        lottery_run.save()
+    return deleted_count
+
+
+def diff_lottery_runs(first, second):
+    """
+    Compare the per-section placements of two lottery runs, as recorded when each run was made, so rolled back runs
+    compare too. Returns a row per section either run placed students in, ordered by course name and section.
+    """
+    sections = CourseSection.objects.filter(
+        id__in=set(first.section_placements) | set(second.section_placements)
+    ).values_list("id", "course__name", "display_id")
+    rows = []
+    for section_id, course_name, display_id in sections:
+        first_count = first.section_placements.get(str(section_id), 0)
+        second_count = second.section_placements.get(str(section_id), 0)
+        rows.append({
+            "course_section_id": section_id,
+            "course_section__course__name": course_name,
+            "course_section__display_id": display_id,
+            "first_count": first_count,
+            "second_count": second_count,
+            "change": second_count - first_count,
+        })
+    return sorted(rows, key=lambda row: (row["course_section__course__name"], row["course_section__display_id"]))
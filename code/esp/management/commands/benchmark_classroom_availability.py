@@ -0,0 +1,119 @@
+import json
+import platform
+import statistics
+import time
+from uuid import UUID
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from esp.classroom_availability import availability_pattern, set_classroom_availability
+from esp.factories.program_factories import ClassroomFactory
+from esp.factories.synthetic_programs import create_synthetic_program
+from esp.management.commands.benchmark_schedule_assignment import QueryCounter
+from esp.models.course_scheduling_models import ClassroomTimeSlot
+from esp.models.program_models import Classroom, TimeSlot
+from esp.schedule_changes import resync_schedules
+
+SATURDAY = 5
+
+
+class Command(BaseCommand):
+    help = (
+        "Time saving classroom availability with set_classroom_availability against the former loop over classrooms, "
+        "for a few edits of a synthetic program's classroom x time slot matrix, and write the results as JSON. "
+        "All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--classrooms", type=int, default=30)
+        parser.add_argument("--time-slots", type=int, default=500)
+        parser.add_argument("--repeat", type=int, default=3, help="Timed saves per method and edit")
+        parser.add_argument(
+            "--output", default="classroom_availability_benchmark.json", help="Path of the JSON results file"
+        )
+
+    def handle(self, *args, **options):
+        results = []
+        with transaction.atomic():
+            program = create_synthetic_program(
+                students=0, sections=0, time_slots=options["time_slots"], preferences_per_student=0, seed=0
+            )
+            set_classroom_availability(program.id, set())
+            classrooms = Classroom.objects.bulk_create([
+                ClassroomFactory.build(name=f"{program.id.hex[:6]}-benchmark-{index}")
+                for index in range(options["classrooms"])
+            ])
+            classroom_ids = [classroom.id for classroom in classrooms]
+            everything = availability_pattern(program.id, classroom_ids=classroom_ids)
+            saturdays = availability_pattern(program.id, classroom_ids=classroom_ids, weekdays=[SATURDAY])
+            # (edit, availability before, availability submitted)
+            edits = [
+                ("fill", set(), everything),
+                ("resubmit", everything, everything),
+                ("remove_saturdays", everything, everything - saturdays),
+                ("clear", everything, set()),
+            ]
+            for edit, before, after in edits:
+                for method in ("per_classroom", "set_based"):
+                    seconds = []
+                    queries = QueryCounter()
+                    for _ in range(options["repeat"]):
+                        savepoint = transaction.savepoint()
+                        set_classroom_availability(program.id, before)
+                        queries.count = 0
+                        with connection.execute_wrapper(queries):
+                            start = time.perf_counter()
+                            getattr(self, f"save_{method}")(program, after)
+                            seconds.append(time.perf_counter() - start)
+                        transaction.savepoint_rollback(savepoint)
+                    result = {
+                        "edit": edit,
+                        "method": method,
+                        "cells": len(everything),
+                        "seconds": statistics.median(seconds),
+                        "queries": queries.count,
+                    }
+                    results.append(result)
+                    self.stdout.write(f"{edit}, {method}: {result['seconds']:.3f}s, {result['queries']} queries")
+            transaction.set_rollback(True)
+
+        with open(options["output"], "w") as output:
+            json.dump({
+                "created_on": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "database": connection.vendor,
+                "results": results,
+            }, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+    def save_per_classroom(self, program, available):
+        """How AdminManageClassroomAvailabilityView used to save the submitted matrix, without its messages."""
+        submitted = {}
+        for classroom_id, time_slot_id in available:
+            submitted.setdefault(str(classroom_id), []).append(str(time_slot_id))
+        time_slots_to_create = []
+        changed = set()
+        all_time_slot_ids = TimeSlot.objects.filter(program=program).values_list("id", flat=True)
+        with transaction.atomic():
+            for classroom in Classroom.objects.all().prefetch_related("time_slots"):
+                existing_time_slots = {
+                    time_slot.time_slot_id for time_slot in classroom.time_slots.filter(time_slot__program=program)
+                }
+                new_time_slots = set(UUID(id_) for id_ in submitted.get(str(classroom.id), []))
+                for time_slot_id in new_time_slots - existing_time_slots:
+                    if time_slot_id in all_time_slot_ids:
+                        time_slots_to_create.append(ClassroomTimeSlot(classroom=classroom, time_slot_id=time_slot_id))
+                to_delete = classroom.time_slots.filter(time_slot_id__in=existing_time_slots - new_time_slots)
+                any(slot.course_section for slot in to_delete)
+                changed.update((program.id, slot.course_section_id) for slot in to_delete)
+                to_delete.delete()
+            ClassroomTimeSlot.objects.bulk_create(time_slots_to_create)
+            if time_slots_to_create:
+                changed.add((program.id, None))
+            # As the view did, so that schedule versions and section meetings stay current
+            resync_schedules(changed)
+
+    def save_set_based(self, program, available):
+        set_classroom_availability(program.id, available)
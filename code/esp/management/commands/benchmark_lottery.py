@@ -0,0 +1,112 @@
+import json
+import platform
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from esp.factories.synthetic_programs import create_synthetic_program
+from esp.lottery import (LOTTERY_ENGINES, LotterySnapshot, match_decomposed, roll_back_lottery_run,
+                         run_program_lottery, summarize_matches)
+from esp.models.program_registration_models import ClassRegistration
+
+DEFAULT_SCALES = ["500x200x10x10", "1000x400x20x15", "3000x800x20x15"]
+
+
+def parse_scale(scale):
+    try:
+        students, sections, time_slots, preferences_per_student = (int(part) for part in scale.split("x"))
+    except ValueError:
+        raise CommandError(f"Invalid scale '{scale}'; expected STUDENTSxSECTIONSxSLOTSxPREFERENCES")
+    return {
+        "students": students,
+        "sections": sections,
+        "time_slots": time_slots,
+        "preferences_per_student": preferences_per_student,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic programs at several scales, time every lottery engine on each and write the results as "
+        "JSON. The programs are committed to a throwaway test database, which is destroyed afterwards, so that "
+        "matching can use its process pool; this needs permission to create databases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale", action="append", dest="scales",
+            help=f"STUDENTSxSECTIONSxSLOTSxPREFERENCES; may be repeated (default: {' '.join(DEFAULT_SCALES)})",
+        )
+        parser.add_argument("--repeat", type=int, default=1, help="Timed runs per engine and scale")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="lottery_benchmark.json", help="Path of the JSON results file")
+
+    def handle(self, *args, **options):
+        scales = [parse_scale(scale) for scale in options["scales"] or DEFAULT_SCALES]
+        results = []
+        # Forking workers is only possible outside transactions (see match_decomposed), so nothing can be rolled back
+        old_database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            for scale in scales:
+                self.stdout.write(f"Generating {scale}")
+                generation_start = time.perf_counter()
+                program = create_synthetic_program(seed=options["seed"], **scale)
+                generation_seconds = time.perf_counter() - generation_start
+                for mode in LOTTERY_ENGINES:
+                    for run in range(options["repeat"]):
+                        result = dict(
+                            scale, mode=mode, run=run, generation_seconds=generation_seconds,
+                            **self.time_lottery(program, mode, options["seed"] + run),
+                        )
+                        results.append(result)
+                        self.stdout.write(
+                            f"  {mode}: {result['total_seconds']:.3f}s end to end "
+                            f"(load {result['load_seconds']:.3f}s, match {result['match_seconds']:.3f}s "
+                            f"or {result['serial_match_seconds']:.3f}s in one process, "
+                            f"write {result['write_seconds']:.3f}s), {result['placed']} placed"
+                        )
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+
+        with open(options["output"], "w") as output:
+            json.dump({
+                "created_on": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "database": connection.vendor,
+                "results": results,
+            }, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+    def time_lottery(self, program, mode, seed):
+        """
+        Time each lottery phase separately, matching both in one process and in the process pool, then
+        run_program_lottery end to end. Both writes are undone, so every run starts from the same program.
+        """
+        timings = {}
+        start = time.perf_counter()
+        snapshot = LotterySnapshot.load(program)
+        timings["load_seconds"] = time.perf_counter() - start
+        start = time.perf_counter()
+        serial_matches = match_decomposed(snapshot, mode, seed=seed, max_workers=1)
+        timings["serial_match_seconds"] = time.perf_counter() - start
+        start = time.perf_counter()
+        matches = match_decomposed(snapshot, mode, seed=seed)
+        timings["match_seconds"] = time.perf_counter() - start
+        timings["components"] = len(snapshot.split_components())
+        timings["serial_and_parallel_agree"] = sorted(serial_matches) == sorted(matches)
+        with transaction.atomic():
+            start = time.perf_counter()
+            ClassRegistration.objects.bulk_create(snapshot.to_class_registrations(matches))
+            timings["write_seconds"] = time.perf_counter() - start
+            transaction.set_rollback(True)
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            lottery_run = run_program_lottery(program, mode=mode, seed=seed)
+            timings["total_seconds"] = time.perf_counter() - start
+        timings["queries"] = len(queries.captured_queries)
+        roll_back_lottery_run(lottery_run)
+        return dict(timings, **summarize_matches(snapshot, matches))
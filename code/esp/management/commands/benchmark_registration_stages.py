@@ -0,0 +1,147 @@
+import datetime
+import json
+import platform
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from esp.constants import StudentRegistrationStepType
+from esp.factories.synthetic_programs import create_synthetic_program
+from esp.management.commands.benchmark_schedule_assignment import QueryCounter
+from esp.models.program_models import ProgramStage, StudentProgramRegistrationStep
+from esp.models.program_registration_models import CompletedStudentRegistrationStep, StudentRegistration
+from esp.registration_stages import program_registration_stages
+
+
+class Command(BaseCommand):
+    help = (
+        "Time resolving the program stage of every registration of a synthetic program with the former "
+        "get_program_stage, the single-query get_program_stage and program_registration_stages, check that they "
+        "agree, and write the results as JSON. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--registrations", type=int, default=1000)
+        parser.add_argument("--stages", type=int, default=4)
+        parser.add_argument("--repeat", type=int, default=3, help="Timed runs per method")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", default="registration_stages_benchmark.json", help="Path of the JSON results file"
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        results = []
+        with transaction.atomic():
+            program = self.create_program(rng, options["registrations"], options["stages"])
+            registrations = list(StudentRegistration.objects.filter(program=program).select_related("program"))
+            resolved = {}
+            for method in ("per_registration_before", "per_registration", "per_program"):
+                seconds = []
+                queries = QueryCounter()
+                for _ in range(options["repeat"]):
+                    queries.count = 0
+                    with connection.execute_wrapper(queries):
+                        start = time.perf_counter()
+                        resolved[method] = getattr(self, f"resolve_{method}")(program, registrations)
+                        seconds.append(time.perf_counter() - start)
+                result = {
+                    "method": method,
+                    "registrations": len(registrations),
+                    "seconds": statistics.median(seconds),
+                    "queries": queries.count,
+                    "mismatches": sum(
+                        stage != resolved["per_registration_before"][registration_id]
+                        for registration_id, stage in resolved[method].items()
+                    ),
+                }
+                results.append(result)
+                self.stdout.write(
+                    f"{method}: {result['seconds']:.3f}s, {result['queries']} queries, "
+                    f"{result['mismatches']} mismatches"
+                )
+            transaction.set_rollback(True)
+
+        with open(options["output"], "w") as output:
+            json.dump({
+                "created_on": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "database": connection.vendor,
+                "results": results,
+            }, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+    def create_program(self, rng, registration_count, stage_count):
+        """
+        A synthetic program with the given number of registrations and of stages, each with a few steps. Stages
+        alternate between active and past, and some registrations have their deadlines overridden; each registration
+        has completed a random part of the steps, more often those of earlier stages.
+        """
+        program = create_synthetic_program(
+            students=registration_count, sections=1, time_slots=2, preferences_per_student=0, seed=rng.random()
+        )
+        now = timezone.now()
+        steps = []
+        for index in range(stage_count):
+            active = index % 3 != 2
+            stage = ProgramStage.objects.create(
+                program=program, name=f"Stage {index + 1}",
+                start_date=now - datetime.timedelta(days=30),
+                end_date=now + datetime.timedelta(days=30 if active else -1),
+            )
+            for step_key in rng.sample(StudentRegistrationStepType.values, 4):
+                steps.append((index, StudentProgramRegistrationStep(
+                    program_stage=stage, step_key=step_key, required_for_stage_completion=rng.random() < 0.8
+                )))
+        StudentProgramRegistrationStep.objects.bulk_create([step for _index, step in steps])
+
+        registrations = list(StudentRegistration.objects.filter(program=program))
+        overridden = rng.sample(registrations, len(registrations) // 10)
+        for registration in overridden:
+            registration.allow_late_registration_until = now + datetime.timedelta(days=1)
+        StudentRegistration.objects.bulk_update(overridden, ["allow_late_registration_until"])
+        CompletedStudentRegistrationStep.objects.bulk_create([
+            CompletedStudentRegistrationStep(registration=registration, step=step, completed_on=now)
+            for registration in registrations
+            for index, step in steps
+            if rng.random() < 0.9 - 0.6 * index / stage_count
+        ], batch_size=5000)
+        return program
+
+    def resolve_per_registration_before(self, program, registrations):
+        """How StudentRegistration.get_program_stage used to resolve the stage, with up to four queries."""
+        resolved = {}
+        for registration in registrations:
+            active_stages = (
+                registration.program.stages.filter(start_date__lte=Now(), end_date__gte=Now())
+                if not registration.ignore_registration_deadlines()
+                else registration.program.stages.all()
+            )
+            if not active_stages.exists():
+                resolved[registration.id] = None
+                continue
+            completed_steps = registration.completed_steps.values_list("step_id", flat=True)
+            incomplete_stages = active_stages.filter(
+                Exists(
+                    StudentProgramRegistrationStep.objects.filter(
+                        program_stage_id=OuterRef("id"), required_for_stage_completion=True
+                    ).exclude(id__in=completed_steps)
+                )
+            )
+            if incomplete_stages.exists():
+                resolved[registration.id] = incomplete_stages.first()
+            else:
+                resolved[registration.id] = active_stages.last()
+        return resolved
+
+    def resolve_per_registration(self, program, registrations):
+        return {registration.id: registration.get_program_stage() for registration in registrations}
+
+    def resolve_per_program(self, program, registrations):
+        return program_registration_stages(program)
@@ -0,0 +1,108 @@
+import json
+import platform
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from esp.factories.synthetic_programs import create_synthetic_program
+from esp.models.course_scheduling_models import ClassroomTimeSlot, CourseSection
+from esp.schedule_changes import assign_classroom_time_slots, next_schedule_version
+
+DEFAULT_BATCH_SIZES = [100, 1000, 5000]
+
+
+class QueryCounter:
+    """Database execute wrapper counting statements, without the query log's 9000-query limit."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time assigning batches of classroom time slots with the set-based assign_classroom_time_slots against one "
+        "UPDATE per slot, on a synthetic program, and write the results as JSON. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", action="append", type=int, dest="batch_sizes",
+            help=f"Classroom time slots per batch; may be repeated (default: {DEFAULT_BATCH_SIZES})",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Timed batches per method and size")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", default="schedule_assignment_benchmark.json", help="Path of the JSON results file"
+        )
+
+    def handle(self, *args, **options):
+        batch_sizes = options["batch_sizes"] or DEFAULT_BATCH_SIZES
+        rng = random.Random(options["seed"])
+        results = []
+        with transaction.atomic():
+            # The generator adds classrooms for about 1.5 slots per section, so this gives the largest batch enough
+            program = create_synthetic_program(
+                students=0, sections=max(batch_sizes) * 7 // 10 + 10, time_slots=50, preferences_per_student=0,
+                seed=options["seed"],
+            )
+            classroom_time_slots = list(
+                ClassroomTimeSlot.objects.filter(time_slot__program=program).values_list("id", "schedule_version")
+            )
+            section_ids = list(CourseSection.objects.filter(course__program=program).values_list("id", flat=True))
+            for batch_size in batch_sizes:
+                batch_size = min(batch_size, len(classroom_time_slots))
+                for method in ("per_row", "set_based"):
+                    seconds = []
+                    queries = QueryCounter()
+                    for _ in range(options["repeat"]):
+                        batch = [
+                            (classroom_time_slot_id, rng.choice(section_ids + [None]), version)
+                            for classroom_time_slot_id, version in rng.sample(classroom_time_slots, batch_size)
+                        ]
+                        savepoint = transaction.savepoint()
+                        queries.count = 0
+                        with connection.execute_wrapper(queries):
+                            start = time.perf_counter()
+                            getattr(self, f"assign_{method}")(program.id, batch)
+                            seconds.append(time.perf_counter() - start)
+                        transaction.savepoint_rollback(savepoint)
+                    result = {
+                        "batch_size": batch_size,
+                        "method": method,
+                        "seconds": statistics.median(seconds),
+                        "queries": queries.count,
+                    }
+                    results.append(result)
+                    self.stdout.write(
+                        f"{batch_size} slots, {method}: {result['seconds']:.3f}s, {result['queries']} queries"
+                    )
+            transaction.set_rollback(True)
+
+        with open(options["output"], "w") as output:
+            json.dump({
+                "created_on": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "database": connection.vendor,
+                "results": results,
+            }, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+    def assign_per_row(self, program_id, batch):
+        """How assignments used to be saved, checking each row's version in its own UPDATE."""
+        with transaction.atomic():
+            schedule_version = next_schedule_version(program_id)
+            for classroom_time_slot_id, section_id, expected_version in batch:
+                ClassroomTimeSlot.objects.filter(
+                    id=classroom_time_slot_id, schedule_version=expected_version
+                ).update(course_section_id=section_id, schedule_version=schedule_version)
+
+    def assign_set_based(self, program_id, batch):
+        assign_classroom_time_slots(program_id, batch)
@@ -0,0 +1,108 @@
+import gzip
+import json
+import platform
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from esp.factories.synthetic_programs import create_synthetic_program
+from esp.models.program_models import Program
+from esp.views.scheduler_views import (ClassroomApiView, ClassroomTimeSlotApiView, CourseApiView,
+                                       SchedulerBootstrapApiView, TimeSlotApiView)
+
+DEFAULT_SCALES = ["200x20", "800x40"]
+
+
+def parse_scale(scale):
+    try:
+        sections, time_slots = (int(part) for part in scale.split("x"))
+    except ValueError:
+        raise CommandError(f"Invalid scale '{scale}'; expected SECTIONSxSLOTS")
+    return {"sections": sections, "time_slots": time_slots}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the scheduler's single schedule endpoint with the four separate classroom, classroom time slot, "
+        "course and time slot endpoints, by server time, queries and payload size, and write the results as JSON. "
+        "Synthetic programs are generated unless --program is given, and rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale", action="append", dest="scales",
+            help=f"SECTIONSxSLOTS of a synthetic program; may be repeated (default: {' '.join(DEFAULT_SCALES)})",
+        )
+        parser.add_argument("--program", help="Benchmark this existing program instead of synthetic ones")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed requests per endpoint")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", default="scheduler_payload_benchmark.json", help="Path of the JSON results file"
+        )
+
+    def handle(self, *args, **options):
+        results = []
+        with transaction.atomic():
+            if options["program"]:
+                programs = [Program.objects.get(id=options["program"])]
+            else:
+                programs = []
+                for scale in [parse_scale(scale) for scale in options["scales"] or DEFAULT_SCALES]:
+                    self.stdout.write(f"Generating {scale}")
+                    programs.append(create_synthetic_program(
+                        students=0, preferences_per_student=0, seed=options["seed"], **scale
+                    ))
+            for program in programs:
+                self.stdout.write(str(program))
+                separate = [
+                    self.time_endpoint(view, program, options["repeat"])
+                    for view in (ClassroomApiView, ClassroomTimeSlotApiView, CourseApiView, TimeSlotApiView)
+                ]
+                combined = self.time_endpoint(SchedulerBootstrapApiView, program, options["repeat"])
+                result = {
+                    "program": str(program.id),
+                    "separate": {
+                        key: sum(endpoint[key] for endpoint in separate)
+                        for key in ("seconds", "queries", "bytes", "gzip_bytes")
+                    },
+                    "combined": combined,
+                }
+                results.append(result)
+                for label, timing in result.items():
+                    if label != "program":
+                        self.stdout.write(
+                            f"  {label}: {timing['seconds']:.3f}s, {timing['queries']} queries, "
+                            f"{timing['bytes']} bytes ({timing['gzip_bytes']} gzipped)"
+                        )
+            transaction.set_rollback(True)
+
+        with open(options["output"], "w") as output:
+            json.dump({
+                "created_on": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "database": connection.vendor,
+                "results": results,
+            }, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+    def time_endpoint(self, view_class, program, repeat):
+        """Median server time of ``repeat`` requests, with the query count and raw and gzipped size of the last."""
+        view = view_class.as_view()
+        request = RequestFactory().get("/")
+        seconds = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = view(request, pk=program.id)
+                seconds.append(time.perf_counter() - start)
+        return {
+            "seconds": statistics.median(seconds),
+            "queries": len(queries.captured_queries),
+            "bytes": len(response.content),
+            "gzip_bytes": len(gzip.compress(response.content)),
+        }
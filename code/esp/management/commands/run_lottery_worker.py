@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from esp.constants import LotteryJobStatus
+from esp.lottery import run_next_lottery_job
+
+
+class Command(BaseCommand):
+    help = "Run lottery jobs queued from the lottery page, polling the job table until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll-interval", type=float, default=2, help="Seconds to wait when no job is queued")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            job = run_next_lottery_job()
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["poll_interval"])
+                continue
+            if job.status == LotteryJobStatus.succeeded and job.simulation_runs:
+                self.stdout.write(self.style.SUCCESS(f"{job}: {len(job.simulations)} runs simulated"))
+            elif job.status == LotteryJobStatus.succeeded:
+                placed = job.lottery_run.placed_count if job.lottery_run else 0
+                self.stdout.write(self.style.SUCCESS(f"{job}: {placed} course registrations created"))
+            elif job.status == LotteryJobStatus.cancelled:
+                self.stdout.write(self.style.WARNING(f"{job}: cancelled while running"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{job}: {job.error}"))
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('esp', '0019_auto_20231107_0050'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalpreferenceentrycategory',
+            name='lottery_weight',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='preferenceentrycategory',
+            name='lottery_weight',
+            field=models.IntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import simple_history.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('esp', '0020_preferenceentrycategory_lottery_weight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotteryRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False, editable=False)),
+                ('mode', models.CharField(choices=[('greedy', 'Greedy (first come, first served by time slot)'), ('weighted', 'Weighted (strongest preferences first, one time slot at a time)')], max_length=32)),
+                ('seed', models.BigIntegerField()),
+                ('incremental', models.BooleanField(default=False)),
+                ('student_count', models.IntegerField(default=0)),
+                ('section_count', models.IntegerField(default=0)),
+                ('preference_count', models.IntegerField(default=0)),
+                ('placed_count', models.IntegerField(default=0)),
+                ('section_placements', models.JSONField(blank=True, default=dict)),
+                ('load_seconds', models.FloatField(default=0)),
+                ('match_seconds', models.FloatField(default=0)),
+                ('write_seconds', models.FloatField(default=0)),
+                ('rolled_back_on', models.DateTimeField(blank=True, null=True)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='lottery_runs', to='esp.program')),
+            ],
+            options={
+                'ordering': ['-created_on'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HistoricalLotteryRun',
+            fields=[
+                ('id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False)),
+                ('created_on', models.DateTimeField(blank=True, editable=False)),
+                ('updated_on', models.DateTimeField(blank=True, editable=False)),
+                ('is_deleted', models.BooleanField(default=False, editable=False)),
+                ('mode', models.CharField(choices=[('greedy', 'Greedy (first come, first served by time slot)'), ('weighted', 'Weighted (strongest preferences first, one time slot at a time)')], max_length=32)),
+                ('seed', models.BigIntegerField()),
+                ('incremental', models.BooleanField(default=False)),
+                ('student_count', models.IntegerField(default=0)),
+                ('section_count', models.IntegerField(default=0)),
+                ('preference_count', models.IntegerField(default=0)),
+                ('placed_count', models.IntegerField(default=0)),
+                ('section_placements', models.JSONField(blank=True, default=dict)),
+                ('load_seconds', models.FloatField(default=0)),
+                ('match_seconds', models.FloatField(default=0)),
+                ('write_seconds', models.FloatField(default=0)),
+                ('rolled_back_on', models.DateTimeField(blank=True, null=True)),
+                ('history_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('history_date', models.DateTimeField(db_index=True)),
+                ('history_change_reason', models.CharField(max_length=100, null=True)),
+                ('history_type', models.CharField(choices=[('+', 'Created'), ('~', 'Changed'), ('-', 'Deleted')], max_length=1)),
+                ('history_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('program', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='esp.program')),
+            ],
+            options={
+                'verbose_name': 'historical lottery run',
+                'verbose_name_plural': 'historical lottery runs',
+                'ordering': ('-history_date', '-history_id'),
+                'get_latest_by': ('history_date', 'history_id'),
+            },
+            bases=(simple_history.models.HistoricalChanges, models.Model),
+        ),
+        migrations.AddField(
+            model_name='classregistration',
+            name='lottery_run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='class_registrations', to='esp.lotteryrun'),
+        ),
+        migrations.AddField(
+            model_name='historicalclassregistration',
+            name='lottery_run',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='esp.lotteryrun'),
+        ),
+    ]
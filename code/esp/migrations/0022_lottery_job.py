@@ -0,0 +1,77 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import simple_history.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('esp', '0021_lottery_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotteryJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False, editable=False)),
+                ('mode', models.CharField(choices=[('greedy', 'Greedy (first come, first served by time slot)'), ('weighted', 'Weighted (strongest preferences first, one time slot at a time)')], max_length=32)),
+                ('seed', models.BigIntegerField(blank=True, null=True)),
+                ('incremental', models.BooleanField(default=False)),
+                ('simulation_runs', models.IntegerField(blank=True, null=True)),
+                ('simulations', models.JSONField(blank=True, default=list)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=32)),
+                ('phase', models.CharField(blank=True, choices=[('loading', 'Loading preferences'), ('matching', 'Matching students to sections'), ('writing', 'Writing course registrations')], max_length=32)),
+                ('error', models.TextField(blank=True)),
+                ('started_on', models.DateTimeField(blank=True, null=True)),
+                ('finished_on', models.DateTimeField(blank=True, null=True)),
+                ('lottery_run', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='job', to='esp.lotteryrun')),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='lottery_jobs', to='esp.program')),
+                ('requested_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='lottery_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_on'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HistoricalLotteryJob',
+            fields=[
+                ('id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False)),
+                ('created_on', models.DateTimeField(blank=True, editable=False)),
+                ('updated_on', models.DateTimeField(blank=True, editable=False)),
+                ('is_deleted', models.BooleanField(default=False, editable=False)),
+                ('mode', models.CharField(choices=[('greedy', 'Greedy (first come, first served by time slot)'), ('weighted', 'Weighted (strongest preferences first, one time slot at a time)')], max_length=32)),
+                ('seed', models.BigIntegerField(blank=True, null=True)),
+                ('incremental', models.BooleanField(default=False)),
+                ('simulation_runs', models.IntegerField(blank=True, null=True)),
+                ('simulations', models.JSONField(blank=True, default=list)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=32)),
+                ('phase', models.CharField(blank=True, choices=[('loading', 'Loading preferences'), ('matching', 'Matching students to sections'), ('writing', 'Writing course registrations')], max_length=32)),
+                ('error', models.TextField(blank=True)),
+                ('started_on', models.DateTimeField(blank=True, null=True)),
+                ('finished_on', models.DateTimeField(blank=True, null=True)),
+                ('history_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('history_date', models.DateTimeField(db_index=True)),
+                ('history_change_reason', models.CharField(max_length=100, null=True)),
+                ('history_type', models.CharField(choices=[('+', 'Created'), ('~', 'Changed'), ('-', 'Deleted')], max_length=1)),
+                ('history_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('lottery_run', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='esp.lotteryrun')),
+                ('program', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='esp.program')),
+                ('requested_by', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'historical lottery job',
+                'verbose_name_plural': 'historical lottery jobs',
+                'ordering': ('-history_date', '-history_id'),
+                'get_latest_by': ('history_date', 'history_id'),
+            },
+            bases=(simple_history.models.HistoricalChanges, models.Model),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import simple_history.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('esp', '0022_lottery_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicallotteryrun',
+            name='waitlisted_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lotteryrun',
+            name='waitlisted_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False, editable=False)),
+                ('position', models.IntegerField()),
+                ('course_section', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='waitlist_entries', to='esp.coursesection')),
+                ('lottery_run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='waitlist_entries', to='esp.lotteryrun')),
+                ('program_registration', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='waitlist_entries', to='esp.studentregistration')),
+            ],
+            options={
+                'ordering': ['course_section', 'position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HistoricalWaitlistEntry',
+            fields=[
+                ('id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False)),
+                ('created_on', models.DateTimeField(blank=True, editable=False)),
+                ('updated_on', models.DateTimeField(blank=True, editable=False)),
+                ('is_deleted', models.BooleanField(default=False, editable=False)),
+                ('position', models.IntegerField()),
+                ('history_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('history_date', models.DateTimeField(db_index=True)),
+                ('history_change_reason', models.CharField(max_length=100, null=True)),
+                ('history_type', models.CharField(choices=[('+', 'Created'), ('~', 'Changed'), ('-', 'Deleted')], max_length=1)),
+                ('course_section', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='esp.coursesection')),
+                ('history_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('lottery_run', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='esp.lotteryrun')),
+                ('program_registration', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='esp.studentregistration')),
+            ],
+            options={
+                'verbose_name': 'historical waitlist entry',
+                'verbose_name_plural': 'historical waitlist entrys',
+                'ordering': ('-history_date', '-history_id'),
+                'get_latest_by': ('history_date', 'history_id'),
+            },
+            bases=(simple_history.models.HistoricalChanges, models.Model),
+        ),
+        migrations.AddConstraint(
+            model_name='waitlistentry',
+            constraint=models.UniqueConstraint(fields=('course_section', 'program_registration'), name='unique_waitlist_entry'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import simple_history.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('esp', '0023_waitlist_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classroomtimeslot',
+            name='schedule_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='historicalclassroomtimeslot',
+            name='schedule_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ProgramSchedule',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False, editable=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('reset_version', models.BigIntegerField(default=0)),
+                ('program', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='schedule', to='esp.program')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='HistoricalProgramSchedule',
+            fields=[
+                ('id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False)),
+                ('created_on', models.DateTimeField(blank=True, editable=False)),
+                ('updated_on', models.DateTimeField(blank=True, editable=False)),
+                ('is_deleted', models.BooleanField(default=False, editable=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('reset_version', models.BigIntegerField(default=0)),
+                ('history_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('history_date', models.DateTimeField(db_index=True)),
+                ('history_change_reason', models.CharField(max_length=100, null=True)),
+                ('history_type', models.CharField(choices=[('+', 'Created'), ('~', 'Changed'), ('-', 'Deleted')], max_length=1)),
+                ('history_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('program', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='esp.program')),
+            ],
+            options={
+                'verbose_name': 'historical program schedule',
+                'verbose_name_plural': 'historical program schedules',
+                'ordering': ('-history_date', '-history_id'),
+                'get_latest_by': ('history_date', 'history_id'),
+            },
+            bases=(simple_history.models.HistoricalChanges, models.Model),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.16 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('esp', '0024_program_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalprogramschedule',
+            name='teacher_version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='programschedule',
+            name='teacher_version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
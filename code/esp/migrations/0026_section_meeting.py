@@ -0,0 +1,67 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:33
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+def build_section_meetings(apps, schema_editor):
+    # A copy of esp.section_meetings.merge_section_meetings as of this migration, so that later changes to it do not
+    # change what this migration does
+    ClassroomTimeSlot = apps.get_model("esp", "ClassroomTimeSlot")
+    SectionMeeting = apps.get_model("esp", "SectionMeeting")
+    rows = ClassroomTimeSlot.objects.filter(course_section__isnull=False).order_by(
+        "course_section_id", "time_slot__start_datetime"
+    ).values_list(
+        "course_section_id", "classroom_id", "time_slot__start_datetime", "time_slot__end_datetime",
+        "course_section__course__program__time_block_minutes",
+    )
+    meetings = []
+    meeting = None
+    for section_id, classroom_id, start, end, time_block_minutes in rows:
+        if (
+            meeting and meeting.course_section_id == section_id and meeting.classroom_id == classroom_id
+            and start <= meeting.end_datetime + timedelta(minutes=time_block_minutes - 1)
+        ):
+            meeting.end_datetime = end
+            continue
+        meeting = SectionMeeting(
+            course_section_id=section_id, classroom_id=classroom_id, start_datetime=start, end_datetime=end
+        )
+        meetings.append(meeting)
+    SectionMeeting.objects.bulk_create(meetings, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('esp', '0025_program_schedule_teacher_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SectionMeeting',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False, editable=False)),
+                ('start_datetime', models.DateTimeField()),
+                ('end_datetime', models.DateTimeField()),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='section_meetings', to='esp.classroom')),
+                ('course_section', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meetings', to='esp.coursesection')),
+            ],
+            options={
+                'ordering': ['start_datetime'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='sectionmeeting',
+            index=models.Index(fields=['course_section', 'start_datetime'], name='esp_section_course__68eb62_idx'),
+        ),
+        migrations.RunPython(build_section_meetings, migrations.RunPython.noop),
+    ]
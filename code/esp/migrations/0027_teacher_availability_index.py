@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('esp', '0026_section_meeting'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='teacheravailability',
+            index=models.Index(fields=['registration', 'time_slot'], name='esp_teacher_registr_1a9181_idx'),
+        ),
+    ]
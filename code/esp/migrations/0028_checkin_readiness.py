@@ -0,0 +1,78 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:52
+
+from django.db import migrations, models
+from django.db.models import DecimalField, Exists, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def compute_checkin_readiness(apps, schema_editor):
+    # A copy of esp.checkin.refresh_checkin_readiness as of this migration, so that later changes to it do not change
+    # what this migration does
+    CompletedStudentForm = apps.get_model("esp", "CompletedStudentForm")
+    ExternalProgramForm = apps.get_model("esp", "ExternalProgramForm")
+    PurchaseableItem = apps.get_model("esp", "PurchaseableItem")
+    PurchaseLineItem = apps.get_model("esp", "PurchaseLineItem")
+    StudentRegistration = apps.get_model("esp", "StudentRegistration")
+    StudentRegistration.objects.update(
+        forms_complete=~Exists(ExternalProgramForm.objects.filter(
+            program_id=OuterRef("program_id"), user_type="student"
+        ).filter(~Exists(CompletedStudentForm.objects.filter(
+            program_registration_id=OuterRef(OuterRef("id")), form_id=OuterRef("id"), completed_on__isnull=False
+        )))),
+        required_purchases_complete=~Exists(PurchaseableItem.objects.filter(
+            program_id=OuterRef("program_id"), required_for_registration=True
+        ).filter(~Exists(PurchaseLineItem.objects.filter(
+            user_id=OuterRef(OuterRef("user_id")), item_id=OuterRef("id"), purchase_confirmed_on__isnull=False
+        )))),
+        amount_owed=Coalesce(
+            Subquery(
+                PurchaseLineItem.objects.filter(
+                    user_id=OuterRef("user_id"), item__program_id=OuterRef("program_id"),
+                    purchase_confirmed_on__isnull=True,
+                ).order_by().values("user_id").annotate(total=Sum("charge_amount")).values("total")
+            ),
+            Value(0),
+            output_field=DecimalField(max_digits=8, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('esp', '0027_teacher_availability_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalstudentregistration',
+            name='amount_owed',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=8),
+        ),
+        migrations.AddField(
+            model_name='historicalstudentregistration',
+            name='forms_complete',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='historicalstudentregistration',
+            name='required_purchases_complete',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='studentregistration',
+            name='amount_owed',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=8),
+        ),
+        migrations.AddField(
+            model_name='studentregistration',
+            name='forms_complete',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='studentregistration',
+            name='required_purchases_complete',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(compute_checkin_readiness, migrations.RunPython.noop),
+    ]
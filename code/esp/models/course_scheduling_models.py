@@ -1,11 +1,9 @@
-from datetime import timedelta
-
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Max, UniqueConstraint
 
 from common.models import BaseModel
 from esp.constants import ClassroomTagCategory
-from esp.models.program_models import Classroom, ClassroomTag, Course, TimeSlot
+from esp.models.program_models import Classroom, ClassroomTag, Course, Program, TimeSlot
 
 
 class ClassroomConstraint(BaseModel):
@@ -51,38 +49,13 @@ class CourseSection(BaseModel):
         return self.__class__.objects.filter(course=self.course).aggregate(max=Max("display_id"))["max"] + 1
 
     def get_section_times(self):
-        if not self.time_slots.exists():
-            return []
-        time_slots = sorted(
-            (
-                {
-                    "start": slot.time_slot.start_datetime,
-                    "end": slot.time_slot.end_datetime,
-                    "classroom": slot.classroom.name
-                }
-                for slot in self.time_slots.all()
-            ),
-            key=lambda slot: slot["start"]
-        )
-        start_time = None
-        end_time = None
-        classroom = None
-        times = []
-        for slot in time_slots:
-            if not start_time:
-                start_time = slot["start"]
-            if not classroom:
-                classroom = slot["classroom"]
-            if end_time and (
-                slot["start"] > end_time + timedelta(minutes=self.course.program.time_block_minutes - 1)
-                or slot["classroom"] != classroom
-            ):
-                times.append((start_time, end_time, classroom))
-                start_time = slot["start"]
-                classroom = slot["classroom"]
-            end_time = slot["end"]
-        times.append((start_time, end_time, classroom))
-        return times
+        """
+        (start, end, classroom name) of each meeting, in order; prefetch ``meetings__classroom`` when calling this for
+        many sections
+        """
+        return [
+            (meeting.start_datetime, meeting.end_datetime, meeting.classroom.name) for meeting in self.meetings.all()
+        ]
 
     def __str__(self):
         return f"{self.course.get_display_name()} S{self.display_id}"
@@ -97,6 +70,8 @@ class ClassroomTimeSlot(BaseModel):
     classroom = models.ForeignKey(Classroom, related_name="time_slots", on_delete=models.CASCADE)
     time_slot = models.ForeignKey(TimeSlot, related_name="classrooms", on_delete=models.PROTECT)
     course_section = models.ForeignKey(CourseSection, related_name="time_slots", on_delete=models.PROTECT, null=True)
+    #: the program's schedule_version when this row was created or last assigned
+    schedule_version = models.BigIntegerField(default=0, db_index=True, editable=False)
 
     class Meta:
         constraints = [
@@ -105,3 +80,72 @@ class ClassroomTimeSlot(BaseModel):
 
     def __str__(self):
         return f"{self.classroom} @ {self.time_slot}: {self.course_section or 'Unassigned'}"
+
+    def save(self, *args, **kwargs):
+        from esp.schedule_changes import next_schedule_version
+        from esp.section_meetings import rebuild_section_meetings
+
+        previous = None
+        if not self._state.adding:
+            previous = self.__class__.objects.filter(pk=self.pk).values_list(
+                "course_section_id", "classroom_id", "time_slot_id"
+            ).first()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "schedule_version"}
+        with transaction.atomic():
+            # Stamped like bulk assignments (see esp.schedule_changes); a row moved to another classroom or time slot
+            # is gone from its old cell, which scheduler clients only learn about by reloading
+            moved = previous is not None and previous[1:] != (self.classroom_id, self.time_slot_id)
+            program_id = TimeSlot.objects.filter(id=self.time_slot_id).values_list("program_id", flat=True).get()
+            self.schedule_version = next_schedule_version(program_id, reset=moved)
+            super().save(*args, **kwargs)
+            rebuild_section_meetings({previous[0] if previous else None, self.course_section_id})
+
+    def delete(self, *args, **kwargs):
+        from esp.schedule_changes import next_schedule_version
+        from esp.section_meetings import rebuild_section_meetings
+
+        section_id = self.course_section_id
+        with transaction.atomic():
+            program_id = TimeSlot.objects.filter(id=self.time_slot_id).values_list("program_id", flat=True).get()
+            next_schedule_version(program_id, reset=True)
+            result = super().delete(*args, **kwargs)
+            rebuild_section_meetings({section_id})
+        return result
+
+
+class SectionMeeting(BaseModel):
+    """
+    One meeting of a CourseSection: a run of its ClassroomTimeSlots in one classroom without gaps between time slots.
+    Derived from the ClassroomTimeSlots by esp.section_meetings whenever their assignments change; never edit directly.
+    """
+    track_history = False
+
+    course_section = models.ForeignKey(CourseSection, related_name="meetings", on_delete=models.CASCADE)
+    classroom = models.ForeignKey(Classroom, related_name="section_meetings", on_delete=models.CASCADE)
+    start_datetime = models.DateTimeField()
+    end_datetime = models.DateTimeField()
+
+    class Meta:
+        ordering = ["start_datetime"]
+        indexes = [models.Index(fields=["course_section", "start_datetime"])]
+
+    def __str__(self):
+        return f"{self.course_section} in {self.classroom}: {self.start_datetime} - {self.end_datetime}"
+
+
+class ProgramSchedule(BaseModel):
+    """
+    Version counters of a program's schedule, i.e. its ClassroomTimeSlots (see esp.schedule_changes), and of its
+    teachers' availability (see esp.course_teacher_availability).
+    Kept off Program so that saving a Program never writes back a stale version.
+    """
+    program = models.OneToOneField(Program, related_name="schedule", on_delete=models.CASCADE)
+    version = models.BigIntegerField(default=0)  #: incremented by every change to the program's ClassroomTimeSlots
+    #: the last version at which ClassroomTimeSlots were deleted; clients behind it have to reload the whole schedule
+    reset_version = models.BigIntegerField(default=0)
+    #: incremented by every change to the program's CourseTeachers and TeacherAvailabilities
+    teacher_version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.program} schedule v{self.version}"
@@ -3,10 +3,9 @@ Models that are relevant to creating and managing programs and courses.
 TODO separate these models into different categories? e.g. program-relevant, course-relevant
 """
 
-from collections import defaultdict
 
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Max, Min
 from django.utils import timezone
 
@@ -269,24 +268,6 @@ class TimeSlot(BaseModel):
         ordering = ["start_datetime"]
         unique_together = [("program_id", "start_datetime")]
 
-    def course_teacher_availabilities(self):
-        from esp.serializers import UserSerializer
-
-        mapping = defaultdict(list)
-        for teacher_availability in self.teacher_availabilities.all():
-            for (
-                course_teacher
-            ) in teacher_availability.registration.course_teachers.all():
-                user = teacher_availability.registration.user
-                if user in mapping[course_teacher.course_id]:
-                    continue
-                mapping[course_teacher.course_id].append(user)
-        mapping_jsonable = {
-            str(course_id): UserSerializer(users, many=True).data
-            for course_id, users in mapping.items()
-        }
-        return mapping_jsonable
-
 
 class Classroom(BaseModel):
     """
@@ -301,6 +282,16 @@ class Classroom(BaseModel):
     def __str__(self):
         return self.name
 
+    def delete(self, *args, **kwargs):
+        from esp.schedule_changes import resync_schedules
+
+        with transaction.atomic():
+            # Deleting the classroom deletes its ClassroomTimeSlots without calling ClassroomTimeSlot.delete
+            changed = list(self.time_slots.values_list("time_slot__program_id", "course_section_id").distinct())
+            result = super().delete(*args, **kwargs)
+            resync_schedules(changed)
+        return result
+
 
 class ClassroomTag(BaseModel):
     """
@@ -450,6 +441,9 @@ class PreferenceEntryCategory(BaseModel):
     pre_add_display_name = models.CharField(max_length=512, null=True, blank=True)
     post_add_display_name = models.CharField(max_length=512, null=True, blank=True)
     help_text = models.TextField()
+    lottery_weight = models.IntegerField(
+        default=1
+    )  #: how strongly the weighted lottery favors preferences in this category (e.g. starred > interested)
     # TODO: add support for below config
     max_count = models.IntegerField(null=True, blank=True)
     min_count = models.IntegerField(null=True, blank=True)
@@ -463,6 +457,14 @@ class PreferenceEntryCategory(BaseModel):
         return self.tag
 
 
+def _refresh_program_checkin_readiness(program_id):
+    """Recompute the check-in readiness of the program's students, which depends on its forms and required items"""
+    from esp.checkin import refresh_checkin_readiness
+    from esp.models.program_registration_models import StudentRegistration
+
+    refresh_checkin_readiness(StudentRegistration.objects.filter(program_id=program_id))
+
+
 class ExternalProgramForm(BaseModel):
     """
     Forms (like waivers, medical forms) needed for programs that are hosted outside of the ESP website.
@@ -480,6 +482,15 @@ class ExternalProgramForm(BaseModel):
     display_name = models.CharField(max_length=256)
     required = models.BooleanField(default=True)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        _refresh_program_checkin_readiness(self.program_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        _refresh_program_checkin_readiness(self.program_id)
+        return result
+
     def __str__(self):
         return self.display_name
 
@@ -508,5 +519,14 @@ class PurchaseableItem(BaseModel):
     eligible_for_financial_aid = models.BooleanField()
     max_per_user = models.IntegerField(default=1)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        _refresh_program_checkin_readiness(self.program_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        _refresh_program_checkin_readiness(self.program_id)
+        return result
+
     def __str__(self):
         return f"{self.item_name} ({self.program.name})"
@@ -1,13 +1,13 @@
 from datetime import date
 
 from django.db import models
-from django.db.models import Exists, Min, OuterRef, Sum, Value
-from django.db.models.functions import Now
+from django.db.models import Exists, OuterRef, Sum
 from django.utils import timezone
 
 from common.constants import GradeLevel, ShirtSize, UserType, USStateEquiv
 from common.models import BaseModel, User
-from esp.constants import HeardAboutVia, MITAffiliation, PaymentMethod
+from esp.constants import (HeardAboutVia, LotteryJobStatus, LotteryMode, LotteryPhase, MITAffiliation,
+                           PaymentMethod)
 from esp.models.course_scheduling_models import CourseSection
 from esp.models.program_models import (
     Course,
@@ -116,30 +116,32 @@ class StudentRegistration(BaseModel):
         null=True
     )  #: Overrides deadlines set on program stages
     checked_in = models.BooleanField(default=False)
+    # Check-in readiness, precomputed by esp.checkin.refresh_checkin_readiness whenever forms or payments change
+    forms_complete = models.BooleanField(default=False)  #: All of the program's student forms are completed
+    required_purchases_complete = models.BooleanField(
+        default=False
+    )  #: All of the program's items required for registration are purchased
+    amount_owed = models.DecimalField(
+        max_digits=8, decimal_places=2, default=0
+    )  #: Total charge of the program's items in the student's cart
 
     class Meta:
         unique_together = [("program_id", "user_id")]
 
+    def save(self, *args, **kwargs):
+        from esp.checkin import refresh_checkin_readiness
+
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            # The program may have no forms or required items, or the student may have paid for some already
+            refresh_checkin_readiness(StudentRegistration.objects.filter(id=self.id))
+            self.refresh_from_db(fields=["forms_complete", "required_purchases_complete", "amount_owed"])
+
     def get_program_stage(self):
         """Returns the registration stage the current user is at. This is either the first incomplete stage or the last active stage."""
-        active_stages = (
-            self.program.stages.filter(start_date__lte=Now(), end_date__gte=Now())
-            if not self.ignore_registration_deadlines()
-            else self.program.stages.all()
-        )
-        if not active_stages.exists():
-            return None
-        completed_steps = self.completed_steps.values_list("step_id", flat=True)
-        incomplete_stages = active_stages.filter(
-            Exists(
-                StudentProgramRegistrationStep.objects.filter(
-                    program_stage_id=OuterRef("id"), required_for_stage_completion=True
-                ).exclude(id__in=completed_steps)
-            )
-        )
-        if incomplete_stages.exists():
-            return incomplete_stages.first()
-        return active_stages.last()
+        from esp.registration_stages import registration_program_stage
+        return registration_program_stage(self)
 
     def ignore_registration_deadlines(self):
         """Returns True if registration deadlines can be ignored for this user, and False otherwise."""
@@ -161,17 +163,28 @@ class StudentRegistration(BaseModel):
 
     def check_registration_requirements(self):
         """Returns a dict containing whether registration requirements are satisfied, and if not, the error(s) thrown."""
+        return self._registration_requirements(
+            not self.incomplete_forms().exists(), self.all_required_purchases_complete(), self.get_amount_owed()
+        )
+
+    def check_checkin_readiness(self):
+        """Same as check_registration_requirements, but from the precomputed check-in readiness fields."""
+        return self._registration_requirements(
+            self.forms_complete, self.required_purchases_complete, self.amount_owed
+        )
+
+    @staticmethod
+    def _registration_requirements(forms_complete, required_purchases_complete, amount_owed):
         return_dict = {
             "requirements_satisfied": True,
             "errors": [],
         }
-        if self.incomplete_forms().exists():
+        if not forms_complete:
             return_dict["requirements_satisfied"] = False
             return_dict["errors"].append("Not all program forms have been completed.")
-        if not self.all_required_purchases_complete():
+        if not required_purchases_complete:
             return_dict["requirements_satisfied"] = False
             return_dict["errors"].append("Not all required payments have been made.")
-        amount_owed = self.get_amount_owed()
         if amount_owed:
             return_dict["requirements_satisfied"] = False
             return_dict["errors"].append(
@@ -255,6 +268,57 @@ class ClassPreference(BaseModel):
         return f"{self.registration} - {self.category} preference"
 
 
+class LotteryRun(BaseModel):
+    """A single execution of the program lottery. Every ClassRegistration it creates is tagged with the run."""
+
+    program = models.ForeignKey(Program, related_name="lottery_runs", on_delete=models.PROTECT)
+    mode = models.CharField(choices=LotteryMode.choices, max_length=32)
+    seed = models.BigIntegerField()
+    incremental = models.BooleanField(default=False)  #: only placed students without lottery registrations
+    student_count = models.IntegerField(default=0)
+    section_count = models.IntegerField(default=0)
+    preference_count = models.IntegerField(default=0)
+    placed_count = models.IntegerField(default=0)
+    waitlisted_count = models.IntegerField(default=0)
+    section_placements = models.JSONField(default=dict, blank=True)  #: {section id: students placed}, kept on roll back
+    load_seconds = models.FloatField(default=0)
+    match_seconds = models.FloatField(default=0)
+    write_seconds = models.FloatField(default=0)
+    rolled_back_on = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_on"]
+
+    def __str__(self):
+        return f"{self.program} - {self.get_mode_display()} lottery, seed {self.seed}"
+
+
+class LotteryJob(BaseModel):
+    """A lottery requested from the lottery page, executed by the `run_lottery_worker` management command."""
+
+    program = models.ForeignKey(Program, related_name="lottery_jobs", on_delete=models.PROTECT)
+    requested_by = models.ForeignKey(User, related_name="lottery_jobs", on_delete=models.PROTECT, null=True)
+    mode = models.CharField(choices=LotteryMode.choices, max_length=32)
+    seed = models.BigIntegerField(null=True, blank=True)
+    incremental = models.BooleanField(default=False)
+    simulation_runs = models.IntegerField(null=True, blank=True)  #: dry-run this many seeds instead; nothing is saved
+    simulations = models.JSONField(default=list, blank=True)  #: simulate_program_lottery() results of a dry run
+    status = models.CharField(choices=LotteryJobStatus.choices, max_length=32, default=LotteryJobStatus.queued)
+    phase = models.CharField(choices=LotteryPhase.choices, max_length=32, blank=True)
+    error = models.TextField(blank=True)
+    started_on = models.DateTimeField(null=True, blank=True)
+    finished_on = models.DateTimeField(null=True, blank=True)
+    lottery_run = models.OneToOneField(
+        LotteryRun, related_name="job", on_delete=models.PROTECT, null=True, blank=True
+    )
+
+    class Meta:
+        ordering = ["-created_on"]
+
+    def __str__(self):
+        return f"{self.program} - {self.get_mode_display()} lottery job ({self.status})"
+
+
 class ClassRegistration(BaseModel):
     course_section = models.ForeignKey(
         CourseSection, related_name="registrations", on_delete=models.PROTECT
@@ -265,9 +329,36 @@ class ClassRegistration(BaseModel):
         on_delete=models.PROTECT,
     )
     created_by_lottery = models.BooleanField()
+    lottery_run = models.ForeignKey(
+        LotteryRun, related_name="class_registrations", on_delete=models.PROTECT, null=True, blank=True
+    )
     confirmed_on = models.DateTimeField(null=True)
 
 
+class WaitlistEntry(BaseModel):
+    """A student waiting for a seat in a full section. Lower positions are promoted first."""
+
+    course_section = models.ForeignKey(CourseSection, related_name="waitlist_entries", on_delete=models.PROTECT)
+    program_registration = models.ForeignKey(
+        StudentRegistration, related_name="waitlist_entries", on_delete=models.PROTECT
+    )
+    position = models.IntegerField()
+    lottery_run = models.ForeignKey(
+        LotteryRun, related_name="waitlist_entries", on_delete=models.PROTECT, null=True, blank=True
+    )
+
+    class Meta:
+        ordering = ["course_section", "position"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["course_section", "program_registration"], name="unique_waitlist_entry"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.program_registration} - waitlist position {self.position} for {self.course_section}"
+
+
 class UserPayment(BaseModel):
     user = models.ForeignKey(User, related_name="payments", on_delete=models.PROTECT)
     payment_method = models.CharField(choices=PaymentMethod.choices, max_length=64)
@@ -418,34 +509,30 @@ class TeacherRegistration(BaseModel):
         return f"{self.program} teaching registration for {self.user}"
 
     def visible_registration_steps(self):
-        steps = self.program.teacher_registration_steps.all()
-        if not self.ignore_registration_deadlines():
-            steps = steps.filter(
-                access_start_date__lt=timezone.now(), access_end_date__gt=timezone.now()
-            )
-        completed_steps = self.completed_steps.values("step_id")
-        visible_steps = steps.filter(
-            id__in=completed_steps, display_after_completion=True
-        ).annotate(completed=Value(True))
-        if self.completed_steps.count() < steps.count():
-            first_incomplete_required_step = (
-                steps.exclude(id__in=completed_steps)
-                .filter(required_for_next_step=True)
-                .aggregate(Min("_order"))["_order__min"]
-            )
-            visible_incomplete_steps = (
-                steps.exclude(id__in=completed_steps)
-                .filter(_order__lte=first_incomplete_required_step)
-                .annotate(completed=Value(False))
-            )
-            visible_steps = visible_steps | visible_incomplete_steps
-        return visible_steps.order_by("_order")
+        """The registration steps this teacher can see, in order, each with ``completed`` set."""
+        return self._registration_steps()[0]
 
     def has_access_to_step(self, step):
+        visible_steps, completed_step_ids = self._registration_steps()
         return (
-            step.id not in self.completed_steps.values("step_id")
-            or step.allow_changes_after_completion
-        ) and step in self.visible_registration_steps()
+            step.id not in completed_step_ids or step.allow_changes_after_completion
+        ) and step.id in {visible_step.id for visible_step in visible_steps}
+
+    def completed_step_ids(self):
+        return self._registration_steps()[1]
+
+    def mark_step_completed(self, step):
+        CompletedTeacherRegistrationStep.objects.update_or_create(
+            registration=self, step=step, defaults={"completed_on": timezone.now()}
+        )
+        self.__dict__.pop("_registration_steps_cache", None)
+
+    def _registration_steps(self):
+        """Visible steps and completed step ids, read once per instance until a step is marked completed."""
+        if "_registration_steps_cache" not in self.__dict__:
+            from esp.teacher_registration_steps import registration_steps
+            self._registration_steps_cache = registration_steps(self)
+        return self._registration_steps_cache
 
     def ignore_registration_deadlines(self):
         return (
@@ -503,6 +590,23 @@ class CourseTeacher(BaseModel):
     is_course_creator = models.BooleanField()
     confirmed_on = models.DateTimeField(null=True)
 
+    def save(self, *args, **kwargs):
+        from esp.course_teacher_availability import invalidate_course_teacher_availability
+
+        super().save(*args, **kwargs)
+        invalidate_course_teacher_availability(
+            [Course.objects.filter(id=self.course_id).values_list("program_id", flat=True).get()]
+        )
+
+    def delete(self, *args, **kwargs):
+        from esp.course_teacher_availability import invalidate_course_teacher_availability
+
+        result = super().delete(*args, **kwargs)
+        invalidate_course_teacher_availability(
+            [Course.objects.filter(id=self.course_id).values_list("program_id", flat=True).get()]
+        )
+        return result
+
 
 class TeacherAvailability(BaseModel):
     registration = models.ForeignKey(
@@ -512,6 +616,27 @@ class TeacherAvailability(BaseModel):
         TimeSlot, related_name="teacher_availabilities", on_delete=models.PROTECT
     )
 
+    class Meta:
+        # Looked up by pair when checking scheduled sections against their teachers' availability
+        indexes = [models.Index(fields=["registration", "time_slot"])]
+
+    def save(self, *args, **kwargs):
+        from esp.course_teacher_availability import invalidate_course_teacher_availability
+
+        super().save(*args, **kwargs)
+        invalidate_course_teacher_availability(
+            [TimeSlot.objects.filter(id=self.time_slot_id).values_list("program_id", flat=True).get()]
+        )
+
+    def delete(self, *args, **kwargs):
+        from esp.course_teacher_availability import invalidate_course_teacher_availability
+
+        result = super().delete(*args, **kwargs)
+        invalidate_course_teacher_availability(
+            [TimeSlot.objects.filter(id=self.time_slot_id).values_list("program_id", flat=True).get()]
+        )
+        return result
+
 
 class CompletedTeacherForm(CompletedForm):
     teacher_registration = models.ForeignKey(
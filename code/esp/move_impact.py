@@ -0,0 +1,60 @@
+"""
+Which enrolled students a move of a section would give a time conflict, so that the scheduler can warn before the move
+is made. Takes two queries: one for the times of the target ClassroomTimeSlots, and one joining the section's
+ClassRegistrations to the same students' other ClassRegistrations whose SectionMeetings overlap those times.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from esp.models.course_scheduling_models import ClassroomTimeSlot
+from esp.models.program_registration_models import ClassRegistration
+
+
+def section_move_impact(section, classroom_time_slot_ids):
+    """
+    Return the students enrolled in ``section`` who have another section meeting at the same time as any of the given
+    ClassroomTimeSlots of the section's program, as [{"user", "name", "conflicts": [{"course_section", "name",
+    "start_datetime", "end_datetime", "classroom"}]}], ordered by name. Raises ValueError if any of the
+    ClassroomTimeSlots is not in the program.
+    """
+    classroom_time_slot_ids = set(classroom_time_slot_ids)
+    times = list(ClassroomTimeSlot.objects.filter(
+        id__in=classroom_time_slot_ids, time_slot__program_id=section.course.program_id
+    ).values_list("time_slot__start_datetime", "time_slot__end_datetime"))
+    if len(times) != len(classroom_time_slot_ids):
+        raise ValueError("Not all classroom time slots belong to the section's program")
+    if not times:
+        return []
+    overlaps = reduce(or_, (
+        Q(course_section__meetings__start_datetime__lt=end, course_section__meetings__end_datetime__gt=start)
+        for start, end in set(times)
+    ))
+
+    students = {}
+    for (
+        user_id, first_name, last_name, username, section_id, section_display_id, course_name, start, end, classroom
+    ) in ClassRegistration.objects.filter(
+        overlaps, program_registration__class_registrations__course_section=section,
+    ).exclude(course_section=section).order_by(
+        "program_registration__user_id", "course_section__meetings__start_datetime"
+    ).values_list(
+        "program_registration__user_id", "program_registration__user__first_name",
+        "program_registration__user__last_name", "program_registration__user__username", "course_section_id",
+        "course_section__display_id", "course_section__course__name", "course_section__meetings__start_datetime",
+        "course_section__meetings__end_datetime", "course_section__meetings__classroom__name",
+    ):
+        student = students.setdefault(user_id, {
+            "user": user_id,
+            "name": " ".join(name for name in (first_name, last_name) if name) or username,
+            "conflicts": [],
+        })
+        student["conflicts"].append({
+            "course_section": section_id,
+            "name": f"{course_name} (section {section_display_id})",
+            "start_datetime": start,
+            "end_datetime": end,
+            "classroom": classroom,
+        })
+    return sorted(students.values(), key=lambda student: student["name"])
@@ -0,0 +1,177 @@
+"""
+Ranked suggestions of where a section could be placed, answered from an in-memory index of the program's schedule.
+
+The index is a ScheduleSnapshot (see esp.scheduling), which holds the free slots of every classroom as a bitset, so the
+free intervals long enough for a section are found with a few shifts. Each process keeps the index of every program it
+was asked about and, before answering, replays the ClassroomTimeSlots stamped after the schedule version it is at (see
+esp.schedule_changes) instead of loading it again. It is only reloaded when ClassroomTimeSlots were added or deleted,
+or when the program's time slots, courses, sections, classrooms or teachers changed; as those rarely change while
+scheduling, they are only checked every SOURCE_CHECK_INTERVAL seconds.
+"""
+import threading
+import time
+
+from django.db.models import Count, Max
+
+from esp.models.course_scheduling_models import ClassroomTimeSlot, CourseSection
+from esp.models.program_models import Classroom, Course, Program, TimeSlot
+from esp.models.program_registration_models import CourseTeacher, TeacherAvailability
+from esp.schedule_changes import schedule_versions
+from esp.scheduling import ScheduleSnapshot, free_run_starts
+from esp.time_slot_bitsets import lowest_slot
+
+#: seconds an index is trusted to match the program's time slots, courses, sections, classrooms and teachers
+SOURCE_CHECK_INTERVAL = 10
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _source_state(program_id):
+    """Row count and latest update of everything the index is loaded from, apart from ClassroomTimeSlots."""
+    return [
+        tuple(queryset.aggregate(count=Count("id"), updated_on=Max("updated_on")).values())
+        for queryset in (
+            Program.objects.filter(id=program_id),
+            TimeSlot.objects.filter(program_id=program_id),
+            Classroom.objects.all(),
+            Course.objects.filter(program_id=program_id),
+            CourseSection.objects.filter(course__program_id=program_id),
+            CourseTeacher.objects.filter(course__program_id=program_id),
+            TeacherAvailability.objects.filter(time_slot__program_id=program_id),
+        )
+    ]
+
+
+class PlacementIndex:
+    """
+    A program's ScheduleSnapshot, plus which slots of which rooms each section occupies, kept current by replaying
+    schedule changes.
+    """
+
+    def __init__(self, program):
+        self.source_state = _source_state(program.id)
+        self.source_checked_on = time.monotonic()
+        # Read before loading, so that changes made meanwhile are replayed rather than missed
+        self.version = schedule_versions(program.id)[0]
+        self.snapshot = snapshot = ScheduleSnapshot.load(program)
+        self.section_index = {section_id: section for section, section_id in enumerate(snapshot.section_ids)}
+        self.cell_positions = {cell_id: position for position, cell_id in snapshot.cell_ids.items()}
+        self.section_rooms = {}  #: {room index: bitset of slots} occupied by each assigned CourseSection id
+        for (room, slot), section_id in snapshot.cell_sections.items():
+            rooms = self.section_rooms.setdefault(section_id, {})
+            rooms[room] = rooms.get(room, 0) | 1 << slot
+        self.teacher_sections = [[] for _ in snapshot.teacher_available]  #: CourseSection ids each teacher teaches
+        for section, section_id in enumerate(snapshot.section_ids):
+            for teacher in snapshot.course_teachers[snapshot.section_course[section]]:
+                self.teacher_sections[teacher].append(section_id)
+        self.valid_starts = {}
+
+    def apply_changes(self, version):
+        """
+        Replay the ClassroomTimeSlots stamped after the index's version, up to ``version``. Returns False, leaving the
+        index unusable, if one of them is not in the index, i.e. it has to be loaded again.
+        """
+        snapshot = self.snapshot
+        for cell_id, section_id, cell_version in ClassroomTimeSlot.objects.filter(
+            time_slot__program_id=snapshot.program_id, schedule_version__gt=self.version
+        ).values_list("id", "course_section_id", "schedule_version"):
+            if cell_id not in self.cell_positions:
+                return False
+            room, slot = position = self.cell_positions[cell_id]
+            bit = 1 << slot
+            previous_section_id = snapshot.cell_sections.pop(position, None)
+            if previous_section_id is not None:
+                self.section_rooms[previous_section_id][room] &= ~bit
+            if section_id is None:
+                snapshot.room_free[room] |= bit
+            else:
+                snapshot.room_free[room] &= ~bit
+                snapshot.cell_sections[position] = section_id
+                rooms = self.section_rooms.setdefault(section_id, {})
+                rooms[room] = rooms.get(room, 0) | bit
+            snapshot.cell_versions[cell_id] = cell_version
+        self.version = version
+        return True
+
+    def _free_intervals(self, free):
+        """Yield the (first, last) slot of every maximal run of contiguous slots in ``free``, earliest first."""
+        linked = free & free >> 1 & self.snapshot.slot_continues
+        firsts = free & ~(linked << 1)
+        lasts = free & ~linked
+        while firsts:
+            yield lowest_slot(firsts), lowest_slot(lasts)
+            firsts &= firsts - 1
+            lasts &= lasts - 1
+
+    def suggest(self, section_id, limit=None):
+        """
+        Every classroom and run of ``time_slots_per_session`` contiguous free slots the section could be placed in:
+        the room seats the course's max_section_size and all of its teachers are available and not teaching another
+        section then. The section's own current slots count as free. Best fits come first: the least unused seats,
+        then the least free slots left over around the placement (so that long free intervals stay whole), then the
+        earliest start.
+        """
+        snapshot = self.snapshot
+        section = self.section_index[section_id]
+        course = snapshot.section_course[section]
+        length = snapshot.section_length[section]
+        size = snapshot.section_size[section]
+        own_rooms = self.section_rooms.get(section_id, {})
+
+        available = snapshot.all_slots
+        for teacher in snapshot.course_teachers[course]:
+            busy = 0
+            for other_section_id in self.teacher_sections[teacher]:
+                if other_section_id != section_id:
+                    for slots in self.section_rooms.get(other_section_id, {}).values():
+                        busy |= slots
+            available &= snapshot.teacher_available[teacher] & ~busy
+        if length not in self.valid_starts:
+            self.valid_starts[length] = snapshot.run_starts(length)
+
+        placements = []
+        for room, capacity in enumerate(snapshot.room_capacity):
+            if capacity < size:
+                continue
+            free = snapshot.room_free[room] | own_rooms.get(room, 0)
+            starts = free_run_starts(free & available, length, self.valid_starts[length])
+            intervals = self._free_intervals(free)
+            last = -1
+            while starts:
+                start = lowest_slot(starts)
+                starts &= starts - 1
+                while last < start:
+                    first, last = next(intervals)
+                # Free slots left over before and after the placement in the room's free interval
+                placements.append((capacity - size, last - first + 1 - length, start, room))
+        placements.sort()
+
+        return [
+            {
+                "classroom": snapshot.room_ids[room],
+                "time_slots": snapshot.slot_ids[start:start + length],
+                "classroom_time_slots": [snapshot.cell_ids[(room, slot)] for slot in range(start, start + length)],
+                "capacity_slack": capacity_slack,
+                "interval_slack": interval_slack,
+            }
+            for capacity_slack, interval_slack, start, room in placements[:limit]
+        ]
+
+
+def placement_index(program):
+    """The program's PlacementIndex in this process, brought up to date with the database."""
+    version, reset_version = schedule_versions(program.id)
+    with _indexes_lock:
+        index = _indexes.get(program.id)
+        if index is not None and time.monotonic() - index.source_checked_on > SOURCE_CHECK_INTERVAL:
+            if index.source_state == _source_state(program.id):
+                index.source_checked_on = time.monotonic()
+            else:
+                index = None
+        if (
+            index is None or not reset_version <= index.version <= version
+            or (index.version < version and not index.apply_changes(version))
+        ):
+            index = _indexes[program.id] = PlacementIndex(program)
+    return index
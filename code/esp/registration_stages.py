@@ -0,0 +1,76 @@
+"""
+Which ProgramStage each StudentRegistration is at: its first active stage with a required step it has not completed,
+or else its last active stage. Stages are active between their start and end dates, and all of them are while the
+registration's deadlines are overridden.
+
+registration_program_stage() resolves one registration with a single query; program_registration_stages() resolves
+every registration of a program with a fixed number of queries, however many there are.
+"""
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from esp.models.program_models import ProgramStage, StudentProgramRegistrationStep
+from esp.models.program_registration_models import CompletedStudentRegistrationStep
+
+
+def _current_stage(stages, incomplete_stage_ids, ignore_deadlines, now):
+    active_stages = stages if ignore_deadlines else [
+        stage for stage in stages if stage.start_date <= now <= stage.end_date
+    ]
+    if not active_stages:
+        return None
+    return next((stage for stage in active_stages if stage.id in incomplete_stage_ids), active_stages[-1])
+
+
+def registration_program_stage(registration):
+    """The ProgramStage the registration is at, or None if none of its program's stages is active."""
+    stages = list(ProgramStage.objects.filter(program_id=registration.program_id).annotate(
+        incomplete=Exists(StudentProgramRegistrationStep.objects.filter(
+            program_stage_id=OuterRef("id"), required_for_stage_completion=True
+        ).filter(~Exists(CompletedStudentRegistrationStep.objects.filter(
+            registration_id=registration.id, step_id=OuterRef("id")
+        ))))
+    ))
+    return _current_stage(
+        stages,
+        {stage.id for stage in stages if stage.incomplete},
+        registration.ignore_registration_deadlines(),
+        timezone.now(),
+    )
+
+
+def program_registration_stages(program, registrations=None):
+    """
+    {registration id: ProgramStage or None} for the ``registrations`` queryset of the program's StudentRegistrations,
+    or for all of them, with four queries.
+    """
+    if registrations is None:
+        registrations = program.registrations.all()
+    stages = list(program.stages.all())
+    required_steps = {}  # stage id -> ids of its required steps
+    for step_id, stage_id in StudentProgramRegistrationStep.objects.filter(
+        program_stage__program=program, required_for_stage_completion=True
+    ).values_list("id", "program_stage_id"):
+        required_steps.setdefault(stage_id, set()).add(step_id)
+    completed_steps = {}  # registration id -> ids of its completed required steps
+    for registration_id, step_id in CompletedStudentRegistrationStep.objects.filter(
+        registration__in=registrations, step__program_stage__program=program,
+        step__required_for_stage_completion=True,
+    ).values_list("registration_id", "step_id"):
+        completed_steps.setdefault(registration_id, set()).add(step_id)
+
+    now = timezone.now()
+    return {
+        registration.id: _current_stage(
+            stages,
+            {
+                stage_id for stage_id, step_ids in required_steps.items()
+                if not step_ids <= completed_steps.get(registration.id, set())
+            },
+            registration.ignore_registration_deadlines(),
+            now,
+        )
+        for registration in registrations.only(
+            "id", "program_id", "allow_early_registration_after", "allow_late_registration_until"
+        )
+    }
@@ -0,0 +1,142 @@
+"""
+Versioning of program schedules, so that scheduler clients can follow changes instead of reloading everything.
+
+Every write to a program's ClassroomTimeSlots takes the next version of its ProgramSchedule and stamps the rows it
+creates or assigns with it. The version is taken with a row lock held until the write commits, so versions become
+visible in increasing order and a client that has seen everything up to version N only needs the rows stamped with
+versions above N. Deleted rows leave nothing to stamp; deleting advances ``reset_version`` instead, and clients
+behind it reload the whole schedule.
+"""
+from uuid import UUID
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from esp.models.course_scheduling_models import ClassroomTimeSlot, ProgramSchedule
+from esp.section_meetings import rebuild_section_meetings
+from esp.serializers import ClassroomTimeSlotSerializer
+
+#: most ClassroomTimeSlots assigned per UPDATE statement
+ASSIGNMENT_CHUNK_SIZE = 1000
+
+
+class ScheduleConflictError(Exception):
+    def __init__(self, classroom_time_slot_ids):
+        self.classroom_time_slot_ids = classroom_time_slot_ids
+        super().__init__(f"{len(classroom_time_slot_ids)} classroom time slots were changed by someone else")
+
+
+def next_schedule_version(program_id, reset=False):
+    """
+    Take the program's next schedule version, to stamp the ClassroomTimeSlots being changed with. Must be called in the
+    transaction making the change, which then holds the program's version until it commits. Pass ``reset`` when
+    ClassroomTimeSlots are deleted.
+    """
+    ProgramSchedule.objects.get_or_create(program_id=program_id)
+    updates = {"version": F("version") + 1}
+    if reset:
+        updates["reset_version"] = F("version") + 1
+    ProgramSchedule.objects.filter(program_id=program_id).update(**updates)
+    return ProgramSchedule.objects.filter(program_id=program_id).values_list("version", flat=True).get()
+
+
+def resync_schedules(changed):
+    """
+    Catch up after ClassroomTimeSlots were written without taking versions or rebuilding SectionMeetings, e.g. by
+    QuerySet.delete(), bulk_create() or deleting a Classroom: ``changed`` are the (program_id, course_section_id) pairs
+    of the rows created, assigned or deleted. Each program takes a new version with a reset, so that its scheduler
+    clients reload, and the sections get their meetings rebuilt. Must be called in the transaction making the change.
+    """
+    changed = set(changed)
+    for program_id in sorted({program_id for program_id, _section_id in changed}):
+        next_schedule_version(program_id, reset=True)
+    rebuild_section_meetings(section_id for _program_id, section_id in changed)
+
+
+def schedule_versions(program_id):
+    """The program's (version, reset_version); (0, 0) until its schedule first changes."""
+    versions = ProgramSchedule.objects.filter(program_id=program_id).values_list("version", "reset_version").first()
+    return versions or (0, 0)
+
+
+def schedule_changes(program_id, since):
+    """
+    Return the program's current schedule version and the ClassroomTimeSlots changed after version ``since``,
+    serialized like the classroom time slot endpoint. ``reset`` is True, with no rows, when ClassroomTimeSlots were
+    deleted after ``since`` or ``since`` is not a version of this schedule.
+    """
+    version, reset_version = schedule_versions(program_id)
+    if since < reset_version or since > version:
+        return {"version": version, "reset": True, "classroom_time_slots": []}
+    changed = []
+    if version > since:
+        changed = ClassroomTimeSlotSerializer(
+            ClassroomTimeSlot.objects.filter(
+                time_slot__program_id=program_id, schedule_version__gt=since
+            ).select_related("course_section__course", "time_slot"),
+            many=True,
+        ).data
+    return {"version": version, "reset": False, "classroom_time_slots": changed}
+
+
+def assign_classroom_time_slots(program_id, assignments):
+    """
+    Set ``course_section_id`` of many ClassroomTimeSlots, given as (classroom_time_slot_id, course_section_id,
+    expected_version) triples, with one ``UPDATE ... FROM (VALUES ...)`` statement per chunk of ASSIGNMENT_CHUNK_SIZE.
+    A row whose schedule_version is no longer its ``expected_version`` (None skips the check) was changed by someone
+    else since the caller read it, or deleted: then nothing is saved and ScheduleConflictError lists those rows.
+    Rebuilds the SectionMeetings of every section gaining or losing a slot, and returns the new schedule version.
+    """
+    # The last assignment of a slot wins, as each row can only be updated once per statement
+    rows = list({
+        UUID(str(classroom_time_slot_id)): (UUID(str(classroom_time_slot_id)), section_id, expected_version)
+        for classroom_time_slot_id, section_id, expected_version in assignments
+    }.values())
+    if not rows:
+        return schedule_versions(program_id)[0]
+    id_field = ClassroomTimeSlot._meta.pk
+    table = connection.ops.quote_name(ClassroomTimeSlot._meta.db_table)
+    # VALUES columns are untyped, and PostgreSQL will not assign text to uuid or compare it with bigint
+    uuid_cast, bigint_cast = ("::uuid", "::bigint") if connection.vendor == "postgresql" else ("", "")
+    chunk_size = min(ASSIGNMENT_CHUNK_SIZE, connection.ops.bulk_batch_size(["id", "section", "version"], rows) or 1)
+    section_ids = {section_id for _classroom_time_slot_id, section_id, _version in rows}
+    try:
+        with transaction.atomic():
+            schedule_version = next_schedule_version(program_id)
+            updated_on = ClassroomTimeSlot._meta.get_field("updated_on").get_db_prep_value(timezone.now(), connection)
+            with connection.cursor() as cursor:
+                for start in range(0, len(rows), chunk_size):
+                    chunk = rows[start:start + chunk_size]
+                    # The sections losing these slots need their meetings rebuilt as well
+                    section_ids.update(ClassroomTimeSlot.objects.filter(
+                        id__in=[classroom_time_slot_id for classroom_time_slot_id, _section_id, _version in chunk]
+                    ).values_list("course_section_id", flat=True))
+                    params = [schedule_version, updated_on]
+                    for classroom_time_slot_id, section_id, expected_version in chunk:
+                        params += [
+                            id_field.get_db_prep_value(classroom_time_slot_id, connection),
+                            id_field.get_db_prep_value(section_id, connection),
+                            expected_version,
+                        ]
+                    cursor.execute(
+                        f"UPDATE {table} SET course_section_id = v.column2{uuid_cast}, schedule_version = %s, "
+                        f"updated_on = %s FROM (VALUES {', '.join(['(%s, %s, %s)'] * len(chunk))}) AS v "
+                        f"WHERE {table}.id = v.column1{uuid_cast} "
+                        f"AND (v.column3 IS NULL OR {table}.schedule_version = v.column3{bigint_cast})",
+                        params,
+                    )
+                    if cursor.rowcount != len(chunk):
+                        # Rolls back the chunks already updated too
+                        raise ScheduleConflictError([])
+            rebuild_section_meetings(section_ids)
+    except ScheduleConflictError:
+        current_versions = dict(ClassroomTimeSlot.objects.filter(
+            id__in=[classroom_time_slot_id for classroom_time_slot_id, _section_id, _version in rows]
+        ).values_list("id", "schedule_version"))
+        raise ScheduleConflictError(sorted(
+            str(classroom_time_slot_id) for classroom_time_slot_id, _section_id, expected_version in rows
+            if classroom_time_slot_id not in current_versions
+            or expected_version not in (None, current_versions[classroom_time_slot_id])
+        ))
+    return schedule_version
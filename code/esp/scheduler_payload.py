@@ -0,0 +1,141 @@
+"""
+Compact encoding of a whole program schedule, loaded by the scheduler frontend in a single request.
+
+Every table is sent as columns ({field: [value, ...]}) rather than one dict per row, and rows refer to each other by
+their position in the referenced table's columns instead of by UUID, so each UUID is sent exactly once. The rows are
+read with ``values_list`` and never become model instances.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from rest_framework.fields import DateTimeField
+
+from common.models import User
+from esp.models.course_scheduling_models import ClassroomTimeSlot, CourseSection
+from esp.models.program_models import Classroom, Course, TimeSlot
+from esp.models.program_registration_models import CourseTeacher, TeacherAvailability
+from esp.schedule_changes import schedule_versions
+
+CLASSROOM_FIELDS = ("id", "name", "description", "max_occupants")
+TIME_SLOT_FIELDS = ("id", "start_datetime", "end_datetime")
+COURSE_FIELDS = (
+    "id", "display_id", "name", "description", "admin_notes", "teacher_notes", "sessions_per_week",
+    "time_slots_per_session",
+)
+TEACHER_FIELDS = ("id", "first_name", "last_name", "username", "user_type", "verified")
+
+
+def _columns(fields, rows):
+    """Transpose ``values_list`` rows into {field: [value, ...]}."""
+    columns = list(zip(*rows)) or [()] * len(fields)
+    return {field: list(column) for field, column in zip(fields, columns)}
+
+
+def _index(ids):
+    return {id_: index for index, id_ in enumerate(ids)}
+
+
+# Renders datetimes exactly as the serializers of the separate endpoints do
+_datetime_field = DateTimeField()
+
+
+def _source_querysets(program_id):
+    return {
+        "classrooms": Classroom.objects.all(),
+        "time_slots": TimeSlot.objects.filter(program_id=program_id),
+        "courses": Course.objects.filter(program_id=program_id),
+        "course_sections": CourseSection.objects.filter(course__program_id=program_id),
+        "teachers": User.objects.filter(teacher_registrations__course_teachers__course__program_id=program_id),
+        "course_teachers": CourseTeacher.objects.filter(course__program_id=program_id),
+        "teacher_availabilities": TeacherAvailability.objects.filter(time_slot__program_id=program_id),
+        "classroom_time_slots": ClassroomTimeSlot.objects.filter(time_slot__program_id=program_id),
+    }
+
+
+def scheduler_payload_etag(program_id):
+    """
+    ETag of the payload, derived from the schedule version and the row count and latest update of every table it is
+    built from, so that an unchanged schedule can be answered with 304 Not Modified without building it.
+    """
+    state = [schedule_versions(program_id)] + [
+        (name, *queryset.aggregate(count=Count("id", distinct=True), updated_on=Max("updated_on")).values())
+        for name, queryset in _source_querysets(program_id).items()
+    ]
+    return hashlib.sha1(repr(state).encode()).hexdigest()
+
+
+def build_scheduler_payload(program_id):
+    """
+    Return the program's classrooms, time slots, courses, sections, teachers, teacher availability and classroom time
+    slots as columns, with the schedule ``version`` they are at. Foreign keys (``course``, ``teacher``, ``classroom``,
+    ``time_slot``, ``course_section``) are indexes into the corresponding table; an unassigned classroom time slot has
+    a ``course_section`` of None.
+    """
+    # Read before the tables, so that changes made meanwhile are replayed rather than missed (see esp.schedule_changes)
+    version, _reset_version = schedule_versions(program_id)
+    querysets = _source_querysets(program_id)
+
+    classrooms = _columns(CLASSROOM_FIELDS, querysets["classrooms"].order_by("name").values_list(*CLASSROOM_FIELDS))
+    time_slots = _columns(
+        TIME_SLOT_FIELDS, querysets["time_slots"].order_by("start_datetime").values_list(*TIME_SLOT_FIELDS)
+    )
+    time_slots["start_datetime"] = [_datetime_field.to_representation(value) for value in time_slots["start_datetime"]]
+    time_slots["end_datetime"] = [_datetime_field.to_representation(value) for value in time_slots["end_datetime"]]
+    courses = _columns(COURSE_FIELDS, querysets["courses"].order_by("display_id").values_list(*COURSE_FIELDS))
+    course_index = _index(courses["id"])
+    classroom_index = _index(classrooms["id"])
+    time_slot_index = _index(time_slots["id"])
+
+    course_sections = _columns(
+        ("id", "course", "display_id"),
+        querysets["course_sections"].order_by("course__display_id", "display_id").values_list(
+            "id", "course_id", "display_id"
+        ),
+    )
+    course_sections["course"] = [course_index[course_id] for course_id in course_sections["course"]]
+    section_index = _index(course_sections["id"])
+
+    teachers = _columns(
+        TEACHER_FIELDS,
+        querysets["teachers"].order_by("last_name", "first_name", "id").distinct().values_list(*TEACHER_FIELDS),
+    )
+    teacher_index = _index(teachers["id"])
+    course_teachers = {"course": [], "teacher": []}
+    registration_user = {}
+    for course_id, registration_id, user_id in querysets["course_teachers"].values_list(
+        "course_id", "teacher_registration_id", "teacher_registration__user_id"
+    ):
+        registration_user[registration_id] = user_id
+        course_teachers["course"].append(course_index[course_id])
+        course_teachers["teacher"].append(teacher_index[user_id])
+    teacher_availabilities = {"teacher": [], "time_slot": []}
+    for registration_id, time_slot_id in querysets["teacher_availabilities"].filter(
+        registration_id__in=registration_user
+    ).values_list("registration_id", "time_slot_id"):
+        teacher_availabilities["teacher"].append(teacher_index[registration_user[registration_id]])
+        teacher_availabilities["time_slot"].append(time_slot_index[time_slot_id])
+
+    classroom_time_slots = {"id": [], "classroom": [], "time_slot": [], "course_section": [], "schedule_version": []}
+    for classroom_time_slot_id, classroom_id, time_slot_id, section_id, schedule_version in querysets[
+        "classroom_time_slots"
+    ].values_list("id", "classroom_id", "time_slot_id", "course_section_id", "schedule_version"):
+        classroom_time_slots["id"].append(classroom_time_slot_id)
+        classroom_time_slots["classroom"].append(classroom_index[classroom_id])
+        classroom_time_slots["time_slot"].append(time_slot_index[time_slot_id])
+        classroom_time_slots["course_section"].append(section_index.get(section_id))
+        classroom_time_slots["schedule_version"].append(schedule_version)
+
+    tables = {
+        "classrooms": classrooms,
+        "time_slots": time_slots,
+        "courses": courses,
+        "course_sections": course_sections,
+        "teachers": teachers,
+        "course_teachers": course_teachers,
+        "teacher_availabilities": teacher_availabilities,
+        "classroom_time_slots": classroom_time_slots,
+    }
+    for table in tables.values():
+        if "id" in table:
+            table["id"] = [str(id_) for id_ in table["id"]]
+    return dict(tables, version=version)
@@ -0,0 +1,303 @@
+"""
+Automatic placement of course sections into classrooms.
+
+A program is loaded into an integer-indexed in-memory model with a handful of queries, sections are placed greedily
+(most constrained first) into contiguous runs of free ClassroomTimeSlots, and the result is written with one bulk
+update. Sets of time slots are bitsets over the program's slots (see esp.time_slot_bitsets), so checking a room,
+the teachers and a run of slots against each other is a few bitwise operations.
+"""
+import datetime
+
+from esp.constants import CourseStatus
+from esp.models.course_scheduling_models import ClassroomConstraint, ClassroomTimeSlot, CourseSection
+from esp.models.program_models import Classroom
+from esp.models.program_registration_models import CourseTeacher, TeacherAvailability
+from esp.schedule_changes import assign_classroom_time_slots
+from esp.time_slot_bitsets import TimeSlotBitsets, lowest_slot
+
+
+class ScheduleSnapshot:
+    """
+    Integer-indexed copy of everything the scheduler needs to know about a program.
+
+    Time slots, classrooms, courses, sections and teachers are each numbered from 0 so that placement can run on plain
+    lists of ints and bitsets. The ``*_ids`` lists map indexes back to database ids.
+    """
+
+    def __init__(self, program_id, slot_ids, slot_continues, room_ids, room_capacity, room_tags, room_free, cell_ids,
+                 cell_versions, section_ids, section_course, section_length, section_size, course_teachers,
+                 teacher_available, teacher_busy, course_required_tags, course_same_categories,
+                 course_different_categories, course_rooms, unscheduled_sections, cell_sections):
+        self.program_id = program_id
+        self.slot_ids = slot_ids  #: TimeSlot id for each slot index, in chronological order
+        self.slot_continues = slot_continues  #: bitset of slots directly followed by the next slot
+        self.room_ids = room_ids  #: Classroom id for each room index
+        self.room_capacity = room_capacity  #: max_occupants of each room
+        self.room_tags = room_tags  #: {category: frozenset of ClassroomTag ids} for each room
+        self.room_free = room_free  #: bitset of each room's reserved, unassigned slots
+        self.cell_ids = cell_ids  #: ClassroomTimeSlot id for each (room index, slot index) pair
+        self.cell_versions = cell_versions  #: schedule_version of each ClassroomTimeSlot id when loaded
+        self.section_ids = section_ids  #: CourseSection id for each section index
+        self.section_course = section_course  #: course index for each section index
+        self.section_length = section_length  #: time_slots_per_session of each section's course
+        self.section_size = section_size  #: max_section_size of each section's course
+        self.course_teachers = course_teachers  #: teacher indexes of each course
+        self.teacher_available = teacher_available  #: bitset of slots each teacher is available for
+        self.teacher_busy = teacher_busy  #: bitset of slots each teacher already teaches in
+        self.course_required_tags = course_required_tags  #: ClassroomTag ids every room of each course must have
+        #: tag categories in which all rooms of each course must have the same tags
+        self.course_same_categories = course_same_categories
+        #: tag categories in which no two rooms of each course may share a tag
+        self.course_different_categories = course_different_categories
+        self.course_rooms = course_rooms  #: set of room indexes each course is already scheduled in
+        self.unscheduled_sections = unscheduled_sections  #: indexes of sections with no ClassroomTimeSlot yet
+        self.cell_sections = cell_sections  #: CourseSection id assigned to each assigned (room index, slot index) pair
+        self.all_slots = (1 << len(slot_ids)) - 1
+
+    @classmethod
+    def load(cls, program):
+        """Load a program's scheduling inputs with one query each for slots, rooms, tags, sections, teachers,
+        teacher availability and classroom constraints."""
+        slots = list(program.time_slots.order_by("start_datetime").values_list("id", "start_datetime", "end_datetime"))
+        bitsets = TimeSlotBitsets(program.id, [slot_id for slot_id, _start, _end in slots])
+        slot_index = {slot_id: index for index, slot_id in enumerate(bitsets.slot_ids)}
+        # Same rule as esp.section_meetings uses to merge consecutive slots into one meeting
+        gap = datetime.timedelta(minutes=program.time_block_minutes - 1)
+        slot_continues = 0
+        for index in range(len(slots) - 1):
+            if slots[index + 1][1] <= slots[index][2] + gap:
+                slot_continues |= 1 << index
+
+        room_ids = []
+        room_index = {}
+        room_free = []
+        cell_ids = {}
+        cell_versions = {}
+        cell_sections = {}
+        section_cells = {}
+        for cell_id, classroom_id, slot_id, section_id, version in ClassroomTimeSlot.objects.filter(
+            time_slot__program_id=program.id
+        ).order_by("classroom_id").values_list(
+            "id", "classroom_id", "time_slot_id", "course_section_id", "schedule_version"
+        ):
+            if classroom_id not in room_index:
+                room_index[classroom_id] = len(room_ids)
+                room_ids.append(classroom_id)
+                room_free.append(0)
+            room = room_index[classroom_id]
+            cell_ids[(room, slot_index[slot_id])] = cell_id
+            cell_versions[cell_id] = version
+            if section_id is None:
+                room_free[room] |= bitsets.bit_of[slot_id]
+            else:
+                cell_sections[(room, slot_index[slot_id])] = section_id
+                section_cells.setdefault(section_id, []).append((room, bitsets.bit_of[slot_id]))
+
+        room_capacity = [0] * len(room_ids)
+        for classroom_id, max_occupants in Classroom.objects.filter(id__in=room_ids).values_list("id", "max_occupants"):
+            room_capacity[room_index[classroom_id]] = max_occupants
+        room_tags = [{} for _ in room_ids]
+        for classroom_id, tag_id, category in Classroom.tags.through.objects.filter(
+            classroom_id__in=room_ids
+        ).values_list("classroom_id", "classroomtag_id", "classroomtag__tag_category"):
+            tags = room_tags[room_index[classroom_id]]
+            tags[category] = tags.get(category, frozenset()) | {tag_id}
+
+        section_ids = []
+        section_course = []
+        section_length = []
+        section_size = []
+        course_index = {}
+        for section_id, course_id, length, size in (
+            CourseSection.objects.filter(course__program_id=program.id, course__status=CourseStatus.accepted)
+            .order_by("course_id", "display_id")
+            .values_list("id", "course_id", "course__time_slots_per_session", "course__max_section_size")
+        ):
+            section_ids.append(section_id)
+            section_course.append(course_index.setdefault(course_id, len(course_index)))
+            section_length.append(length)
+            section_size.append(size)
+
+        teacher_index = {}
+        course_teachers = [[] for _ in course_index]
+        for course_id, registration_id in CourseTeacher.objects.filter(
+            course_id__in=course_index
+        ).values_list("course_id", "teacher_registration_id"):
+            teacher = teacher_index.setdefault(registration_id, len(teacher_index))
+            course_teachers[course_index[course_id]].append(teacher)
+        available = {}
+        for registration_id, slot_id in TeacherAvailability.objects.filter(
+            registration_id__in=teacher_index, time_slot__program_id=program.id
+        ).values_list("registration_id", "time_slot_id"):
+            available[registration_id] = available.get(registration_id, 0) | bitsets.bit_of[slot_id]
+        # Teachers who never entered their availability are not held to it
+        teacher_available = [available.get(registration_id, bitsets.all_slots) for registration_id in teacher_index]
+
+        course_required_tags = [set() for _ in course_index]
+        course_same_categories = [set() for _ in course_index]
+        course_different_categories = [set() for _ in course_index]
+        constraints = ClassroomConstraint.course.through.objects.filter(course_id__in=course_index)
+        for course_id, required_tag_id, same_category, different_category in constraints.values_list(
+            "course_id", "classroomconstraint__required_classroom_tag_id",
+            "classroomconstraint__require_all_tags_same_category",
+            "classroomconstraint__require_all_tags_different_category",
+        ):
+            course = course_index[course_id]
+            if required_tag_id:
+                course_required_tags[course].add(required_tag_id)
+            if same_category:
+                course_same_categories[course].add(same_category)
+            if different_category:
+                course_different_categories[course].add(different_category)
+
+        teacher_busy = [0] * len(teacher_index)
+        course_rooms = [set() for _ in course_index]
+        unscheduled_sections = []
+        for section, section_id in enumerate(section_ids):
+            if section_id not in section_cells:
+                unscheduled_sections.append(section)
+                continue
+            course = section_course[section]
+            for room, bit in section_cells[section_id]:
+                course_rooms[course].add(room)
+                for teacher in course_teachers[course]:
+                    teacher_busy[teacher] |= bit
+
+        return cls(
+            program.id, bitsets.slot_ids, slot_continues, room_ids, room_capacity, room_tags, room_free, cell_ids,
+            cell_versions, section_ids, section_course, section_length, section_size, course_teachers,
+            teacher_available, teacher_busy, [frozenset(tags) for tags in course_required_tags], course_same_categories,
+            course_different_categories, course_rooms, unscheduled_sections, cell_sections,
+        )
+
+    def run_starts(self, length):
+        """Bitset of the slots that begin ``length`` contiguous slots."""
+        starts = self.all_slots
+        for offset in range(length - 1):
+            starts &= self.slot_continues >> offset
+        return starts
+
+
+def free_run_starts(free, length, valid_starts):
+    """Bitset of the starts of ``length``-slot runs that lie entirely inside ``free``."""
+    starts = free & valid_starts
+    for offset in range(1, length):
+        starts &= free >> offset
+    return starts
+
+
+def schedule_sections(snapshot):
+    """
+    Place every unscheduled section into one classroom for a run of ``time_slots_per_session`` contiguous free slots,
+    during which all of its teachers are available and not teaching elsewhere. Rooms must seat the course's
+    max_section_size and satisfy its ClassroomConstraint tag rules. Sections with the fewest possible placements
+    go first, each into the smallest room that fits, at the earliest possible time.
+    Returns (placements, unplaced): (section index, room index, first slot index) triples and a
+    {section index: reason} dict.
+    """
+    room_free = list(snapshot.room_free)
+    teacher_busy = list(snapshot.teacher_busy)
+    course_rooms = [set(rooms) for rooms in snapshot.course_rooms]
+    rooms_by_capacity = sorted(range(len(snapshot.room_ids)), key=lambda room: snapshot.room_capacity[room])
+    valid_starts = {}
+
+    def teacher_slots(course):
+        slots = snapshot.all_slots
+        for teacher in snapshot.course_teachers[course]:
+            slots &= snapshot.teacher_available[teacher] & ~teacher_busy[teacher]
+        return slots
+
+    def room_allowed(course, room):
+        tags = snapshot.room_tags[room]
+        all_tags = frozenset().union(*tags.values())
+        if not snapshot.course_required_tags[course] <= all_tags:
+            return False
+        for category in snapshot.course_same_categories[course]:
+            if any(snapshot.room_tags[used].get(category) != tags.get(category) for used in course_rooms[course]):
+                return False
+        for category in snapshot.course_different_categories[course]:
+            room_category_tags = tags.get(category, frozenset())
+            if any(room_category_tags & snapshot.room_tags[used].get(category, frozenset())
+                   for used in course_rooms[course]):
+                return False
+        return True
+
+    def candidate_starts(section):
+        """Yield (room, starts bitset) for every room with at least one possible placement, smallest room first."""
+        course = snapshot.section_course[section]
+        length = snapshot.section_length[section]
+        if length not in valid_starts:
+            valid_starts[length] = snapshot.run_starts(length)
+        available = teacher_slots(course)
+        for room in rooms_by_capacity:
+            if snapshot.room_capacity[room] < snapshot.section_size[section] or not room_allowed(course, room):
+                continue
+            starts = free_run_starts(room_free[room] & available, length, valid_starts[length])
+            if starts:
+                yield room, starts
+
+    def unplaced_reason(section):
+        course = snapshot.section_course[section]
+        rooms = [room for room in rooms_by_capacity if snapshot.room_capacity[room] >= snapshot.section_size[section]]
+        if not rooms:
+            return "No classroom is large enough"
+        rooms = [room for room in rooms if room_allowed(course, room)]
+        if not rooms:
+            return "No large enough classroom satisfies the course's classroom constraints"
+        if not teacher_slots(course):
+            return "The teachers have no available time left"
+        return "No suitable classroom is free while the teachers are available"
+
+    def placement_count(section):
+        return sum(bin(starts).count("1") for _room, starts in candidate_starts(section))
+
+    placements = []
+    unplaced = {}
+    order = sorted(
+        snapshot.unscheduled_sections,
+        key=lambda section: (
+            placement_count(section), -snapshot.section_length[section], -snapshot.section_size[section]
+        ),
+    )
+    for section in order:
+        room, starts = next(candidate_starts(section), (None, 0))
+        if room is None:
+            unplaced[section] = unplaced_reason(section)
+            continue
+        start = lowest_slot(starts)
+        run = ((1 << snapshot.section_length[section]) - 1) << start
+        room_free[room] &= ~run
+        course = snapshot.section_course[section]
+        for teacher in snapshot.course_teachers[course]:
+            teacher_busy[teacher] |= run
+        course_rooms[course].add(room)
+        placements.append((section, room, start))
+    return placements, unplaced
+
+
+def save_schedule(snapshot, placements):
+    """
+    Assign the ClassroomTimeSlots of every placement in bulk. Raises ScheduleConflictError, leaving everything
+    unchanged, if any of them changed after the snapshot was loaded.
+    """
+    assignments = []
+    for section, room, start in placements:
+        for slot in range(start, start + snapshot.section_length[section]):
+            cell_id = snapshot.cell_ids[(room, slot)]
+            assignments.append((cell_id, snapshot.section_ids[section], snapshot.cell_versions[cell_id]))
+    assign_classroom_time_slots(snapshot.program_id, assignments)
+
+
+def schedule_program(program, commit=True):
+    """
+    Place all of a program's unscheduled accepted sections, saving the result unless ``commit`` is False.
+    Returns a dict with the placed section ids and a {section id: reason} dict of sections that could not be placed.
+    """
+    snapshot = ScheduleSnapshot.load(program)
+    placements, unplaced = schedule_sections(snapshot)
+    if commit:
+        save_schedule(snapshot, placements)
+    return {
+        "placed": [snapshot.section_ids[section] for section, _room, _start in placements],
+        "unplaced": {snapshot.section_ids[section]: reason for section, reason in unplaced.items()},
+    }
@@ -0,0 +1,89 @@
+"""
+SectionMeetings, the meetings of each CourseSection merged from its ClassroomTimeSlots, so that listing the times and
+rooms of many sections is a single query instead of loading and merging every section's ClassroomTimeSlots.
+
+Whatever changes which section a ClassroomTimeSlot is assigned to rebuilds the meetings of the sections it was and is
+assigned to: ClassroomTimeSlot.save and delete do so themselves, bulk writers call rebuild_section_meetings (or
+esp.schedule_changes.resync_schedules). SectionMeetings keep no history, as the ClassroomTimeSlots they are built from
+do.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection
+
+from esp.models.course_scheduling_models import ClassroomTimeSlot, SectionMeeting
+
+#: most SectionMeetings inserted, and sections whose meetings are deleted, per statement
+BULK_BATCH_SIZE = 1000
+
+
+def merge_section_meetings(rows):
+    """
+    Merge (course_section_id, classroom_id, start_datetime, end_datetime, time_block_minutes) rows, sorted by section
+    and start, into the same tuples without time_block_minutes, one per meeting. A section's consecutive rows are one
+    meeting while they are in the same classroom and each starts within a time block of the previous one's end.
+    """
+    meeting = None
+    for section_id, classroom_id, start, end, time_block_minutes in rows:
+        if (
+            meeting and meeting[0] == section_id and meeting[1] == classroom_id
+            and start <= meeting[3] + timedelta(minutes=time_block_minutes - 1)
+        ):
+            meeting[3] = end
+            continue
+        if meeting:
+            yield tuple(meeting)
+        meeting = [section_id, classroom_id, start, end]
+    if meeting:
+        yield tuple(meeting)
+
+
+def _delete_section_meetings(section_ids):
+    # Like esp.classroom_availability's raw DELETE, so that rebuilding never loads the meetings it replaces
+    section_id_field = SectionMeeting._meta.get_field("course_section")
+    table = connection.ops.quote_name(SectionMeeting._meta.db_table)
+    column = connection.ops.quote_name(section_id_field.column)
+    with connection.cursor() as cursor:
+        for start in range(0, len(section_ids), BULK_BATCH_SIZE):
+            chunk = section_ids[start:start + BULK_BATCH_SIZE]
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {column} IN ({', '.join(['%s'] * len(chunk))})",
+                [section_id_field.get_db_prep_value(section_id, connection) for section_id in chunk],
+            )
+
+
+def rebuild_section_meetings(section_ids):
+    """Replace the SectionMeetings of these CourseSections (None is ignored) with their current ClassroomTimeSlots'."""
+    section_ids = set(section_ids) - {None}
+    if not section_ids:
+        return
+    _delete_section_meetings(list(section_ids))
+    rows = ClassroomTimeSlot.objects.filter(course_section_id__in=section_ids).order_by(
+        "course_section_id", "time_slot__start_datetime"
+    ).values_list(
+        "course_section_id", "classroom_id", "time_slot__start_datetime", "time_slot__end_datetime",
+        "course_section__course__program__time_block_minutes",
+    )
+    SectionMeeting.objects.bulk_create(
+        [
+            SectionMeeting(course_section_id=section_id, classroom_id=classroom_id, start_datetime=start,
+                           end_datetime=end)
+            for section_id, classroom_id, start, end in merge_section_meetings(rows)
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+
+def program_section_meetings(program_id):
+    """
+    Return {course_section_id: [(start, end, classroom name), ...]} for all scheduled sections of the program, in the
+    form of CourseSection.get_section_times, with one query.
+    """
+    meetings = defaultdict(list)
+    for section_id, start, end, classroom_name in SectionMeeting.objects.filter(
+        course_section__course__program_id=program_id
+    ).order_by("start_datetime").values_list("course_section_id", "start_datetime", "end_datetime", "classroom__name"):
+        meetings[section_id].append((start, end, classroom_name))
+    meetings.default_factory = None
+    return meetings
@@ -113,6 +113,7 @@ class ClassroomTimeSlotSerializer(serializers.ModelSerializer):
             "course_section_id",
             "end_datetime",
             "id",
+            "schedule_version",
             "start_datetime",
             "time_slot_id",
         )
@@ -128,21 +129,25 @@ class CourseSerializer(serializers.ModelSerializer):
             "admin_notes",
             "description",
             "display_id",
-            "end_date",
             "id",
             "name",
             "sections",
             "sections_count",
             "sessions_per_week",
-            "start_date",
             "teacher_notes",
             "time_slots_per_session",
         )
 
 
 class TimeSlotSerializer(serializers.ModelSerializer):
-    # what kwargs? "course_teacher_availabilities"
-    course_teacher_availabilities = serializers.JSONField()
+    """
+    Expects the program's ``course_teacher_availability`` map (see esp.course_teacher_availability) in the context;
+    each time slot gets its {course_id: [user_id, ...]} entry.
+    """
+    course_teacher_availabilities = serializers.SerializerMethodField()
+
+    def get_course_teacher_availabilities(self, time_slot):
+        return self.context["course_teacher_availability"]["time_slots"].get(str(time_slot.id), {})
 
     class Meta:
         model = TimeSlot
@@ -167,6 +172,7 @@ class TeacherAvailabilitySerializer(serializers.ModelSerializer):
 class AssignClassroomTimeSlotSerializer(serializers.Serializer):
     classroom_time_slot_id = serializers.UUIDField(required=True)
     course_section_id = serializers.UUIDField(allow_null=True, required=True)
+    expected_version = serializers.IntegerField(allow_null=True, required=False)
 
 
 class UserSerializer(serializers.ModelSerializer):
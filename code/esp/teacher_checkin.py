@@ -0,0 +1,78 @@
+"""
+Rosters for checking teachers in: every section meeting starting on a day of a program, with the teachers of the
+section's course.
+
+A day's roster is built from one query joining SectionMeetings to their course's teachers and cached for
+CACHE_TIMEOUT seconds, as volunteers keep refreshing the check-in pages while schedules rarely change on program day.
+Which teachers are checked in is not cached but read with one more query on every page load, so a check-in shows up
+right away.
+"""
+import datetime
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from esp.models.course_scheduling_models import SectionMeeting
+from esp.models.program_registration_models import TeacherRegistration
+
+#: seconds a built roster is used before the schedule is read again
+CACHE_TIMEOUT = 30
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def build_teacher_checkin_roster(program_id, day):
+    """
+    Return the program's section meetings starting on ``day`` (a date in the current time zone), ordered by start and
+    classroom, as [{"course", "classroom", "start_datetime", "teachers": [{"id", "first_name", "last_name",
+    "cell_phone"}]}], where "id" is the TeacherRegistration id.
+    """
+    teacher = "course_section__course__course_teachers__teacher_registration"
+    meetings = {}
+    for (
+        meeting_id, course_name, classroom_name, start, registration_id, first_name, last_name, cell_phone
+    ) in SectionMeeting.objects.filter(
+        course_section__course__program_id=program_id,
+        start_datetime__gte=_day_start(day),
+        start_datetime__lt=_day_start(day + datetime.timedelta(days=1)),
+    ).order_by("start_datetime", "classroom__name", "id", f"{teacher}__user__last_name").values_list(
+        "id", "course_section__course__name", "classroom__name", "start_datetime", f"{teacher}_id",
+        f"{teacher}__user__first_name", f"{teacher}__user__last_name", f"{teacher}__user__teacher_profile__cell_phone",
+    ):
+        meeting = meetings.setdefault(meeting_id, {
+            "course": course_name, "classroom": classroom_name, "start_datetime": start, "teachers": [],
+        })
+        if registration_id is not None:
+            meeting["teachers"].append({
+                "id": registration_id, "first_name": first_name, "last_name": last_name, "cell_phone": cell_phone,
+            })
+    return list(meetings.values())
+
+
+def teacher_checkin_roster(program_id, day, start_datetime=None):
+    """
+    The program's cached roster for ``day``, or only the meetings starting at ``start_datetime`` if given, with
+    "checked_in" set on each teacher if they were checked in today.
+    """
+    key = f"teacher_checkin_roster:{program_id}:{day.isoformat()}"
+    roster = cache.get(key)
+    if roster is None:
+        roster = build_teacher_checkin_roster(program_id, day)
+        cache.set(key, roster, CACHE_TIMEOUT)
+    if start_datetime is not None:
+        roster = [meeting for meeting in roster if meeting["start_datetime"] == start_datetime]
+
+    checked_in_ids = set(TeacherRegistration.objects.filter(
+        program_id=program_id, checked_in_at__gte=_day_start(timezone.localdate())
+    ).values_list("id", flat=True))
+    return [
+        {
+            **meeting,
+            "teachers": [
+                {**teacher, "checked_in": teacher["id"] in checked_in_ids} for teacher in meeting["teachers"]
+            ],
+        }
+        for meeting in roster
+    ]
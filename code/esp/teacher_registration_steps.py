@@ -0,0 +1,82 @@
+"""
+Which of a program's TeacherProgramRegistrationSteps each TeacherRegistration can see: the completed steps that are
+displayed after completion, and the incomplete steps up to and including the first one required for the next step.
+Steps are only accessible between their access dates, unless the registration's deadlines are overridden.
+
+registration_steps() reads the steps and completions of one registration with a single query;
+program_registration_steps() does the same for every registration of a program with a fixed number of queries.
+"""
+import copy
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from esp.models.program_models import TeacherProgramRegistrationStep
+from esp.models.program_registration_models import CompletedTeacherRegistrationStep
+
+
+def _visible_steps(steps, completed_step_ids, ignore_deadlines, now):
+    """The visible ones of the program's ``steps`` (in order), each with ``completed`` set."""
+    if not ignore_deadlines:
+        steps = [step for step in steps if step.access_start_date < now < step.access_end_date]
+    required_orders = [
+        step._order for step in steps if step.id not in completed_step_ids and step.required_for_next_step
+    ]
+    last_visible_order = min(required_orders) if required_orders else None
+    visible_steps = []
+    for step in steps:
+        step.completed = step.id in completed_step_ids
+        if step.completed:
+            visible = step.display_after_completion
+        else:
+            visible = last_visible_order is None or step._order <= last_visible_order
+        if visible:
+            visible_steps.append(step)
+    return visible_steps
+
+
+def registration_steps(registration):
+    """
+    Return the registration's visible steps, in order and each with ``completed`` set, and the ids of all the steps
+    it completed, with one query.
+    """
+    steps = list(TeacherProgramRegistrationStep.objects.filter(program_id=registration.program_id).annotate(
+        completed=Exists(CompletedTeacherRegistrationStep.objects.filter(
+            registration_id=registration.id, step_id=OuterRef("id")
+        ))
+    ))
+    completed_step_ids = {step.id for step in steps if step.completed}
+    return (
+        _visible_steps(steps, completed_step_ids, registration.ignore_registration_deadlines(), timezone.now()),
+        completed_step_ids,
+    )
+
+
+def program_registration_steps(program, registrations=None):
+    """
+    {registration id: (visible steps, ids of completed steps)} for the ``registrations`` queryset of the program's
+    TeacherRegistrations, or for all of them, with three queries. Each registration gets its own step instances.
+    """
+    if registrations is None:
+        registrations = program.teacher_registrations.all()
+    steps = list(program.teacher_registration_steps.all())
+    completed_steps = {}  # registration id -> ids of its completed steps
+    for registration_id, step_id in CompletedTeacherRegistrationStep.objects.filter(
+        registration__in=registrations, step__program=program
+    ).values_list("registration_id", "step_id"):
+        completed_steps.setdefault(registration_id, set()).add(step_id)
+
+    now = timezone.now()
+    steps_by_registration = {}
+    for registration in registrations.only(
+        "id", "program_id", "allow_early_registration_after", "allow_late_registration_until"
+    ):
+        completed_step_ids = completed_steps.get(registration.id, set())
+        steps_by_registration[registration.id] = (
+            _visible_steps(
+                [copy.copy(step) for step in steps], completed_step_ids,
+                registration.ignore_registration_deadlines(), now,
+            ),
+            completed_step_ids,
+        )
+    return steps_by_registration
@@ -1,3 +1,2073 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import itertools
+import json
+import random
+from collections import Counter
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+import pytz
+from django.apps import apps
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Count, Min, Value
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from common.constants import UserType
+from common.factories import UserFactory
+from esp import placement_suggestions
+from esp.admin import ClassroomAdmin, ClassroomTimeSlotAdmin
+from esp.checkin import check_in_student, checkin_roster_rows, refresh_checkin_readiness, sync_check_ins
+from esp.classroom_availability import availability_pattern, classroom_availability, set_classroom_availability
+from esp.conflict_report import schedule_conflict_report
+from esp.constants import (CheckinSyncResult, CourseStatus, FormIntegration, LotteryJobStatus, LotteryMode,
+                           LotteryPhase, MITAffiliation, ScheduleConflictType, TeacherRegistrationStepType)
+from esp.course_teacher_availability import course_teacher_availability
+from esp.factories.course_scheduling_factories import ClassroomTimeSlotFactory, CourseSectionFactory
+from esp.factories.program_factories import (ClassPreferenceFactory, ClassroomFactory, ClassroomTagFactory,
+                                             CourseFactory, CourseTeacherFactory, PreferenceEntryCategoryFactory,
+                                             ProgramFactory, StudentRegistrationFactory, TeacherAvailabilityFactory,
+                                             TeacherRegistrationFactory, TimeSlotFactory)
+from esp.factories.synthetic_programs import create_synthetic_program
+from esp.forms import AssignClassroomTimeSlotsForm, ProgramLotteryForm, StudentSendEmailForm
+from esp.lottery import (LOTTERY_JOB_TIMEOUT, LotteryDisallowedError, LotterySnapshot, _MinCostFlow,
+                         cancel_lottery_job, diff_lottery_runs, enqueue_lottery_job, fail_stale_lottery_jobs,
+                         match_decomposed, match_greedy, match_weighted, overflow_waitlists, roll_back_lottery_run,
+                         run_incremental_lottery, run_next_lottery_job, run_program_lottery, simulate_program_lottery)
+from esp.management.commands.benchmark_classroom_availability import Command as BenchmarkClassroomAvailability
+from esp.management.commands.benchmark_lottery import parse_scale
+from esp.management.commands.benchmark_registration_stages import Command as BenchmarkRegistrationStages
+from esp.models.course_scheduling_models import ClassroomConstraint, ClassroomTimeSlot, CourseSection, SectionMeeting
+from esp.models.program_models import Classroom, ExternalProgramForm, PurchaseableItem, TeacherProgramRegistrationStep
+from esp.models.program_registration_models import (ClassPreference, ClassRegistration, CompletedStudentForm,
+                                                    CompletedTeacherRegistrationStep, CourseTeacher, PurchaseLineItem,
+                                                    StudentAvailability, StudentRegistration, TeacherAvailability,
+                                                    TeacherProfile, TeacherRegistration, WaitlistEntry)
+from esp.move_impact import section_move_impact
+from esp.placement_suggestions import PlacementIndex, placement_index
+from esp.registration_stages import program_registration_stages, registration_program_stage
+from esp.schedule_changes import (ScheduleConflictError, assign_classroom_time_slots, schedule_changes,
+                                  schedule_versions)
+from esp.scheduling import ScheduleSnapshot, schedule_program, schedule_sections
+from esp.section_meetings import program_section_meetings, rebuild_section_meetings
+from esp.serializers import UserSerializer
+from esp.teacher_checkin import teacher_checkin_roster
+from esp.teacher_registration_steps import program_registration_steps, registration_steps
+from esp.time_slot_bitsets import TimeSlotBitsets, lowest_slot
+from esp.views.student_registration_views import EditAssignedCoursesView
+from esp.waitlists import promote_from_waitlist
+
+_usernames = itertools.count()
+
+START = datetime.datetime(2030, 11, 16, 9, 0, 0, tzinfo=pytz.UTC)
+
+
+def create_program(slot_count):
+    """A program with ``slot_count`` consecutive one-hour time slots. Returns the program and its slots."""
+    program = ProgramFactory(start_date=START, end_date=START + datetime.timedelta(days=1), number_of_weeks=1)
+    slots = [
+        TimeSlotFactory(
+            program=program,
+            start_datetime=START + datetime.timedelta(hours=index),
+            end_datetime=START + datetime.timedelta(hours=index, minutes=50),
+        )
+        for index in range(slot_count)
+    ]
+    return program, slots
+
+
+def create_section(program, slots, max_section_size=1, course=None, classroom=None):
+    """A section of ``course`` (or of a new course) booked in ``classroom`` (or a new one) for ``slots``."""
+    if course is None:
+        course = CourseFactory(
+            program=program, max_section_size=max_section_size, time_slots_per_session=max(len(slots), 1)
+        )
+    section = CourseSectionFactory(course=course, display_id=course.sections.count() + 1)
+    classroom = classroom or ClassroomFactory(max_occupants=30)
+    for slot in slots:
+        ClassroomTimeSlotFactory(classroom=classroom, time_slot=slot, course_section=section)
+    return section
+
+
+def create_student(program, preferences=(), category=None):
+    """A student registration with one ClassPreference for each of ``preferences``."""
+    registration = StudentRegistrationFactory(program=program, user=UserFactory(username=f"student-{next(_usernames)}"))
+    for section in preferences:
+        if category is None:
+            ClassPreferenceFactory(registration=registration, course_section=section)
+        else:
+            ClassPreferenceFactory(registration=registration, course_section=section, category=category)
+    return registration
+
+
+class LotteryTestCase(TestCase):
+    def assertValidMatches(self, snapshot, matches):
+        """No section over capacity, one section per course and slot per student, and only where preferred."""
+        preferred = {(student, section) for student, section, _weight in snapshot.preferences}
+        enrollment = [0] * len(snapshot.section_ids)
+        busy = [0] * len(snapshot.student_ids)
+        courses = [set() for _ in snapshot.student_ids]
+        for student, section in list(snapshot.assignments) + list(matches):
+            enrollment[section] += 1
+            course = snapshot.section_course[section]
+            footprint = snapshot.section_footprints[section]
+            self.assertNotIn(course, courses[student])
+            self.assertFalse(busy[student] & footprint)
+            courses[student].add(course)
+            busy[student] |= footprint
+        for student, section in matches:
+            self.assertIn((student, section), preferred)
+            self.assertEqual(
+                snapshot.section_footprints[section] & ~snapshot.student_availability[student], 0
+            )
+        for section, count in enumerate(enrollment):
+            self.assertLessEqual(count, snapshot.section_capacity[section])
+
+
+class LotterySnapshotTests(LotteryTestCase):
+    def setUp(self):
+        self.program, self.slots = create_program(3)
+
+    def test_load_skips_deleted_preferences_and_other_programs(self):
+        section = create_section(self.program, self.slots[:1])
+        other_program, other_slots = create_program(1)
+        other_section = create_section(other_program, other_slots)
+        student = create_student(self.program, [section])
+        student.preferences.update(is_deleted=True)
+        create_student(self.program, [section])
+        create_student(other_program, [other_section])
+
+        snapshot = LotterySnapshot.load(self.program)
+
+        self.assertEqual(snapshot.section_ids, [section.id])
+        self.assertEqual(len(snapshot.student_ids), 1)
+        self.assertNotIn(student.id, snapshot.student_ids)
+        self.assertEqual(len(snapshot.preferences), 1)
+        self.assertEqual(snapshot.section_footprints, [1])
+
+    def test_capacity_holds_across_every_slot_of_a_section(self):
+        # Placing per time slot used to fill a two-slot section once for each of its slots
+        section = create_section(self.program, self.slots[:2], max_section_size=1)
+        for _ in range(3):
+            create_student(self.program, [section])
+
+        lottery_run = run_program_lottery(self.program, seed=1)
+
+        self.assertEqual(lottery_run.placed_count, 1)
+        self.assertEqual(ClassRegistration.objects.filter(course_section=section).count(), 1)
+
+    def test_greedy_skips_courses_taken_conflicts_and_unavailable_slots(self):
+        morning = create_section(self.program, self.slots[:1], max_section_size=5)
+        same_slot = create_section(self.program, self.slots[:1], max_section_size=5)
+        same_course = create_section(self.program, self.slots[1:2], course=morning.course)
+        afternoon = create_section(self.program, self.slots[2:], max_section_size=5)
+        student = create_student(self.program, [morning, same_slot, same_course, afternoon])
+        StudentAvailability.objects.create(registration=student, time_slot=self.slots[0])
+        StudentAvailability.objects.create(registration=student, time_slot=self.slots[1])
+
+        snapshot = LotterySnapshot.load(self.program)
+        matches = match_greedy(snapshot, seed=3)
+
+        self.assertValidMatches(snapshot, matches)
+        placed = {snapshot.section_ids[section] for _student, section in matches}
+        self.assertEqual(len(placed & {morning.id, same_slot.id}), 1)
+        self.assertNotIn(afternoon.id, placed)
+        self.assertEqual(same_course.id in placed, same_slot.id in placed)
+
+    def test_greedy_matches_are_valid_and_reproducible(self):
+        rng = random.Random(7)
+        sections = [
+            create_section(self.program, self.slots[start:start + length], max_section_size=rng.randint(1, 5))
+            for start, length in [(0, 1), (0, 2), (1, 1), (1, 2), (2, 1), (2, 1)]
+        ]
+        for _ in range(20):
+            create_student(self.program, rng.sample(sections, 3))
+        snapshot = LotterySnapshot.load(self.program)
+        for seed in range(3):
+            matches = match_greedy(snapshot, seed=seed)
+            self.assertTrue(matches)
+            self.assertValidMatches(snapshot, matches)
+            self.assertEqual(matches, match_greedy(LotterySnapshot.load(self.program), seed=seed))
+
+    def test_run_program_lottery_writes_registrations_once(self):
+        section = create_section(self.program, self.slots[:1], max_section_size=2)
+        students = [create_student(self.program, [section]) for _ in range(3)]
+
+        lottery_run = run_program_lottery(self.program, seed=5)
+
+        registrations = ClassRegistration.objects.filter(course_section=section)
+        self.assertEqual(registrations.count(), 2)
+        self.assertTrue(all(registration.created_by_lottery for registration in registrations))
+        self.assertTrue(set(registrations.values_list("program_registration_id", flat=True)) <= {
+            student.id for student in students
+        })
+        self.assertEqual(set(registrations.values_list("lottery_run_id", flat=True)), {lottery_run.id})
+        with self.assertRaises(LotteryDisallowedError):
+            run_program_lottery(self.program)
+
+
+def best_total_weight(snapshot):
+    """Brute-force the highest total weight for a snapshot whose sections all share one time slot."""
+    options = [[None] for _ in snapshot.student_ids]
+    for student, section, weight in snapshot.preferences:
+        options[student].append((section, weight))
+    best = 0
+    for choice in itertools.product(*options):
+        taken = [option[0] for option in choice if option is not None]
+        if all(taken.count(section) <= snapshot.section_capacity[section] for section in set(taken)):
+            best = max(best, sum(option[1] for option in choice if option is not None))
+    return best
+
+
+class WeightedLotteryTests(LotteryTestCase):
+    def test_min_cost_flow_reroutes_for_the_cheapest_flow(self):
+        # Sending the first student to the cheapest section first would leave the second one unplaced
+        source, sink, first, second, cheap, other = range(6)
+        flow = _MinCostFlow(6)
+        flow.add_edge(source, first, 1, 0)
+        flow.add_edge(source, second, 1, 0)
+        edges = {
+            (first, cheap): flow.add_edge(first, cheap, 1, -5),
+            (first, other): flow.add_edge(first, other, 1, -4),
+            (second, cheap): flow.add_edge(second, cheap, 1, -4),
+        }
+        flow.add_edge(cheap, sink, 1, 0)
+        flow.add_edge(other, sink, 1, 0)
+
+        flow.augment_negative_paths(source, sink, [0, -5, 0, 0, -5, -4])
+
+        used = {pair for pair, edge in edges.items() if flow.capacity[edge] == 0}
+        self.assertEqual(used, {(first, other), (second, cheap)})
+
+    def test_weighted_matches_maximize_total_weight(self):
+        rng = random.Random(2)
+        for _ in range(30):
+            student_count, section_count = rng.randint(1, 5), rng.randint(1, 3)
+            preferences = [
+                (student, section, rng.randint(1, 9))
+                for student in range(student_count) for section in range(section_count) if rng.random() < 0.6
+            ]
+            snapshot = LotterySnapshot(
+                list(range(student_count)), list(range(section_count)), list(range(section_count)),
+                [rng.randint(1, 2) for _ in range(section_count)], [1] * section_count, [None], preferences, [],
+            )
+            weights = {(student, section): weight for student, section, weight in preferences}
+
+            matches = match_weighted(snapshot, seed=rng.random())
+
+            self.assertValidMatches(snapshot, matches)
+            self.assertEqual(sum(weights[match] for match in matches), best_total_weight(snapshot))
+
+    def test_weighted_matches_are_greedy_across_time_slots(self):
+        # The first slot's group places the student in a two-slot section, which then blocks their heavier preference
+        # for the second slot's section; skipping the first section would have been worth more
+        snapshot = LotterySnapshot([0], [0, 1], [0, 1], [1, 1], [0b11, 0b10], [None, None], [(0, 0, 1), (0, 1, 3)], [])
+
+        self.assertEqual(match_weighted(snapshot, seed=0), [(0, 0)])
+
+    def test_weighted_beats_greedy_on_synthetic_programs(self):
+        program = create_synthetic_program(80, 20, 4, 5, seed=11)
+        snapshot = LotterySnapshot.load(program)
+        weights = {(student, section): weight for student, section, weight in snapshot.preferences}
+        for seed in range(3):
+            matches = match_weighted(snapshot, seed=seed)
+            self.assertValidMatches(snapshot, matches)
+            self.assertGreaterEqual(
+                sum(weights[match] for match in matches),
+                sum(weights[match] for match in match_greedy(snapshot, seed=seed)),
+            )
+
+    def test_preference_weight_is_category_weight_times_value(self):
+        program, slots = create_program(1)
+        section = create_section(program, slots)
+        interested = PreferenceEntryCategoryFactory(lottery_weight=1)
+        starred = PreferenceEntryCategoryFactory(lottery_weight=3)
+        student = create_student(program, [section], category=interested)
+        ClassPreferenceFactory(registration=student, course_section=section, category=starred, value=2)
+        create_student(program, [section], category=interested)
+
+        snapshot = LotterySnapshot.load(program)
+
+        self.assertEqual(
+            sorted(weight for _student, _section, weight in snapshot.preferences), [1, 6]
+        )
+        self.assertEqual(snapshot.top_preferences, {(snapshot.student_ids.index(student.id), 0)})
+
+
+class LotterySimulationTests(LotteryTestCase):
+    def setUp(self):
+        self.program = create_synthetic_program(60, 16, 4, 4, seed=3)
+
+    def test_committing_a_simulated_seed_reproduces_it(self):
+        results = simulate_program_lottery(self.program, mode=LotteryMode.weighted, runs=4, max_workers=1)
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results, sorted(
+            results,
+            key=lambda result: (result["top_choice_rate"], result["fill_rate"], -result["empty_sections"]),
+            reverse=True,
+        ))
+        self.assertFalse(ClassRegistration.objects.filter(course_section__course__program=self.program).exists())
+        lottery_run = run_program_lottery(self.program, mode=LotteryMode.weighted, seed=results[-1]["seed"])
+        self.assertEqual(lottery_run.placed_count, results[-1]["placed"])
+
+    def test_simulation_jobs_store_results_without_writing(self):
+        enqueue_lottery_job(self.program, simulation_runs=3)
+
+        job = run_next_lottery_job()
+
+        self.assertEqual(job.status, LotteryJobStatus.succeeded)
+        self.assertIsNone(job.lottery_run)
+        self.assertEqual(len(job.simulations), 3)
+        self.assertEqual({result["mode"] for result in job.simulations}, {LotteryMode.greedy})
+        self.assertFalse(ClassRegistration.objects.filter(course_section__course__program=self.program).exists())
+
+
+class SyntheticProgramTests(TestCase):
+    def test_synthetic_program_has_the_requested_size(self):
+        program = create_synthetic_program(40, 25, 6, 5, seed=1)
+
+        self.assertEqual(program.time_slots.count(), 6)
+        self.assertEqual(CourseSection.objects.filter(course__program=program).count(), 25)
+        self.assertEqual(StudentRegistration.objects.filter(program=program).count(), 40)
+        preference_counts = ClassPreference.objects.filter(registration__program=program).values(
+            "registration_id"
+        ).annotate(count=Count("id")).values_list("count", flat=True)
+        self.assertEqual(len(preference_counts), 40)
+        self.assertLessEqual(max(preference_counts), 5)
+        for section in CourseSection.objects.filter(course__program=program).select_related("course"):
+            booked = ClassroomTimeSlot.objects.filter(course_section=section).count()
+            self.assertIn(booked, [0, section.course.time_slots_per_session])
+            self.assertEqual(section.meetings.count(), 1 if booked else 0)
+
+    def test_synthetic_programs_are_reproducible(self):
+        first = LotterySnapshot.load(create_synthetic_program(30, 10, 4, 3, seed=5))
+        second = LotterySnapshot.load(create_synthetic_program(30, 10, 4, 3, seed=5))
+        # Ids differ between the two, and so does the order they are loaded in
+        self.assertEqual(sorted(first.section_footprints), sorted(second.section_footprints))
+        self.assertEqual(sorted(first.section_capacity), sorted(second.section_capacity))
+        self.assertEqual(len(first.preferences), len(second.preferences))
+
+    def test_parse_scale(self):
+        self.assertEqual(parse_scale("500x200x10x15"), {
+            "students": 500, "sections": 200, "time_slots": 10, "preferences_per_student": 15,
+        })
+        with self.assertRaises(CommandError):
+            parse_scale("500x200")
+
+
+class IncrementalLotteryTests(LotteryTestCase):
+    def setUp(self):
+        self.program, self.slots = create_program(2)
+        self.popular = create_section(self.program, self.slots[:1], max_section_size=2)
+        self.open = create_section(self.program, self.slots[1:], max_section_size=3)
+        self.students = [create_student(self.program, [self.popular, self.open]) for _ in range(3)]
+        self.lottery_run = run_program_lottery(self.program, seed=1)
+
+    def test_load_counts_seats_held_by_other_students(self):
+        late = create_student(self.program, [self.popular, self.open])
+
+        snapshot = LotterySnapshot.load(self.program, registration_ids=[late.id])
+
+        self.assertEqual(snapshot.student_ids, [late.id])
+        capacities = dict(zip(snapshot.section_ids, snapshot.section_capacity))
+        self.assertEqual(capacities, {self.popular.id: 0, self.open.id: 0})
+
+    def test_places_only_late_registrants_into_open_seats(self):
+        existing = set(ClassRegistration.objects.values_list("id", "program_registration_id", "course_section_id"))
+        self.open.course.update(max_section_size=5)
+        late = [create_student(self.program, [self.popular, self.open]) for _ in range(3)]
+
+        lottery_run = run_incremental_lottery(self.program, seed=2)
+
+        self.assertTrue(lottery_run.incremental)
+        self.assertEqual(lottery_run.student_count, 3)
+        new = ClassRegistration.objects.filter(lottery_run=lottery_run)
+        self.assertEqual(set(new.values_list("course_section_id", flat=True)), {self.open.id})
+        self.assertEqual(new.count(), 2)
+        self.assertTrue(set(new.values_list("program_registration_id", flat=True)) <= {student.id for student in late})
+        self.assertTrue(existing <= set(
+            ClassRegistration.objects.values_list("id", "program_registration_id", "course_section_id")
+        ))
+
+        # Only the student left without a seat is tried again
+        self.assertEqual(run_incremental_lottery(self.program, seed=3).student_count, 1)
+
+    def test_nothing_to_do_without_new_students(self):
+        self.assertIsNone(run_incremental_lottery(self.program))
+
+
+class LotteryRunTests(LotteryTestCase):
+    def setUp(self):
+        self.program = create_synthetic_program(50, 12, 3, 4, seed=9)
+
+    def placements(self, lottery_run):
+        return set(ClassRegistration.objects.filter(lottery_run=lottery_run).values_list(
+            "program_registration_id", "course_section_id"
+        ))
+
+    def test_run_records_its_inputs_and_outputs(self):
+        lottery_run = run_program_lottery(self.program)
+
+        snapshot = LotterySnapshot.load(self.program)
+        self.assertIsNotNone(lottery_run.seed)
+        self.assertEqual(lottery_run.student_count, len(snapshot.student_ids))
+        self.assertEqual(lottery_run.section_count, len(snapshot.section_ids))
+        self.assertEqual(lottery_run.placed_count, len(self.placements(lottery_run)))
+        self.assertEqual(lottery_run.section_placements, {
+            str(section): count
+            for section, count in Counter(section for _student, section in self.placements(lottery_run)).items()
+        })
+        self.assertEqual(lottery_run.waitlisted_count, lottery_run.waitlist_entries.count())
+
+    def test_roll_back_deletes_only_the_runs_rows(self):
+        lottery_run = run_program_lottery(self.program, seed=4)
+        placements = self.placements(lottery_run)
+        student, section = next(iter(placements))
+        ClassRegistration.objects.filter(program_registration_id=student, course_section_id=section).update(
+            lottery_run=None, created_by_lottery=False
+        )
+
+        self.assertEqual(roll_back_lottery_run(lottery_run), len(placements) - 1)
+
+        lottery_run.refresh_from_db()
+        self.assertIsNotNone(lottery_run.rolled_back_on)
+        self.assertEqual(
+            set(ClassRegistration.objects.values_list("program_registration_id", "course_section_id")),
+            {(student, section)},
+        )
+        self.assertFalse(lottery_run.waitlist_entries.exists())
+        with self.assertRaises(LotteryDisallowedError):
+            roll_back_lottery_run(lottery_run)
+
+    def test_same_seed_reproduces_a_rolled_back_run(self):
+        lottery_run = run_program_lottery(self.program, seed=4)
+        placements = self.placements(lottery_run)
+        roll_back_lottery_run(lottery_run)
+
+        self.assertEqual(self.placements(run_program_lottery(self.program, seed=4)), placements)
+
+    def test_diff_counts_placements_per_section(self):
+        # Whoever wins the first section decides whether the course's second section fills
+        program, slots = create_program(2)
+        contested = create_section(program, slots[:1])
+        other = create_section(program, slots[1:], course=contested.course)
+        create_student(program, [contested, other])
+        create_student(program, [contested])
+        first = run_program_lottery(program, seed=1)
+        first_counts = Counter(section for _student, section in self.placements(first))
+        roll_back_lottery_run(first)
+        for seed in range(2, 40):
+            second = run_program_lottery(program, seed=seed)
+            second_counts = Counter(section for _student, section in self.placements(second))
+            if second_counts != first_counts:
+                break
+            roll_back_lottery_run(second)
+        self.assertNotEqual(first_counts, second_counts)
+
+        first.refresh_from_db()
+        with self.assertNumQueries(1):
+            rows = diff_lottery_runs(first, second)
+
+        self.assertEqual({
+            row["course_section_id"]: (row["first_count"], row["second_count"], row["change"]) for row in rows
+        }, {
+            section: (first_counts[section], second_counts[section], second_counts[section] - first_counts[section])
+            for section in set(first_counts) | set(second_counts)
+        })
+        self.assertEqual(
+            [(row["course_section__course__name"], row["course_section__display_id"]) for row in rows],
+            sorted((row["course_section__course__name"], row["course_section__display_id"]) for row in rows),
+        )
+
+
+class LotteryJobTests(TestCase):
+    def setUp(self):
+        self.program, slots = create_program(1)
+        section = create_section(self.program, slots, max_section_size=1)
+        create_student(self.program, [section])
+
+    def test_worker_runs_queued_jobs(self):
+        enqueue_lottery_job(self.program, mode=LotteryMode.weighted, seed=8)
+
+        job = run_next_lottery_job()
+
+        self.assertEqual(job.status, LotteryJobStatus.succeeded)
+        self.assertEqual(job.phase, LotteryPhase.writing)
+        self.assertEqual((job.lottery_run.mode, job.lottery_run.seed), (LotteryMode.weighted, 8))
+        self.assertEqual(job.lottery_run.placed_count, 1)
+        self.assertIsNone(run_next_lottery_job())
+
+    def test_one_pending_job_per_program(self):
+        enqueue_lottery_job(self.program)
+        with self.assertRaises(LotteryDisallowedError):
+            enqueue_lottery_job(self.program, incremental=True)
+        run_next_lottery_job()
+
+        with self.assertRaises(LotteryDisallowedError):
+            enqueue_lottery_job(self.program)
+        enqueue_lottery_job(self.program, incremental=True)
+
+    def test_jobs_fail_when_the_lottery_is_disallowed(self):
+        job = enqueue_lottery_job(self.program)
+        run_program_lottery(self.program)
+
+        job = run_next_lottery_job()
+
+        self.assertEqual(job.status, LotteryJobStatus.failed)
+        self.assertEqual(job.error, "Course assignments already exist")
+        self.assertIsNone(job.lottery_run)
+
+    def test_stale_running_jobs_fail(self):
+        job = enqueue_lottery_job(self.program)
+        job.update(status=LotteryJobStatus.running, started_on=timezone.now() - LOTTERY_JOB_TIMEOUT / 2)
+        self.assertEqual(fail_stale_lottery_jobs(), 0)
+        job.update(started_on=timezone.now() - LOTTERY_JOB_TIMEOUT * 2)
+
+        # Queueing fails the program's stale job rather than refusing
+        enqueue_lottery_job(self.program)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, LotteryJobStatus.failed)
+        self.assertIsNotNone(job.finished_on)
+
+    def test_cancel(self):
+        job = enqueue_lottery_job(self.program)
+
+        cancel_lottery_job(job)
+
+        self.assertIsNone(run_next_lottery_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, LotteryJobStatus.cancelled)
+        with self.assertRaises(LotteryDisallowedError):
+            cancel_lottery_job(job)
+        enqueue_lottery_job(self.program)
+
+
+class ProgramLotteryFormTests(SimpleTestCase):
+    def test_validates_settings(self):
+        form = ProgramLotteryForm({"mode": LotteryMode.weighted, "seed": "", "runs": "20"})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data, {"mode": LotteryMode.weighted, "seed": None, "runs": 20})
+
+        form = ProgramLotteryForm({"mode": "fastest", "seed": "-1", "runs": "1000"})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(set(form.errors), {"mode", "seed", "runs"})
+        self.assertFalse(ProgramLotteryForm({"mode": LotteryMode.greedy, "seed": str(2 ** 63)}).is_valid())
+
+
+class TimeSlotBitsetTests(TestCase):
+    def setUp(self):
+        self.program, self.slots = create_program(4)
+
+    def test_slots_are_numbered_chronologically(self):
+        late = TimeSlotFactory(
+            program=self.program, start_datetime=START - datetime.timedelta(hours=1),
+            end_datetime=START - datetime.timedelta(minutes=10),
+        )
+
+        bitsets = TimeSlotBitsets.for_program(self.program.id)
+
+        self.assertEqual(bitsets.slot_ids, [late.id] + [slot.id for slot in self.slots])
+        self.assertEqual(bitsets.from_slot_ids([late.id, self.slots[1].id]), 0b101)
+        self.assertEqual(bitsets.all_slots, 0b11111)
+        self.assertEqual(lowest_slot(0b10100), 2)
+
+    def test_footprints_and_availability(self):
+        long_section = create_section(self.program, self.slots[1:3])
+        ClassroomTimeSlotFactory(classroom=ClassroomFactory(max_occupants=5), time_slot=self.slots[0],
+                                 course_section=long_section)
+        short_section = create_section(self.program, self.slots[3:])
+        create_section(self.program, [])
+        available = create_student(self.program)
+        create_student(self.program)
+        for slot in self.slots[:2]:
+            StudentAvailability.objects.create(registration=available, time_slot=slot)
+
+        bitsets = TimeSlotBitsets.for_program(self.program.id)
+
+        self.assertEqual(bitsets.section_footprints(), {long_section.id: 0b0111, short_section.id: 0b1000})
+        self.assertEqual(bitsets.student_availability(), {available.id: 0b0011})
+
+    def test_swap_page_flags_conflicts_and_unavailable_slots(self):
+        taken = create_section(self.program, self.slots[:2], max_section_size=5)
+        overlapping = create_section(self.program, self.slots[1:2], max_section_size=5)
+        unavailable = create_section(self.program, self.slots[3:], max_section_size=5)
+        free = create_section(self.program, self.slots[2:3], max_section_size=5)
+        student = create_student(self.program)
+        for slot in self.slots[:3]:
+            StudentAvailability.objects.create(registration=student, time_slot=slot)
+        registration = ClassRegistration.objects.create(
+            course_section=taken, program_registration=student, created_by_lottery=False
+        )
+        view = EditAssignedCoursesView()
+        view.object = student
+
+        flags = {
+            section.id: (section.student_unavailable, section.outside_availability)
+            for section in view.get_available_courses(None)
+        }
+
+        self.assertEqual(flags, {
+            overlapping.id: (True, False), unavailable.id: (False, True), free.id: (False, False),
+        })
+        # Swapping the registration away frees its slots
+        flags = {
+            section.id: section.student_unavailable for section in view.get_available_courses(registration.id)
+        }
+        self.assertFalse(flags[overlapping.id])
+
+
+class WaitlistTests(LotteryTestCase):
+    def test_overflow_waitlists_strongest_preference_first(self):
+        # Section 0 is full; student 3 takes the same course in section 1, and section 2 has seats left
+        snapshot = LotterySnapshot(
+            [10, 11, 12, 13], [20, 21, 22], [0, 0, 1], [1, 1, 5], [1, 2, 1], [None, None],
+            [(0, 0, 1), (1, 0, 3), (2, 0, 2), (3, 0, 9), (3, 1, 1), (0, 2, 1)], [],
+        )
+        matches = [(1, 0), (3, 1)]
+
+        for seed in range(5):
+            self.assertEqual(overflow_waitlists(snapshot, matches, seed=seed), [(2, 0), (0, 0)])
+
+    def test_lottery_waitlists_and_promotion_tags_the_run(self):
+        program, slots = create_program(2)
+        section = create_section(program, slots[:1], max_section_size=1)
+        students = [create_student(program, [section]) for _ in range(4)]
+        lottery_run = run_program_lottery(program, seed=6)
+        placed = ClassRegistration.objects.get(course_section=section)
+        entries = list(WaitlistEntry.objects.filter(course_section=section))
+        self.assertEqual(lottery_run.waitlisted_count, 3)
+        self.assertEqual([entry.position for entry in entries], [1, 2, 3])
+        self.assertEqual({entry.program_registration_id for entry in entries} | {placed.program_registration_id}, {
+            student.id for student in students
+        })
+
+        # The first student waiting is busy at that time, the second already takes the course in another section
+        busy, enrolled, next_in_line = (entry.program_registration for entry in entries)
+        ClassRegistration.objects.create(
+            course_section=create_section(program, slots[:1], max_section_size=1), program_registration=busy,
+            created_by_lottery=False,
+        )
+        ClassRegistration.objects.create(
+            course_section=create_section(program, slots[1:], course=section.course), program_registration=enrolled,
+            created_by_lottery=False,
+        )
+        placed.delete()
+
+        promoted = promote_from_waitlist(section.id)
+
+        self.assertEqual([registration.program_registration_id for registration in promoted], [next_in_line.id])
+        self.assertEqual(promoted[0].lottery_run_id, lottery_run.id)
+        self.assertTrue(promoted[0].created_by_lottery)
+        self.assertEqual(
+            list(section.waitlist_entries.values_list("program_registration_id", flat=True)), [busy.id]
+        )
+        self.assertEqual(promote_from_waitlist(section.id), [])
+
+        roll_back_lottery_run(lottery_run)
+        self.assertFalse(ClassRegistration.objects.filter(course_section=section).exists())
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+
+def create_snapshot(rng, components, students=20, sections=6, slots=4):
+    """A random snapshot made of ``components`` groups of students that prefer only their own group's sections."""
+    student_ids, section_ids, section_course, section_capacity, section_footprints = [], [], [], [], []
+    preferences = []
+    for _component in range(components):
+        first_student, first_section = len(student_ids), len(section_ids)
+        student_ids.extend(range(first_student, first_student + students))
+        for section in range(first_section, first_section + sections):
+            section_ids.append(section)
+            section_course.append(section // 2)
+            section_capacity.append(rng.randint(1, 5))
+            section_footprints.append(1 << rng.randrange(slots))
+        for student in range(first_student, first_student + students):
+            for section in rng.sample(range(first_section, first_section + sections), 3):
+                preferences.append((student, section, rng.randint(1, 3)))
+    return LotterySnapshot(
+        student_ids, section_ids, section_course, section_capacity, section_footprints, [None] * slots, preferences,
+        [],
+    )
+
+
+class DecomposedLotteryTests(LotteryTestCase):
+    def test_split_components(self):
+        # Students 0 and 1 share section 0; student 2 only holds a registration in section 2; student 3 prefers nothing
+        snapshot = LotterySnapshot(
+            [10, 11, 12, 13, 14], [20, 21, 22, 23], [0, 1, 2, 3], [1, 1, 1, 1], [1, 1, 2, 2], [None, None],
+            [(0, 0, 1), (1, 0, 2), (1, 1, 3), (4, 2, 1)], [(2, 2), (3, 3)], frozenset({(1, 1)}),
+        )
+
+        components = snapshot.split_components()
+
+        self.assertEqual([(students, sections) for students, sections, _ in components], [
+            ([0, 1], [0, 1]), ([2, 4], [2]),
+        ])
+        first, second = (component for _students, _sections, component in components)
+        self.assertEqual(first.student_ids, [10, 11])
+        self.assertEqual(first.section_ids, [20, 21])
+        self.assertEqual(first.preferences, [(0, 0, 1), (1, 0, 2), (1, 1, 3)])
+        self.assertEqual(first.top_preferences, {(1, 1)})
+        self.assertEqual(second.student_ids, [12, 14])
+        self.assertEqual(second.preferences, [(1, 0, 1)])
+        self.assertEqual(second.assignments, [(0, 0)])
+        self.assertEqual(second.section_capacity, [1])
+
+    def test_components_match_like_the_whole_snapshot(self):
+        rng = random.Random(4)
+        snapshot = create_snapshot(rng, components=1)
+        component = snapshot.split_components()[0][2]
+        for engine in [match_greedy, match_weighted]:
+            self.assertEqual(engine(component, seed=1), engine(snapshot, seed=1))
+
+
+class DecomposedLotteryPoolTests(SimpleTestCase):
+    # Outside a transaction, so that the components are matched in forked workers
+    def test_results_do_not_depend_on_worker_count(self):
+        snapshot = create_snapshot(random.Random(5), components=6)
+        for mode in [LotteryMode.greedy, LotteryMode.weighted]:
+            serial = match_decomposed(snapshot, mode, seed=3, max_workers=1)
+            self.assertTrue(serial)
+            self.assertEqual(sorted(match_decomposed(snapshot, mode, seed=3, max_workers=4)), sorted(serial))
+
+
+def create_teacher(program, courses=(), available_slots=None):
+    """A teacher registration teaching ``courses``, available for ``available_slots`` if given."""
+    registration = TeacherRegistrationFactory(program=program, user=UserFactory(username=f"teacher-{next(_usernames)}"))
+    for course in courses:
+        CourseTeacherFactory(course=course, teacher_registration=registration)
+    for slot in available_slots or []:
+        TeacherAvailabilityFactory(registration=registration, time_slot=slot)
+    return registration
+
+
+class SchedulerTests(TestCase):
+    def setUp(self):
+        self.program, self.slots = create_program(3)
+        self.small = ClassroomFactory(max_occupants=10)
+        self.large = ClassroomFactory(max_occupants=30)
+        for classroom in [self.small, self.large]:
+            for slot in self.slots:
+                ClassroomTimeSlotFactory(classroom=classroom, time_slot=slot, course_section=None)
+
+    def create_unscheduled_section(self, max_section_size=5, time_slots_per_session=1, **kwargs):
+        course = CourseFactory(
+            program=self.program, max_section_size=max_section_size, time_slots_per_session=time_slots_per_session,
+            status=CourseStatus.accepted, **kwargs
+        )
+        return create_section(self.program, [], course=course)
+
+    def placements(self):
+        return {
+            section_id: {(classroom_id, slot_id) for _section_id, classroom_id, slot_id in cells}
+            for section_id, cells in itertools.groupby(
+                ClassroomTimeSlot.objects.filter(course_section__isnull=False).order_by("course_section_id")
+                .values_list("course_section_id", "classroom_id", "time_slot_id"),
+                key=lambda cell: cell[0],
+            )
+        }
+
+    def test_places_sections_in_the_smallest_room_at_the_earliest_time(self):
+        long = self.create_unscheduled_section(max_section_size=20, time_slots_per_session=2)
+        short = self.create_unscheduled_section(max_section_size=5)
+
+        result = schedule_program(self.program)
+
+        self.assertEqual(result["unplaced"], {})
+        self.assertEqual(self.placements(), {
+            long.id: {(self.large.id, self.slots[0].id), (self.large.id, self.slots[1].id)},
+            short.id: {(self.small.id, self.slots[0].id)},
+        })
+        self.assertEqual(long.meetings.get().end_datetime, self.slots[1].end_datetime)
+
+    def test_teachers_are_available_and_never_double_booked(self):
+        first = self.create_unscheduled_section()
+        second = self.create_unscheduled_section()
+        create_teacher(self.program, [first.course, second.course], self.slots[1:])
+
+        schedule_program(self.program)
+
+        placements = self.placements()
+        self.assertEqual(
+            {slot_id for cells in placements.values() for _classroom_id, slot_id in cells},
+            {self.slots[1].id, self.slots[2].id},
+        )
+
+    def test_classroom_constraints_and_unplaceable_sections(self):
+        tag = ClassroomTagFactory()
+        tag.classrooms.add(self.small)
+        constrained = self.create_unscheduled_section()
+        ClassroomConstraint.objects.create(required_classroom_tag=tag, constraint="Needs a piano").course.add(
+            constrained.course
+        )
+        too_large = self.create_unscheduled_section(max_section_size=40)
+        not_accepted = self.create_unscheduled_section()
+        not_accepted.course.update(status=CourseStatus.unreviewed)
+
+        result = schedule_program(self.program, commit=False)
+
+        self.assertEqual(result["placed"], [constrained.id])
+        self.assertEqual(result["unplaced"], {too_large.id: "No classroom is large enough"})
+        self.assertEqual(self.placements(), {})
+        schedule_program(self.program)
+        self.assertEqual(self.placements(), {constrained.id: {(self.small.id, self.slots[0].id)}})
+
+    def test_scheduled_sections_keep_their_rooms_and_teachers_busy(self):
+        scheduled = create_section(self.program, [], course=CourseFactory(
+            program=self.program, max_section_size=5, time_slots_per_session=1, status=CourseStatus.accepted
+        ))
+        ClassroomTimeSlot.objects.filter(classroom=self.small, time_slot=self.slots[0]).update(
+            course_section=scheduled
+        )
+        section = self.create_unscheduled_section()
+        create_teacher(self.program, [scheduled.course, section.course])
+
+        with self.assertNumQueries(8):
+            snapshot = ScheduleSnapshot.load(self.program)
+        placements, unplaced = schedule_sections(snapshot)
+
+        self.assertEqual(unplaced, {})
+        self.assertEqual(
+            [(snapshot.section_ids[index], room, start) for index, room, start in placements],
+            [(section.id, snapshot.room_ids.index(self.small.id), 1)],
+        )
+
+
+def expand_columns(table):
+    """The rows of a columnar table of the scheduler payload, as dicts."""
+    return [dict(zip(table, row)) for row in zip(*table.values())]
+
+
+def create_admin():
+    """A user with every admin permission, including using the scheduler."""
+    return UserFactory(username=f"admin-{next(_usernames)}", user_type=UserType.admin)
+
+
+class SchedulerPayloadTests(TestCase):
+    def setUp(self):
+        self.program = create_synthetic_program(0, 12, 4, 0, seed=2)
+        self.client.force_login(create_admin())
+
+    def get(self, name, **headers):
+        return self.client.get(reverse(name, kwargs={"pk": self.program.id}), **headers)
+
+    def test_requires_the_scheduler_permission(self):
+        self.client.logout()
+        self.assertEqual(self.get("scheduler_bootstrap_api").status_code, 302)
+        self.client.force_login(UserFactory(username=f"student-{next(_usernames)}", user_type=UserType.student))
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.get("scheduler_bootstrap_api").status_code, 403)
+
+    def test_payload_matches_the_separate_endpoints(self):
+        payload = self.get("scheduler_bootstrap_api").json()["data"]
+        classrooms = expand_columns(payload["classrooms"])
+        time_slots = expand_columns(payload["time_slots"])
+        courses = expand_columns(payload["courses"])
+        sections = expand_columns(payload["course_sections"])
+
+        def by_id(rows):
+            return {row["id"]: row for row in rows}
+
+        self.assertEqual(by_id(classrooms), by_id(self.client.get(reverse("classroom_api")).json()["data"]))
+        self.assertEqual(by_id(time_slots), {
+            row["id"]: {key: row[key] for key in ("id", "start_datetime", "end_datetime")}
+            for row in self.get("time_slot_api").json()["data"]
+        })
+        expected_courses = by_id(self.get("course_api").json()["data"])
+        for course in courses:
+            course_sections = [
+                {"id": section["id"], "display_id": section["display_id"]}
+                for section in sections if courses[section["course"]] is course
+            ]
+            expected = expected_courses.pop(course["id"])
+            self.assertEqual(
+                sorted(course_sections, key=lambda section: section["id"]),
+                sorted(
+                    ({"id": section["id"], "display_id": section["display_id"]} for section in expected["sections"]),
+                    key=lambda section: section["id"],
+                ),
+            )
+            self.assertEqual(course, {key: expected[key] for key in course})
+        self.assertEqual(expected_courses, {})
+
+        classroom_time_slots = {
+            row["id"]: {
+                "classroom_id": classrooms[row["classroom"]]["id"],
+                "time_slot_id": time_slots[row["time_slot"]]["id"],
+                "start_datetime": time_slots[row["time_slot"]]["start_datetime"],
+                "course_section_id": (
+                    sections[row["course_section"]]["id"] if row["course_section"] is not None else None
+                ),
+                "schedule_version": row["schedule_version"],
+            }
+            for row in expand_columns(payload["classroom_time_slots"])
+        }
+        self.assertEqual(classroom_time_slots, {
+            row["id"]: {key: row[key] for key in classroom_time_slots[row["id"]]}
+            for row in self.get("classroom_time_slot_api").json()["data"]
+        })
+
+    def test_teachers_and_availability_refer_to_users(self):
+        payload = self.get("scheduler_bootstrap_api").json()["data"]
+        teachers = expand_columns(payload["teachers"])
+        courses = expand_columns(payload["courses"])
+
+        self.assertEqual(
+            sorted((courses[row["course"]]["id"], teachers[row["teacher"]]["id"])
+                   for row in expand_columns(payload["course_teachers"])),
+            sorted((str(course_id), str(user_id)) for course_id, user_id in CourseTeacher.objects.filter(
+                course__program=self.program
+            ).values_list("course_id", "teacher_registration__user_id")),
+        )
+        # Only teachers of the program's courses are sent
+        self.assertEqual(len(payload["teacher_availabilities"]["teacher"]), TeacherAvailability.objects.filter(
+            time_slot__program=self.program, registration__course_teachers__isnull=False
+        ).distinct().count())
+
+    def test_unchanged_schedules_are_not_rebuilt(self):
+        response = self.get("scheduler_bootstrap_api", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        etag = response["ETag"]
+
+        self.assertEqual(self.get("scheduler_bootstrap_api", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        ClassroomTimeSlot.objects.filter(time_slot__program=self.program).first().save()
+        self.assertEqual(self.get("scheduler_bootstrap_api", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ScheduleVersionTests(TestCase):
+    def setUp(self):
+        self.program, self.slots = create_program(2)
+        self.classroom = ClassroomFactory(max_occupants=10)
+        self.cells = [
+            ClassroomTimeSlotFactory(classroom=self.classroom, time_slot=slot, course_section=None)
+            for slot in self.slots
+        ]
+        self.section = create_section(self.program, [])
+
+    def changed_ids(self, since):
+        changes = schedule_changes(self.program.id, since)
+        return changes["reset"], {row["id"] for row in changes["classroom_time_slots"]}
+
+    def test_saves_take_increasing_versions(self):
+        version, reset_version = schedule_versions(self.program.id)
+        self.assertEqual([cell.schedule_version for cell in self.cells], [version - 1, version])
+
+        self.cells[0].course_section = self.section
+        self.cells[0].save()
+        self.cells[1].update(course_section=self.section)
+
+        self.assertEqual(schedule_versions(self.program.id), (version + 2, reset_version))
+        self.cells[1].refresh_from_db()
+        self.assertEqual(self.cells[1].schedule_version, version + 2)
+        self.assertEqual(self.changed_ids(version), (False, {str(self.cells[0].id), str(self.cells[1].id)}))
+        self.assertEqual(self.changed_ids(version + 1), (False, {str(self.cells[1].id)}))
+        self.assertEqual(self.changed_ids(version + 2), (False, set()))
+        self.assertEqual(self.changed_ids(version + 3), (True, set()))
+        self.assertEqual(self.section.meetings.count(), 1)
+
+    def test_deleting_and_moving_reset_clients(self):
+        version, _reset_version = schedule_versions(self.program.id)
+        self.cells[0].delete()
+        self.assertEqual(schedule_versions(self.program.id), (version + 1, version + 1))
+        self.assertEqual(self.changed_ids(version), (True, set()))
+        self.assertEqual(self.changed_ids(version + 1), (False, set()))
+
+        self.cells[1].classroom = ClassroomFactory(max_occupants=5)
+        self.cells[1].save()
+        self.assertEqual(schedule_versions(self.program.id), (version + 2, version + 2))
+
+    def test_changes_endpoint(self):
+        version, _reset_version = schedule_versions(self.program.id)
+        self.cells[0].update(course_section=self.section)
+        url = reverse("schedule_changes_api", kwargs={"pk": self.program.id})
+        self.assertEqual(self.client.get(url, {"since": version}).status_code, 302)
+        self.client.force_login(create_admin())
+
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.get(url).status_code, 400)
+        data = self.client.get(url, {"since": version}).json()["data"]
+        self.assertEqual((data["version"], data["reset"]), (version + 1, False))
+        self.assertEqual(
+            [(row["id"], row["course_section_id"]) for row in data["classroom_time_slots"]],
+            [(str(self.cells[0].id), str(self.section.id))],
+        )
+
+    def test_assignment_form_rejects_other_programs(self):
+        other_program, other_slots = create_program(1)
+        other_section = create_section(other_program, [])
+        other_cell = ClassroomTimeSlotFactory(classroom=self.classroom, time_slot=other_slots[0], course_section=None)
+
+        for classroom_time_slot, section in [(other_cell, self.section), (self.cells[0], other_section)]:
+            form = AssignClassroomTimeSlotsForm({"data": json.dumps([{
+                "classroom_time_slot_id": str(classroom_time_slot.id), "course_section_id": str(section.id),
+            }])}, program=self.program)
+            self.assertFalse(form.is_valid())
+
+
+class ClassroomTimeSlotAssignmentTests(TestCase):
+    def setUp(self):
+        self.program = create_synthetic_program(0, 10, 4, 0, seed=8)
+        self.cells = list(ClassroomTimeSlot.objects.filter(time_slot__program=self.program).order_by("id"))
+        self.sections = list(CourseSection.objects.filter(course__program=self.program))
+
+    def state(self):
+        return dict(ClassroomTimeSlot.objects.filter(time_slot__program=self.program).values_list(
+            "id", "course_section_id"
+        ))
+
+    def meetings(self):
+        return sorted(SectionMeeting.objects.filter(course_section__course__program=self.program).values_list(
+            "course_section_id", "classroom_id", "start_datetime", "end_datetime"
+        ))
+
+    @mock.patch("esp.schedule_changes.ASSIGNMENT_CHUNK_SIZE", 3)
+    def test_bulk_assignment_matches_saving_each_slot(self):
+        rng = random.Random(1)
+        assignments = [
+            (cell.id, rng.choice(self.sections).id if rng.random() < 0.7 else None, None)
+            for cell in rng.choices(self.cells, k=20)
+        ]
+        with transaction.atomic():
+            for classroom_time_slot_id, section_id, _version in assignments:
+                ClassroomTimeSlot.objects.get(id=classroom_time_slot_id).update(course_section_id=section_id)
+            expected_state, expected_meetings = self.state(), self.meetings()
+            transaction.set_rollback(True)
+
+        version = assign_classroom_time_slots(self.program.id, assignments)
+
+        self.assertEqual(self.state(), expected_state)
+        self.assertEqual(self.meetings(), expected_meetings)
+        self.assertEqual(schedule_versions(self.program.id)[0], version)
+        changed = ClassroomTimeSlot.objects.filter(id__in=[assignment[0] for assignment in assignments])
+        self.assertEqual(set(changed.values_list("schedule_version", flat=True)), {version})
+
+    @mock.patch("esp.schedule_changes.ASSIGNMENT_CHUNK_SIZE", 2)
+    def test_stale_versions_roll_back_every_chunk(self):
+        state = self.state()
+        stale, *fresh = self.cells[:5]
+        assignments = [(cell.id, self.sections[0].id, cell.schedule_version) for cell in fresh]
+        assignments.append((stale.id, self.sections[0].id, stale.schedule_version - 1))
+
+        with self.assertRaises(ScheduleConflictError) as context:
+            assign_classroom_time_slots(self.program.id, assignments)
+
+        self.assertEqual(context.exception.classroom_time_slot_ids, [str(stale.id)])
+        self.assertEqual(self.state(), state)
+
+    def test_endpoint_reports_conflicts(self):
+        cell = self.cells[0]
+        url = reverse("assign_classroom_time_slots_api", kwargs={"pk": self.program.id})
+
+        def post(expected_version):
+            return self.client.post(url, {"data": [{
+                "classroom_time_slot_id": str(cell.id), "course_section_id": str(self.sections[0].id),
+                "expected_version": expected_version,
+            }]}, content_type="application/json")
+
+        response = post(cell.schedule_version)
+        self.assertEqual(response.json(), {"version": schedule_versions(self.program.id)[0]})
+        with self.assertLogs("django.request", "WARNING"):
+            response = post(cell.schedule_version)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {"conflicts": [str(cell.id)]})
+
+
+def per_slot_course_teacher_availabilities(time_slot):
+    """The former TimeSlot.course_teacher_availabilities, which walked each slot's availability and teachers."""
+    mapping = {}
+    for teacher_availability in time_slot.teacher_availabilities.all():
+        for course_teacher in teacher_availability.registration.course_teachers.all():
+            user = teacher_availability.registration.user
+            if user not in mapping.setdefault(course_teacher.course_id, []):
+                mapping[course_teacher.course_id].append(user)
+    return {str(course_id): UserSerializer(users, many=True).data for course_id, users in mapping.items()}
+
+
+class CourseTeacherAvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.program = create_synthetic_program(0, 12, 4, 0, seed=4)
+
+    def test_matches_the_per_slot_walk(self):
+        availability = course_teacher_availability(self.program.id)
+
+        for time_slot in self.program.time_slots.all():
+            expected = per_slot_course_teacher_availabilities(time_slot)
+            courses = availability["time_slots"].get(str(time_slot.id), {})
+            self.assertEqual(set(courses), set(expected))
+            for course_id, user_ids in courses.items():
+                self.assertEqual(
+                    sorted((availability["users"][user_id] for user_id in user_ids), key=lambda user: user["id"]),
+                    sorted((dict(user) for user in expected[course_id]), key=lambda user: user["id"]),
+                )
+
+    def test_cache_follows_availability_and_teacher_changes(self):
+        availability = course_teacher_availability(self.program.id)
+        # The version, then the teachers' users
+        with self.assertNumQueries(2):
+            self.assertEqual(course_teacher_availability(self.program.id), availability)
+
+        registration = TeacherAvailability.objects.filter(
+            time_slot__program=self.program, registration__course_teachers__isnull=False
+        ).select_related("registration__user").first().registration
+        registration.user.update(first_name="Renamed")
+        self.assertEqual(
+            course_teacher_availability(self.program.id)["users"][str(registration.user_id)]["first_name"], "Renamed"
+        )
+
+        for teacher_availability in registration.availabilities.all():
+            teacher_availability.delete()
+        self.assertNotIn(str(registration.user_id), course_teacher_availability(self.program.id)["users"])
+
+        course_teacher = CourseTeacher.objects.filter(course__program=self.program).first()
+        course_teacher.teacher_registration = registration
+        course_teacher.save()
+        TeacherAvailabilityFactory(registration=registration, time_slot=self.program.time_slots.first())
+        self.assertIn(str(registration.user_id), course_teacher_availability(self.program.id)["users"])
+
+
+def merged_section_times(section):
+    """The former CourseSection.get_section_times, which merged the section's ClassroomTimeSlots on every call."""
+    slots = sorted(
+        (
+            {
+                "start": slot.time_slot.start_datetime, "end": slot.time_slot.end_datetime,
+                "classroom": slot.classroom.name,
+            }
+            for slot in section.time_slots.all()
+        ),
+        key=lambda slot: slot["start"],
+    )
+    if not slots:
+        return []
+    gap = datetime.timedelta(minutes=section.course.program.time_block_minutes - 1)
+    times = []
+    start, end, classroom = slots[0]["start"], None, slots[0]["classroom"]
+    for slot in slots:
+        if end and (slot["start"] > end + gap or slot["classroom"] != classroom):
+            times.append((start, end, classroom))
+            start, classroom = slot["start"], slot["classroom"]
+        end = slot["end"]
+    times.append((start, end, classroom))
+    return times
+
+
+class SectionMeetingTests(TestCase):
+    def setUp(self):
+        self.program, slots = create_program(5)
+        # Classrooms are reserved at 9, 10, 12 and 13 o'clock; the 11 o'clock gap splits meetings
+        self.slots = slots[:2] + slots[3:]
+        self.classrooms = [ClassroomFactory(name=f"Room {index}", max_occupants=20) for index in range(2)]
+        self.cells = {
+            (classroom.id, slot.id): ClassroomTimeSlotFactory(classroom=classroom, time_slot=slot, course_section=None)
+            for classroom in self.classrooms for slot in self.slots
+        }
+        self.sections = [create_section(self.program, []) for _ in range(3)]
+
+    def assign_randomly(self, rng):
+        assignments = []
+        for slot in self.slots:
+            sections = rng.sample(self.sections + [None, None], len(self.classrooms))
+            for classroom, section in zip(self.classrooms, sections):
+                assignments.append((self.cells[(classroom.id, slot.id)].id, section and section.id, None))
+        assign_classroom_time_slots(self.program.id, assignments)
+
+    def test_meetings_match_merging_slots_per_call(self):
+        rng = random.Random(3)
+        for _ in range(10):
+            self.assign_randomly(rng)
+            program_meetings = program_section_meetings(self.program.id)
+            for section in self.sections:
+                expected = merged_section_times(CourseSection.objects.get(id=section.id))
+                self.assertEqual(CourseSection.objects.get(id=section.id).get_section_times(), expected)
+                self.assertEqual(program_meetings.get(section.id, []), expected)
+
+    def test_saving_and_deleting_slots_rebuild_meetings(self):
+        section = self.sections[0]
+        for slot in self.slots[:3]:
+            self.cells[(self.classrooms[0].id, slot.id)].update(course_section=section)
+        self.assertEqual(section.get_section_times(), [
+            (self.slots[0].start_datetime, self.slots[1].end_datetime, "Room 0"),
+            (self.slots[2].start_datetime, self.slots[2].end_datetime, "Room 0"),
+        ])
+
+        self.cells[(self.classrooms[0].id, self.slots[2].id)].delete()
+        self.cells[(self.classrooms[0].id, self.slots[1].id)].update(course_section=None)
+        self.assertEqual(section.get_section_times(), [
+            (self.slots[0].start_datetime, self.slots[0].end_datetime, "Room 0"),
+        ])
+
+    def test_rebuilding_writes_no_history(self):
+        self.assign_randomly(random.Random(4))
+        with self.assertRaises(LookupError):
+            apps.get_model("esp", "HistoricalSectionMeeting")
+        # Delete, read the slots, insert
+        with self.assertNumQueries(3):
+            rebuild_section_meetings(section.id for section in self.sections)
+
+    def test_bulk_and_cascade_deletes_resync_the_schedule(self):
+        section = self.sections[0]
+        for classroom in self.classrooms:
+            self.cells[(classroom.id, self.slots[0].id)].update(course_section=section)
+        self.cells[(self.classrooms[1].id, self.slots[1].id)].update(course_section=section)
+        version, _reset_version = schedule_versions(self.program.id)
+
+        ClassroomTimeSlotAdmin(ClassroomTimeSlot, admin.site).delete_queryset(
+            None, ClassroomTimeSlot.objects.filter(classroom=self.classrooms[1], time_slot=self.slots[1])
+        )
+        self.assertEqual(schedule_versions(self.program.id), (version + 1, version + 1))
+        self.assertEqual(section.get_section_times(), merged_section_times(section))
+
+        self.classrooms[0].delete()
+        self.assertEqual(schedule_versions(self.program.id), (version + 2, version + 2))
+        self.assertEqual(section.get_section_times(), [
+            (self.slots[0].start_datetime, self.slots[0].end_datetime, "Room 1"),
+        ])
+
+        ClassroomAdmin(Classroom, admin.site).delete_queryset(None, Classroom.objects.filter(id=self.classrooms[1].id))
+        self.assertEqual(schedule_versions(self.program.id), (version + 3, version + 3))
+        self.assertEqual(section.get_section_times(), [])
+
+    def test_migration_backfill_matches_rebuilding(self):
+        self.assign_randomly(random.Random(5))
+        rebuilt = sorted(SectionMeeting.objects.values_list(
+            "course_section_id", "classroom_id", "start_datetime", "end_datetime"
+        ))
+        SectionMeeting.objects.all().delete()
+
+        import_module("esp.migrations.0026_section_meeting").build_section_meetings(apps, None)
+
+        self.assertEqual(sorted(SectionMeeting.objects.values_list(
+            "course_section_id", "classroom_id", "start_datetime", "end_datetime"
+        )), rebuilt)
+
+
+class PlacementSuggestionTests(TestCase):
+    def setUp(self):
+        self.program = create_synthetic_program(0, 24, 6, 0, seed=12)
+        placement_suggestions._indexes.clear()
+        self.sections = list(CourseSection.objects.filter(course__program=self.program).select_related("course"))
+
+    def feasible_placements(self, section):
+        """Every (classroom id, time slot ids) placement of the section, checked slot by slot against the database."""
+        slots = list(self.program.time_slots.order_by("start_datetime"))
+        gap = datetime.timedelta(minutes=self.program.time_block_minutes - 1)
+        length = section.course.time_slots_per_session
+        runs = [
+            slots[first:first + length] for first in range(len(slots) - length + 1)
+            if all(
+                slots[index + 1].start_datetime <= slots[index].end_datetime + gap
+                for index in range(first, first + length - 1)
+            )
+        ]
+        cells = {
+            (cell.classroom_id, cell.time_slot_id): cell
+            for cell in ClassroomTimeSlot.objects.filter(time_slot__program=self.program).select_related("classroom")
+        }
+        teachers = list(TeacherRegistration.objects.filter(course_teachers__course=section.course))
+        unavailable = set()
+        for teacher in teachers:
+            available = set(teacher.availabilities.values_list("time_slot_id", flat=True))
+            busy = set(ClassroomTimeSlot.objects.filter(
+                course_section__course__course_teachers__teacher_registration=teacher
+            ).exclude(course_section=section).values_list("time_slot_id", flat=True))
+            unavailable |= {slot.id for slot in slots if available and slot.id not in available} | busy
+        placements = set()
+        for classroom_id in {classroom_id for classroom_id, _slot_id in cells}:
+            for run in runs:
+                run_cells = [cells.get((classroom_id, slot.id)) for slot in run]
+                if (
+                    all(cell and cell.course_section_id in (None, section.id) for cell in run_cells)
+                    and run_cells[0].classroom.max_occupants >= section.course.max_section_size
+                    and not unavailable & {slot.id for slot in run}
+                ):
+                    placements.add((classroom_id, tuple(slot.id for slot in run)))
+        return placements
+
+    def test_suggestions_are_exactly_the_feasible_placements_best_first(self):
+        index = placement_index(self.program)
+        suggested_any = False
+        for section in self.sections:
+            suggestions = index.suggest(section.id)
+            suggested_any = suggested_any or bool(suggestions)
+            self.assertEqual(
+                {(suggestion["classroom"], tuple(suggestion["time_slots"])) for suggestion in suggestions},
+                self.feasible_placements(section),
+            )
+            ranks = [(suggestion["capacity_slack"], suggestion["interval_slack"]) for suggestion in suggestions]
+            self.assertEqual(ranks, sorted(ranks))
+        self.assertTrue(suggested_any)
+
+    def test_replaying_changes_matches_reloading(self):
+        index = placement_index(self.program)
+        rng = random.Random(6)
+        cells = list(ClassroomTimeSlot.objects.filter(time_slot__program=self.program))
+        for _ in range(5):
+            assign_classroom_time_slots(self.program.id, [
+                (cell.id, rng.choice(self.sections).id if rng.random() < 0.7 else None, None)
+                for cell in rng.sample(cells, 8)
+            ])
+            self.assertIs(placement_index(self.program), index)
+            reloaded = PlacementIndex(self.program)
+            for section in self.sections:
+                self.assertEqual(index.suggest(section.id), reloaded.suggest(section.id))
+
+        cells[0].delete()
+        self.assertIsNot(placement_index(self.program), index)
+
+    def test_endpoint_limits_suggestions(self):
+        section = max(self.sections, key=lambda section: len(placement_index(self.program).suggest(section.id)))
+        url = reverse("section_placements_api", kwargs={"pk": self.program.id, "section_pk": section.id})
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(create_admin())
+
+        data = self.client.get(url, {"limit": 2}).json()["data"]
+
+        self.assertEqual(data["version"], schedule_versions(self.program.id)[0])
+        self.assertEqual(data["placements"], json.loads(json.dumps(
+            placement_index(self.program).suggest(section.id, 2), default=str
+        )))
+
+
+class ScheduleConflictReportTests(TestCase):
+    def setUp(self):
+        self.program, self.slots = create_program(3)
+        self.small, self.other = ClassroomFactory(max_occupants=10), ClassroomFactory(max_occupants=10)
+
+    def create_course(self, max_section_size=5, time_slots_per_session=1):
+        return CourseFactory(
+            program=self.program, max_section_size=max_section_size, time_slots_per_session=time_slots_per_session,
+            status=CourseStatus.accepted,
+        )
+
+    def report(self):
+        return sorted(
+            (conflict["type"], tuple(conflict["course_sections"]), tuple(sorted(conflict["classroom_time_slots"])))
+            for conflict in schedule_conflict_report(self.program)
+        )
+
+    def cell_ids(self, section):
+        return tuple(sorted(section.time_slots.values_list("id", flat=True)))
+
+    def test_reports_each_kind_of_conflict(self):
+        first_course, large_course = self.create_course(), self.create_course(max_section_size=20)
+        create_teacher(self.program, [first_course, large_course], self.slots)
+        first = create_section(self.program, self.slots[:1], course=first_course, classroom=self.small)
+        large = create_section(self.program, self.slots[:1], course=large_course, classroom=self.other)
+        late_course = self.create_course(time_slots_per_session=2)
+        create_teacher(self.program, [late_course], self.slots[:1])
+        late = create_section(self.program, self.slots[1:], course=late_course, classroom=self.small)
+        # Teachers who never entered availability are not held to it
+        short_course = self.create_course(time_slots_per_session=2)
+        create_teacher(self.program, [short_course])
+        short = create_section(self.program, self.slots[2:], course=short_course, classroom=self.other)
+
+        with self.assertNumQueries(2):
+            schedule_conflict_report(self.program)
+        self.assertEqual(self.report(), sorted([
+            (ScheduleConflictType.teacher_double_booked, tuple(sorted([first.id, large.id])),
+             tuple(sorted(self.cell_ids(first) + self.cell_ids(large)))),
+            (ScheduleConflictType.classroom_too_small, (large.id,), self.cell_ids(large)),
+            (ScheduleConflictType.teacher_unavailable, (late.id,), self.cell_ids(late)),
+            (ScheduleConflictType.wrong_session_length, (short.id,), self.cell_ids(short)),
+        ]))
+
+    def test_split_meetings_have_the_wrong_length(self):
+        course = self.create_course(time_slots_per_session=2)
+        section = create_section(self.program, self.slots[:1], course=course, classroom=self.small)
+        ClassroomTimeSlotFactory(classroom=self.other, time_slot=self.slots[1], course_section=section)
+
+        self.assertEqual(self.report(), [
+            (ScheduleConflictType.wrong_session_length, (section.id,), self.cell_ids(section)),
+        ])
+
+    def test_auto_scheduled_programs_have_no_conflicts(self):
+        for classroom in [self.small, self.other]:
+            for slot in self.slots:
+                ClassroomTimeSlotFactory(classroom=classroom, time_slot=slot, course_section=None)
+        courses = [self.create_course(time_slots_per_session=length) for length in [1, 2, 1, 1]]
+        create_teacher(self.program, courses[:2], self.slots)
+        create_teacher(self.program, courses[2:], self.slots[1:])
+        for course in courses:
+            create_section(self.program, [], course=course)
+
+        result = schedule_program(self.program)
+
+        self.assertEqual(len(result["placed"]), len(courses))
+        self.assertEqual(self.report(), [])
+        url = reverse("schedule_conflicts_api", kwargs={"pk": self.program.id})
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(create_admin())
+        data = self.client.get(url).json()["data"]
+        self.assertEqual(data, {"version": schedule_versions(self.program.id)[0], "conflicts": []})
+
+
+class SectionMoveImpactTests(TestCase):
+    def setUp(self):
+        self.program, self.slots = create_program(4)
+        self.section = create_section(self.program, self.slots[:1], max_section_size=10)
+        self.long = create_section(self.program, self.slots[1:3], max_section_size=10)
+        self.last = create_section(self.program, self.slots[3:], max_section_size=10)
+        self.classroom = ClassroomFactory(max_occupants=30)
+        self.cells = [
+            ClassroomTimeSlotFactory(classroom=self.classroom, time_slot=slot, course_section=None)
+            for slot in self.slots
+        ]
+        self.students = [
+            self.enroll(self.section, self.long), self.enroll(self.section, self.last),
+            self.enroll(self.section, self.long, self.last), self.enroll(self.long), self.enroll(self.section),
+        ]
+
+    def enroll(self, *sections):
+        registration = create_student(self.program)
+        for section in sections:
+            ClassRegistration.objects.create(
+                program_registration=registration, course_section=section, created_by_lottery=False
+            )
+        return registration
+
+    def expected_impact(self, cells):
+        """Walk every enrolled student's other sections' meetings."""
+        times = [(cell.time_slot.start_datetime, cell.time_slot.end_datetime) for cell in cells]
+        impact = set()
+        for registration in ClassRegistration.objects.filter(course_section=self.section):
+            student = registration.program_registration
+            for other in student.class_registrations.exclude(course_section=self.section):
+                for meeting in other.course_section.meetings.all():
+                    if any(meeting.start_datetime < end and meeting.end_datetime > start for start, end in times):
+                        impact.add((student.user_id, other.course_section_id, meeting.start_datetime,
+                                    meeting.end_datetime))
+        return impact
+
+    def impact(self, cells):
+        with self.assertNumQueries(2):
+            students = section_move_impact(self.section, [cell.id for cell in cells])
+        self.assertEqual([student["name"] for student in students], sorted(student["name"] for student in students))
+        return {
+            (student["user"], conflict["course_section"], conflict["start_datetime"], conflict["end_datetime"])
+            for student in students for conflict in student["conflicts"]
+        }
+
+    def test_matches_walking_each_student(self):
+        for cells in [self.cells[1:2], self.cells[2:], self.cells[1:], self.cells[:1]]:
+            self.assertEqual(self.impact(cells), self.expected_impact(cells))
+        self.assertEqual(
+            {user for user, *_ in self.impact(self.cells[2:])},
+            {student.user_id for student in self.students[:3]},
+        )
+
+    def test_conflicts_are_whole_meetings(self):
+        (student,) = [
+            student for student in section_move_impact(self.section, [self.cells[2].id])
+            if student["user"] == self.students[0].user_id
+        ]
+        self.assertEqual(student["conflicts"], [{
+            "course_section": self.long.id,
+            "name": f"{self.long.course.name} (section {self.long.display_id})",
+            "start_datetime": self.slots[1].start_datetime,
+            "end_datetime": self.slots[2].end_datetime,
+            "classroom": self.long.time_slots.first().classroom.name,
+        }])
+
+    def test_rejects_other_programs_classroom_time_slots(self):
+        other_program, other_slots = create_program(1)
+        foreign = ClassroomTimeSlotFactory(classroom=self.classroom, time_slot=other_slots[0], course_section=None)
+        self.assertEqual(section_move_impact(self.section, []), [])
+        with self.assertRaises(ValueError):
+            section_move_impact(self.section, [self.cells[1].id, foreign.id])
+
+        url = reverse("section_move_impact_api", kwargs={"pk": self.program.id, "section_pk": self.section.id})
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(create_admin())
+        with self.assertLogs("django.request", "WARNING"):
+            response = self.client.get(url, {"classroom_time_slots": [str(self.cells[1].id), str(foreign.id)]})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {"classroom_time_slots": [str(self.cells[1].id)]})
+        self.assertEqual(
+            {student["user"] for student in response.json()["data"]["students"]},
+            {str(self.students[0].user_id), str(self.students[2].user_id)},
+        )
+
+
+class ClassroomAvailabilityTests(TestCase):
+    def setUp(self):
+        self.program, self.slots = create_program(3)
+        # A Sunday time slot, at the same local time of day as the first one
+        self.slots.append(TimeSlotFactory(
+            program=self.program,
+            start_datetime=START + datetime.timedelta(days=1),
+            end_datetime=START + datetime.timedelta(days=1, minutes=50),
+        ))
+        self.classrooms = [ClassroomFactory(max_occupants=30) for _ in range(3)]
+        _other_program, other_slots = create_program(1)
+        self.foreign = ClassroomTimeSlotFactory(
+            classroom=self.classrooms[0], time_slot=other_slots[0], course_section=None
+        )
+
+    def pairs(self):
+        return set(classroom_availability(self.program.id))
+
+    def test_matches_per_classroom_loop(self):
+        rng = random.Random(0)
+        everything = availability_pattern(self.program.id, [classroom.id for classroom in self.classrooms])
+        section = create_section(self.program, [])
+        for _ in range(10):
+            before = {pair for pair in everything if rng.random() < 0.5}
+            after = {pair for pair in everything if rng.random() < 0.5}
+            # Time slots of other programs are ignored
+            after.add((self.classrooms[1].id, self.foreign.time_slot_id))
+            set_classroom_availability(self.program.id, before)
+            ClassroomTimeSlot.objects.filter(
+                time_slot__program=self.program, classroom=self.classrooms[0]
+            ).update(course_section=section)
+
+            savepoint = transaction.savepoint()
+            BenchmarkClassroomAvailability().save_per_classroom(self.program, after)
+            expected = self.pairs()
+            transaction.savepoint_rollback(savepoint)
+            created, deleted, unscheduled = set_classroom_availability(self.program.id, after)
+
+            self.assertEqual(self.pairs(), expected)
+            self.assertEqual((created, deleted), (len(expected - before), len(before - expected)))
+            self.assertEqual(
+                unscheduled,
+                {section.id} if any(pair[0] == self.classrooms[0].id for pair in before - expected) else set(),
+            )
+            self.assertTrue(ClassroomTimeSlot.objects.filter(id=self.foreign.id).exists())
+
+    def test_unscheduling_rebuilds_meetings(self):
+        section = create_section(self.program, self.slots[:2], classroom=self.classrooms[0])
+        available = self.pairs()
+        version, reset_version = schedule_versions(self.program.id)
+
+        self.assertEqual(set_classroom_availability(self.program.id, available), (0, 0, set()))
+        self.assertEqual(schedule_versions(self.program.id), (version, reset_version))
+        result = set_classroom_availability(self.program.id, available - {(self.classrooms[0].id, self.slots[1].id)})
+
+        self.assertEqual(result, (0, 1, {section.id}))
+        self.assertEqual(
+            list(section.meetings.values_list("start_datetime", "end_datetime")),
+            [(self.slots[0].start_datetime, self.slots[0].end_datetime)],
+        )
+        self.assertGreater(schedule_versions(self.program.id)[1], reset_version)
+
+    def test_pattern_form_edits_matching_time_slots(self):
+        self.client.force_login(create_admin())
+        url = reverse("manage_classroom_availability", kwargs={"pk": self.program.id})
+        start_time = timezone.localtime(self.slots[0].start_datetime).time().isoformat()
+
+        response = self.client.post(url, {
+            "pattern": "", "action": "add", "classrooms": [self.classrooms[0].id, self.classrooms[1].id],
+            "start_times": [start_time],
+        })
+        self.assertRedirects(response, url)
+        self.assertEqual(self.pairs(), {
+            (classroom.id, slot.id) for classroom in self.classrooms[:2] for slot in [self.slots[0], self.slots[3]]
+        })
+        self.client.post(url, {"pattern": "", "action": "remove", "weekdays": [self.slots[3].start_datetime.weekday()]})
+        self.assertEqual(self.pairs(), {(classroom.id, self.slots[0].id) for classroom in self.classrooms[:2]})
+
+        response = self.client.post(url, {
+            f"classroom:{self.classrooms[2].id}": [self.slots[1].id, self.slots[2].id],
+        })
+        self.assertRedirects(response, reverse("admin_dashboard"), fetch_redirect_response=False)
+        self.assertEqual(self.pairs(), {(self.classrooms[2].id, slot.id) for slot in self.slots[1:3]})
+
+
+class RegistrationStageTests(TestCase):
+    def setUp(self):
+        self.benchmark = BenchmarkRegistrationStages()
+        self.program = self.benchmark.create_program(random.Random(0), 40, 4)
+        self.registrations = list(StudentRegistration.objects.filter(program=self.program).select_related("program"))
+        self.expected = self.benchmark.resolve_per_registration_before(self.program, self.registrations)
+
+    def test_matches_former_get_program_stage(self):
+        self.assertGreater(len(set(self.expected.values())), 2)
+        with self.assertNumQueries(4):
+            self.assertEqual(program_registration_stages(self.program), self.expected)
+        for registration in self.registrations:
+            with self.assertNumQueries(1):
+                self.assertEqual(registration_program_stage(registration), self.expected[registration.id])
+
+    def test_resolves_a_subset_of_registrations(self):
+        registrations = StudentRegistration.objects.filter(
+            id__in=[registration.id for registration in self.registrations[:5]]
+        )
+        self.assertEqual(
+            program_registration_stages(self.program, registrations),
+            {registration.id: self.expected[registration.id] for registration in self.registrations[:5]},
+        )
+
+    def test_without_active_stages(self):
+        self.program.stages.update(end_date=timezone.now() - datetime.timedelta(days=1))
+        self.registrations[0].update(allow_late_registration_until=timezone.now() + datetime.timedelta(days=1))
+        stages = program_registration_stages(self.program)
+        for registration in self.registrations[1:]:
+            if not registration.ignore_registration_deadlines():
+                self.assertIsNone(stages[registration.id])
+        self.assertIsNotNone(stages[self.registrations[0].id])
+        self.assertEqual(stages, self.benchmark.resolve_per_registration_before(
+            self.program, StudentRegistration.objects.filter(program=self.program).select_related("program")
+        ))
+
+    def test_email_form_rejects_stages_of_other_programs(self):
+        other_stage = BenchmarkRegistrationStages().create_program(random.Random(1), 1, 1).stages.get()
+        form = StudentSendEmailForm({
+            "program": self.program.id, "program_stage": other_stage.id, "subject": "Hello", "body": "Hello",
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn("program_stage", form.errors)
+
+
+def queryset_visible_steps(registration):
+    """
+    The ids of the former TeacherRegistration.visible_registration_steps. It raised ValueError when some step was
+    incomplete but none of the incomplete ones was required for the next step, and OR-ing the two querysets kept the
+    first one's ``completed`` annotation for every step.
+    """
+    steps = registration.program.teacher_registration_steps.all()
+    if not registration.ignore_registration_deadlines():
+        steps = steps.filter(access_start_date__lt=timezone.now(), access_end_date__gt=timezone.now())
+    completed_steps = registration.completed_steps.values("step_id")
+    visible_steps = steps.filter(
+        id__in=completed_steps, display_after_completion=True
+    ).annotate(completed=Value(True))
+    if registration.completed_steps.count() < steps.count():
+        first_incomplete_required_step = (
+            steps.exclude(id__in=completed_steps).filter(required_for_next_step=True).aggregate(Min("_order"))[
+                "_order__min"
+            ]
+        )
+        visible_incomplete_steps = (
+            steps.exclude(id__in=completed_steps)
+            .filter(_order__lte=first_incomplete_required_step)
+            .annotate(completed=Value(False))
+        )
+        visible_steps = visible_steps | visible_incomplete_steps
+    return list(visible_steps.order_by("_order").values_list("id", flat=True))
+
+
+class TeacherRegistrationStepTests(TestCase):
+    def create_steps(self, program, flags, active=True):
+        """One step of each type, in order, with (required_for_next_step, display_after_completion) from ``flags``."""
+        now = timezone.now()
+        return [
+            TeacherProgramRegistrationStep.objects.create(
+                program=program, step_key=step_key, required_for_next_step=required,
+                display_after_completion=displayed,
+                access_start_date=now - datetime.timedelta(days=1),
+                access_end_date=now + datetime.timedelta(days=1 if active else -1 / 2),
+            )
+            for step_key, (required, displayed) in zip(TeacherRegistrationStepType.values, flags)
+        ]
+
+    def complete(self, registration, steps):
+        for step in steps:
+            CompletedTeacherRegistrationStep.objects.create(
+                registration=registration, step=step, completed_on=timezone.now()
+            )
+
+    @staticmethod
+    def step_pairs(steps):
+        return [(step.id, step.completed) for step in steps]
+
+    def test_matches_former_queryset(self):
+        rng = random.Random(0)
+        compared = 0
+        for _ in range(10):
+            program, _slots = create_program(0)
+            steps = self.create_steps(program, [
+                (rng.random() < 0.5, rng.random() < 0.7) for _step_key in TeacherRegistrationStepType.values
+            ])
+            registrations = [create_teacher(program) for _ in range(4)]
+            for registration in registrations:
+                self.complete(registration, [step for step in steps if rng.random() < 0.5])
+
+            with self.assertNumQueries(3):
+                resolved = program_registration_steps(program)
+            for registration in registrations:
+                with self.assertNumQueries(1):
+                    visible_steps, completed_step_ids = registration_steps(registration)
+                self.assertEqual(self.step_pairs(resolved[registration.id][0]), self.step_pairs(visible_steps))
+                self.assertEqual(resolved[registration.id][1], completed_step_ids)
+                incomplete = [step for step in steps if step.id not in completed_step_ids]
+                if incomplete and not any(step.required_for_next_step for step in incomplete):
+                    continue
+                self.assertEqual([step.id for step in visible_steps], queryset_visible_steps(registration))
+                for step in visible_steps:
+                    self.assertEqual(step.completed, step.id in completed_step_ids)
+                compared += 1
+        self.assertGreater(compared, 20)
+
+    def test_incomplete_steps_all_visible_without_a_required_one(self):
+        program, _slots = create_program(0)
+        steps = self.create_steps(program, [(False, False), (False, True), (False, True)])
+        registration = create_teacher(program)
+        self.complete(registration, steps[:1])
+        with self.assertRaises(ValueError):
+            queryset_visible_steps(registration)
+        self.assertEqual(self.step_pairs(registration.visible_registration_steps()), [
+            (steps[1].id, False), (steps[2].id, False),
+        ])
+
+    def test_steps_outside_their_access_dates(self):
+        program, _slots = create_program(0)
+        (step,) = self.create_steps(program, [(True, True)], active=False)
+        registration = create_teacher(program)
+        self.assertEqual(registration_steps(registration), ([], set()))
+        registration.update(allow_late_registration_until=timezone.now() + datetime.timedelta(days=1))
+        self.assertEqual(self.step_pairs(registration_steps(registration)[0]), [(step.id, False)])
+
+    def test_mark_step_completed_unlocks_the_next_step(self):
+        program, _slots = create_program(0)
+        first, second = self.create_steps(program, [(True, True), (True, True)])
+        first.update(allow_changes_after_completion=False)
+        registration = create_teacher(program)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.step_pairs(registration.visible_registration_steps()), [(first.id, False)])
+            self.assertTrue(registration.has_access_to_step(first))
+            self.assertFalse(registration.has_access_to_step(second))
+            self.assertEqual(registration.completed_step_ids(), set())
+        registration.mark_step_completed(first)
+
+        self.assertEqual(
+            self.step_pairs(registration.visible_registration_steps()), [(first.id, True), (second.id, False)]
+        )
+        self.assertFalse(registration.has_access_to_step(first))
+        self.assertTrue(registration.has_access_to_step(second))
+        self.assertEqual(registration.completed_step_ids(), {first.id})
+
+
+class CheckinTestCase(TestCase):
+    def setUp(self):
+        self.program, _slots = create_program(0)
+        self.forms = [
+            ExternalProgramForm.objects.create(
+                program=self.program, user_type=UserType.student, integration=FormIntegration.formstack,
+                url="https://example.com/form", display_name=f"Form {index}",
+            )
+            for index in range(2)
+        ]
+        self.items = [
+            PurchaseableItem.objects.create(
+                program=self.program, item_name=f"Item {index}", price=Decimal("12.50"),
+                required_for_registration=required, eligible_for_financial_aid=False,
+            )
+            for index, required in enumerate([True, False])
+        ]
+
+    def complete_form(self, registration, form):
+        CompletedStudentForm.objects.create(
+            program_registration=registration, form=form, completed_on=timezone.now()
+        )
+
+    def buy(self, registration, item, confirmed=True):
+        PurchaseLineItem.objects.create(
+            user=registration.user, item=item, added_to_cart_on=timezone.now(), charge_amount=item.price,
+            purchase_confirmed_on=timezone.now() if confirmed else None,
+        )
+
+    def create_ready_student(self):
+        registration = create_student(self.program)
+        for form in self.forms:
+            self.complete_form(registration, form)
+        self.buy(registration, self.items[0])
+        # As the form and payment views do
+        refresh_checkin_readiness(StudentRegistration.objects.filter(id=registration.id))
+        return registration
+
+
+class CheckinTests(CheckinTestCase):
+    def test_readiness_matches_registration_requirements(self):
+        rng = random.Random(0)
+        registrations = []
+        for _ in range(30):
+            registration = create_student(self.program)
+            for form in self.forms:
+                if rng.random() < 0.8:
+                    self.complete_form(registration, form)
+            for item in self.items:
+                if rng.random() < 0.7:
+                    self.buy(registration, item, confirmed=rng.random() < 0.7)
+            registrations.append(registration)
+        other_program, _slots = create_program(0)
+        ExternalProgramForm.objects.create(
+            program=other_program, user_type=UserType.student, integration=FormIntegration.formstack,
+            url="https://example.com/form", display_name="Other program's form",
+        )
+        ExternalProgramForm.objects.create(
+            program=self.program, user_type=UserType.teacher, integration=FormIntegration.formstack,
+            url="https://example.com/form", display_name="Teachers' form",
+        )
+
+        with self.assertNumQueries(1):
+            refresh_checkin_readiness(StudentRegistration.objects.filter(program=self.program))
+        results = Counter()
+        for registration in StudentRegistration.objects.filter(program=self.program):
+            # Compared as values: on sqlite, the Sum in get_amount_owed drops the trailing zero of e.g. 12.50
+            self.assertEqual(
+                (registration.forms_complete, registration.required_purchases_complete, registration.amount_owed),
+                (
+                    not registration.incomplete_forms().exists(), registration.all_required_purchases_complete(),
+                    registration.get_amount_owed() or 0,
+                ),
+            )
+            requirements_satisfied = registration.check_registration_requirements()["requirements_satisfied"]
+            self.assertEqual(registration.check_checkin_readiness()["requirements_satisfied"], requirements_satisfied)
+            results[requirements_satisfied] += 1
+        self.assertEqual(len(results), 2)
+
+    def test_checks_in_once(self):
+        registration = self.create_ready_student()
+        with self.assertNumQueries(2):
+            scanned, checked_in, requirements = check_in_student(self.program.id, registration.get_barcode_id())
+        self.assertEqual((scanned.id, checked_in, requirements["errors"]), (registration.id, True, []))
+        self.assertTrue(StudentRegistration.objects.get(id=registration.id).checked_in)
+
+        scanned, checked_in, _requirements = check_in_student(self.program.id, f" {registration.id} ")
+        self.assertEqual((scanned.checked_in, checked_in), (True, False))
+
+    def test_scans_read_stored_readiness(self):
+        registration = self.create_ready_student()
+        # Adding a student form refreshes the readiness of the program's students
+        form = ExternalProgramForm.objects.create(
+            program=self.program, user_type=UserType.student, integration=FormIntegration.formstack,
+            url="https://example.com/form", display_name="Late form",
+        )
+
+        scanned, checked_in, requirements = check_in_student(self.program.id, str(registration.id))
+        self.assertEqual((scanned.checked_in, checked_in), (False, False))
+        self.assertEqual(requirements["errors"], ["Not all program forms have been completed."])
+
+        self.complete_form(registration, form)
+        self.buy(registration, self.items[1], confirmed=False)
+        _scanned, checked_in, requirements = check_in_student(self.program.id, str(registration.id))
+        self.assertEqual(requirements["errors"], ["Not all program forms have been completed."])
+
+        refresh_checkin_readiness(StudentRegistration.objects.filter(id=registration.id))
+        _scanned, checked_in, requirements = check_in_student(self.program.id, str(registration.id))
+        self.assertFalse(checked_in)
+        self.assertEqual(requirements["errors"], ["Payment ($12.50) is still owed for items in cart."])
+
+    def test_refreshes_readiness_when_requirements_change(self):
+        registration = self.create_ready_student()
+        item = self.items[1]
+        item.required_for_registration = True
+        item.save()
+        self.assertFalse(StudentRegistration.objects.get(id=registration.id).required_purchases_complete)
+
+        item.delete()
+        self.assertTrue(StudentRegistration.objects.get(id=registration.id).required_purchases_complete)
+        # New registrations start out with their readiness computed
+        registration = create_student(self.program)
+        self.assertEqual((registration.forms_complete, registration.required_purchases_complete), (False, False))
+
+    def test_rejects_other_codes(self):
+        other_program, _slots = create_program(0)
+        registration = create_student(other_program)
+        with self.assertRaises(ValueError):
+            check_in_student(self.program.id, "not a code")
+        with self.assertRaises(StudentRegistration.DoesNotExist):
+            check_in_student(self.program.id, registration.get_barcode_id())
+
+    def test_endpoint(self):
+        self.client.force_login(create_admin())
+        url = reverse("student_checkin_api", kwargs={"pk": self.program.id})
+        registration = self.create_ready_student()
+
+        response = self.client.post(url, {"code": registration.get_barcode_id()}, content_type="application/json")
+        self.assertEqual(response.json()["data"], {
+            "registration": str(registration.id), "user": str(registration.user_id), "name": registration.user.username,
+            "checked_in": True, "already_checked_in": False, "errors": [],
+        })
+        response = self.client.post(url, {"code": str(registration.id)})
+        self.assertTrue(response.json()["data"]["already_checked_in"])
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.post(url, {"code": "nope"}).status_code, 400)
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.post(url, {"code": str(self.program.id)}).status_code, 404)
+
+
+class CheckinSyncTests(CheckinTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ready, self.checked_in, self.not_ready = [self.create_ready_student() for _ in range(3)]
+        self.checked_in.update(checked_in=True)
+        CompletedStudentForm.objects.filter(program_registration=self.not_ready).delete()
+        refresh_checkin_readiness(StudentRegistration.objects.filter(id=self.not_ready.id))
+        other_program, _slots = create_program(0)
+        self.foreign = create_student(other_program)
+
+    def test_results_per_distinct_code(self):
+        codes = [
+            self.ready.get_barcode_id(), str(self.checked_in.id), self.not_ready.get_barcode_id(),
+            self.foreign.get_barcode_id(), "not a code", self.ready.get_barcode_id(),
+        ]
+        results = sync_check_ins(self.program.id, codes)
+
+        self.assertEqual([(result["code"], result["result"], result["registration"]) for result in results], [
+            (codes[0], CheckinSyncResult.checked_in, self.ready.id),
+            (codes[1], CheckinSyncResult.already_checked_in, self.checked_in.id),
+            (codes[2], CheckinSyncResult.not_ready, self.not_ready.id),
+            (codes[3], CheckinSyncResult.not_found, self.foreign.id),
+            (codes[4], CheckinSyncResult.invalid_code, None),
+        ])
+        self.assertEqual(results[2]["errors"], ["Not all program forms have been completed."])
+        self.assertEqual(
+            set(StudentRegistration.objects.filter(checked_in=True).values_list("id", flat=True)),
+            {self.ready.id, self.checked_in.id},
+        )
+
+    def test_resending_changes_nothing(self):
+        codes = [self.ready.get_barcode_id(), self.not_ready.get_barcode_id(), self.foreign.get_barcode_id()]
+        sync_check_ins(self.program.id, codes)
+        before = set(StudentRegistration.objects.values_list("id", "checked_in", "updated_on"))
+
+        results = sync_check_ins(self.program.id, codes)
+
+        self.assertEqual([result["result"] for result in results], [
+            CheckinSyncResult.already_checked_in, CheckinSyncResult.not_ready, CheckinSyncResult.not_found,
+        ])
+        self.assertEqual(set(StudentRegistration.objects.values_list("id", "checked_in", "updated_on")), before)
+
+    def test_roster(self):
+        for registration, (first_name, last_name) in zip(
+            [self.ready, self.checked_in, self.not_ready], [("Ada", "Zed"), ("Bea", "Abe"), ("Al", "Abe")]
+        ):
+            registration.user.update(first_name=first_name, last_name=last_name)
+        self.buy(self.ready, self.items[1], confirmed=False)
+        refresh_checkin_readiness(StudentRegistration.objects.filter(id=self.ready.id))
+
+        with self.assertNumQueries(1):
+            rows = list(checkin_roster_rows(self.program.id))
+
+        self.assertEqual(rows[0][:3], ["registration", "barcode_id", "username"])
+        self.assertEqual([row[:2] for row in rows[1:]], [
+            [registration.id, registration.get_barcode_id()]
+            for registration in [self.not_ready, self.checked_in, self.ready]
+        ])
+        self.assertEqual(rows[1][3:], ["Al", "Abe", False, False, True, 0])
+        self.assertEqual(rows[2][5:], [True, True, True, 0])
+        self.assertEqual(rows[3][5:], [False, True, True, Decimal("12.50")])
+
+    def test_endpoints(self):
+        self.client.force_login(create_admin())
+        response = self.client.get(reverse("student_checkin_roster", kwargs={"pk": self.program.id}))
+        roster = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(len(roster), 4)
+        self.assertEqual(
+            {row[0] for row in roster[1:]},
+            {str(registration.id) for registration in [self.ready, self.checked_in, self.not_ready]},
+        )
+
+        url = reverse("student_checkin_sync_api", kwargs={"pk": self.program.id})
+        response = self.client.post(url, {"codes": [str(self.ready.id)]}, content_type="application/json")
+        self.assertEqual(response.json()["data"][0]["result"], CheckinSyncResult.checked_in)
+        for body in [{"codes": str(self.ready.id)}, {"codes": [1]}, {}]:
+            with self.assertLogs("django.request", "WARNING"):
+                self.assertEqual(self.client.post(url, body, content_type="application/json").status_code, 400)
+
+
+class TeacherCheckinRosterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.program, self.slots = create_program(2)
+        # 10pm on the first day and 9am on the next, in the site's time zone
+        for hours in [18, 29]:
+            self.slots.append(TimeSlotFactory(
+                program=self.program,
+                start_datetime=START + datetime.timedelta(hours=hours),
+                end_datetime=START + datetime.timedelta(hours=hours, minutes=50),
+            ))
+        self.day = timezone.localtime(START).date()
+        self.taught = create_section(self.program, self.slots[:1], classroom=ClassroomFactory(name="Room A"))
+        self.untaught = create_section(self.program, self.slots[:2], classroom=ClassroomFactory(name="Room B"))
+        self.late = create_section(self.program, self.slots[2:3], classroom=ClassroomFactory(name="Room C"))
+        self.next_day = create_section(self.program, self.slots[3:], classroom=ClassroomFactory(name="Room D"))
+        self.teachers = [
+            create_teacher(self.program, [self.taught.course]),
+            create_teacher(self.program, [self.taught.course, self.late.course]),
+        ]
+        for teacher, last_name in zip(self.teachers, ["Zed", "Abe"]):
+            teacher.user.update(first_name="Teacher", last_name=last_name)
+        TeacherProfile.objects.create(
+            user=self.teachers[0].user, cell_phone="555-0100", mit_affiliation=MITAffiliation.none, shirt_size="M"
+        )
+
+    def teacher(self, registration, cell_phone=None, checked_in=False):
+        return {
+            "id": registration.id, "first_name": "Teacher", "last_name": registration.user.last_name,
+            "cell_phone": cell_phone, "checked_in": checked_in,
+        }
+
+    def test_roster_of_a_local_day(self):
+        with self.assertNumQueries(2):
+            roster = teacher_checkin_roster(self.program.id, self.day)
+
+        self.assertEqual(roster, [
+            {
+                "course": self.taught.course.name, "classroom": "Room A",
+                "start_datetime": self.slots[0].start_datetime,
+                "teachers": [self.teacher(self.teachers[1]), self.teacher(self.teachers[0], "555-0100")],
+            },
+            {
+                "course": self.untaught.course.name, "classroom": "Room B",
+                "start_datetime": self.slots[0].start_datetime, "teachers": [],
+            },
+            {
+                "course": self.late.course.name, "classroom": "Room C",
+                "start_datetime": self.slots[2].start_datetime,
+                "teachers": [self.teacher(self.teachers[1])],
+            },
+        ])
+        self.assertEqual(
+            [meeting["classroom"] for meeting in teacher_checkin_roster(self.program.id, self.day, START)],
+            ["Room A", "Room B"],
+        )
+        next_day = self.day + datetime.timedelta(days=1)
+        self.assertEqual(
+            [meeting["classroom"] for meeting in teacher_checkin_roster(self.program.id, next_day)], ["Room D"]
+        )
+
+    def test_check_ins_are_not_cached(self):
+        teacher_checkin_roster(self.program.id, self.day)
+        ClassroomTimeSlot.objects.filter(course_section=self.late).update(course_section=None)
+        SectionMeeting.objects.filter(course_section=self.late).delete()
+        self.teachers[1].update(checked_in_at=timezone.now())
+        # Yesterday's check-in does not count
+        self.teachers[0].update(checked_in_at=timezone.now() - datetime.timedelta(days=1))
+
+        with self.assertNumQueries(1):
+            roster = teacher_checkin_roster(self.program.id, self.day)
+
+        self.assertEqual(len(roster), 3)
+        self.assertEqual(roster[0]["teachers"], [
+            self.teacher(self.teachers[1], checked_in=True), self.teacher(self.teachers[0], "555-0100"),
+        ])
+        cache.clear()
+        self.assertEqual(len(teacher_checkin_roster(self.program.id, self.day)), 2)
+
+    def test_check_in_page(self):
+        self.client.force_login(create_admin())
+        url = reverse(
+            "check_in_teachers", kwargs={"pk": self.program.id, "timeslot_id": self.slots[0].id, "unit": "slot"}
+        )
+        self.assertEqual(len(self.client.get(url).context["courses_list"]), 2)
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+        _other_program, other_slots = create_program(1)
+        with self.assertLogs("django.request", "WARNING"):
+            response = self.client.get(reverse(
+                "check_in_teachers", kwargs={"pk": self.program.id, "timeslot_id": other_slots[0].id, "unit": "day"}
+            ))
+        self.assertEqual(response.status_code, 404)
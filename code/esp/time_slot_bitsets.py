@@ -0,0 +1,57 @@
+"""
+Fixed-width bitsets over a program's TimeSlots, stored as plain ints: bit i is set when the i-th slot of the program,
+in chronological order, is included. Checking a section against a student's schedule or availability is then a
+single bitwise AND, however many slots either of them spans.
+"""
+from esp.models.course_scheduling_models import ClassroomTimeSlot
+from esp.models.program_models import TimeSlot
+from esp.models.program_registration_models import StudentAvailability
+
+
+def lowest_slot(bitset):
+    """Index of the earliest slot in a non-empty bitset."""
+    return (bitset & -bitset).bit_length() - 1
+
+
+class TimeSlotBitsets:
+    def __init__(self, program_id, slot_ids):
+        self.program_id = program_id
+        self.slot_ids = slot_ids  #: TimeSlot id for each bit, in chronological order
+        self.bit_of = {slot_id: 1 << index for index, slot_id in enumerate(slot_ids)}
+        self.all_slots = (1 << len(slot_ids)) - 1
+
+    @classmethod
+    def for_program(cls, program_id):
+        slots = TimeSlot.objects.filter(program_id=program_id).order_by("start_datetime")
+        return cls(program_id, list(slots.values_list("id", flat=True)))
+
+    def from_slot_ids(self, slot_ids):
+        bitset = 0
+        for slot_id in slot_ids:
+            bitset |= self.bit_of[slot_id]
+        return bitset
+
+    def section_footprints(self):
+        """Map each scheduled section of the program to the slots covered by its ClassroomTimeSlots (one query)."""
+        footprints = {}
+        for section_id, slot_id in ClassroomTimeSlot.objects.filter(
+            time_slot__program_id=self.program_id, course_section__isnull=False
+        ).values_list("course_section_id", "time_slot_id"):
+            footprints[section_id] = footprints.get(section_id, 0) | self.bit_of[slot_id]
+        return footprints
+
+    def student_availability(self, registration_ids=None):
+        """
+        Map registrations to the slots they marked themselves available for (one query). Registrations without any
+        StudentAvailability are left out; callers treat them as available for every slot, since not every program
+        asks students for their availability.
+        """
+        availabilities = StudentAvailability.objects.filter(
+            registration__program_id=self.program_id, time_slot__program_id=self.program_id
+        )
+        if registration_ids is not None:
+            availabilities = availabilities.filter(registration_id__in=registration_ids)
+        available = {}
+        for registration_id, slot_id in availabilities.values_list("registration_id", "time_slot_id"):
+            available[registration_id] = available.get(registration_id, 0) | self.bit_of[slot_id]
+        return available
@@ -11,16 +11,22 @@ from esp.views.admin_views import (AdminCheckinTeachersView, AdminCommentView,
                                    AdminManageStudentsView,
                                    AdminManageTeachersView,
                                    ApproveFinancialAidView, ClassroomListView,
+                                   LotteryJobStatusView, LotteryRunDiffView,
                                    PrintStudentSchedulesView,
-                                   ProgramCreateView, ProgramListView,
-                                   ProgramLotteryView, ProgramStageCreateView,
-                                   ProgramStageUpdateView, ProgramUpdateView,
+                                   ProgramAutoScheduleView, ProgramCreateView,
+                                   ProgramListView,
+                                   ProgramLotteryView, ProgramScheduleConflictsView,
+                                   ProgramStageCreateView, ProgramStageUpdateView,
+                                   ProgramUpdateView,
                                    SendEmailsView, StudentCashPaymentView,
+                                   StudentCheckinApiView, StudentCheckinRosterView, StudentCheckinSyncApiView,
                                    StudentCheckinView, TeacherCheckinView)
 from esp.views.scheduler_views import (AssignClassroomTimeSlotsApiView,
                                        ClassroomApiView,
                                        ClassroomTimeSlotApiView, CourseApiView,
-                                       SchedulerView,
+                                       ScheduleChangesApiView, ScheduleConflictsApiView,
+                                       SchedulerBootstrapApiView, SchedulerView,
+                                       SectionMoveImpactApiView, SectionPlacementsApiView,
                                        TeacherAvailabilityApiView,
                                        TimeSlotApiView)
 from esp.views.student_registration_views import (
@@ -70,6 +76,11 @@ urlpatterns = [
     path('admin/programs/<uuid:pk>/classes/update/<uuid:class_pk>/', AdminCourseUpdateView.as_view(), name='update_course'),
     path('admin/programs/<uuid:pk>/classes/', AdminCourseListView.as_view(), name='courses'),
     path('admin/programs/<uuid:pk>/lottery/', ProgramLotteryView.as_view(), name="program_lottery"),
+    path('admin/programs/<uuid:pk>/lottery/diff/', LotteryRunDiffView.as_view(), name="lottery_run_diff"),
+    path(
+        'admin/programs/<uuid:pk>/lottery/jobs/<uuid:job_pk>/', LotteryJobStatusView.as_view(),
+        name="lottery_job_status"
+    ),
     path(
         'admin/programs/<uuid:pk>/approve_financial_aid/',
         ApproveFinancialAidView.as_view(), name="approve_financial_aid"
@@ -91,6 +102,11 @@ urlpatterns = [
 
     path('admin/programs/<uuid:pk>/manage/classroom_availability/', AdminManageClassroomAvailabilityView.as_view(),
          name="manage_classroom_availability"),
+    path('admin/programs/<uuid:pk>/auto_schedule/', ProgramAutoScheduleView.as_view(), name="program_auto_schedule"),
+    path(
+        'admin/programs/<uuid:pk>/schedule_conflicts/', ProgramScheduleConflictsView.as_view(),
+        name="program_schedule_conflicts"
+    ),
 
     path('admin/programs/<uuid:pk>/classes/create_course_sections/', AdminCreateCourseSectionsView.as_view(),
          name="create_course_sections"),
@@ -190,8 +206,31 @@ urlpatterns = [
     # Scheduler
     path("scheduler/", SchedulerView.as_view(), name="scheduler"),  # TODO: make program specific url
     path("api/v0/classrooms/", ClassroomApiView.as_view(), name="classroom_api"),
+    path("api/v0/programs/<uuid:pk>/check-in/", StudentCheckinApiView.as_view(), name="student_checkin_api"),
+    path(
+        "api/v0/programs/<uuid:pk>/check-in/roster/", StudentCheckinRosterView.as_view(), name="student_checkin_roster"
+    ),
+    path(
+        "api/v0/programs/<uuid:pk>/check-in/sync/", StudentCheckinSyncApiView.as_view(), name="student_checkin_sync_api"
+    ),
     path("api/v0/programs/<uuid:pk>/courses/", CourseApiView.as_view(), name="course_api"),
     path("api/v0/programs/<uuid:pk>/time-slots/", TimeSlotApiView.as_view(), name="time_slot_api"),
+    path("api/v0/programs/<uuid:pk>/schedule/", SchedulerBootstrapApiView.as_view(), name="scheduler_bootstrap_api"),
+    path(
+        "api/v0/programs/<uuid:pk>/schedule/changes/", ScheduleChangesApiView.as_view(), name="schedule_changes_api"
+    ),
+    path(
+        "api/v0/programs/<uuid:pk>/schedule/conflicts/",
+        ScheduleConflictsApiView.as_view(), name="schedule_conflicts_api"
+    ),
+    path(
+        "api/v0/programs/<uuid:pk>/sections/<uuid:section_pk>/placements/",
+        SectionPlacementsApiView.as_view(), name="section_placements_api"
+    ),
+    path(
+        "api/v0/programs/<uuid:pk>/sections/<uuid:section_pk>/move-impact/",
+        SectionMoveImpactApiView.as_view(), name="section_move_impact_api"
+    ),
     path(
         "api/v0/programs/<uuid:pk>/teacher-availability/",
         TeacherAvailabilityApiView.as_view(), name="teacher_availability_api"
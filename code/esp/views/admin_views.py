@@ -1,12 +1,15 @@
-from collections import defaultdict
+import csv
+import json
+from collections import Counter, defaultdict
 from uuid import UUID
 
 from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.core.mail import send_mail
-from django.db.models import (BooleanField, Count, ExpressionWrapper, F, Max,
-                              Min, OuterRef, Prefetch, Q, Subquery, Sum, Value)
+from django.db.models import (Count, F, Max, Min, OuterRef, Prefetch,
+                              Subquery, Sum, Value)
 from django.db.models.functions import Concat
-from django.http import Http404, HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.template import Context, Template
 from django.urls import reverse_lazy
@@ -16,32 +19,44 @@ from django.views.generic import (CreateView, FormView, ListView, TemplateView,
 from django.views.generic.base import View
 from django.views.generic.detail import SingleObjectMixin
 from multiform_views.edit import FormsView
+from rest_framework import status
 
 from common.constants import PermissionType, UserType
 from common.forms import CrispyFormsetHelper
 from common.models import User
+from common.utils import Echo
 from common.views import PermissionRequiredMixin
 from config.settings import DEFAULT_FROM_EMAIL
-from esp.constants import (ClassroomTagCategory, CourseStatus, PaymentMethod,
+from esp.checkin import check_in_student, checkin_roster_rows, refresh_checkin_readiness, sync_check_ins
+from esp.classroom_availability import classroom_availability, set_classroom_availability
+from esp.conflict_report import schedule_conflict_report
+from esp.constants import (ClassroomTagCategory, CourseStatus, LotteryMode,
+                           LotteryPhase, PaymentMethod, ScheduleConflictType,
                            StudentRegistrationStepType)
-from esp.forms import (AdminCourseForm, CommentForm, ProgramForm,
-                       StudentProgramRegistrationStepFormset, ProgramStageForm,
+from esp.forms import (AdminCourseForm, ClassroomAvailabilityPatternForm, CommentForm, ProgramForm,
+                       ProgramLotteryForm, StudentProgramRegistrationStepFormset, ProgramStageForm,
                        QuerySendEmailForm, StudentSendEmailForm,
                        TeacherSendEmailForm)
 from esp.legacy.latex import render_to_latex
-from esp.lottery import LotteryDisallowedError, run_program_lottery
-from esp.models.course_scheduling_models import (ClassroomTimeSlot,
-                                                 CourseSection)
+from esp.lottery import (LotteryDisallowedError, cancel_lottery_job, diff_lottery_runs, enqueue_lottery_job,
+                         roll_back_lottery_run)
+from esp.models.course_scheduling_models import CourseSection
 from esp.models.program_models import (Classroom, Course, Program,
                                        ProgramStage, PurchaseableItem,
                                        TimeSlot)
 from esp.models.program_registration_models import (ClassRegistration,
                                                     FinancialAidRequest,
+                                                    LotteryJob, LotteryRun,
                                                     PurchaseLineItem,
                                                     StudentRegistration,
                                                     TeacherRegistration,
                                                     UserPayment)
+from esp.registration_stages import program_registration_stages
+from esp.schedule_changes import ScheduleConflictError
+from esp.scheduling import schedule_program
 from esp.serializers import CommentSerializer, UserSerializer
+from esp.teacher_checkin import teacher_checkin_roster
+from esp.teacher_registration_steps import program_registration_steps
 
 ######################################
 # ADMIN DASHBOARD
@@ -103,6 +118,10 @@ class AdminManageStudentsView(PermissionRequiredMixin, SingleObjectMixin, Templa
         context['students'] = UserSerializer(students.annotate(
             search_string=Concat(F("first_name"), Value(' '), F("last_name"), Value(', ('),
                                  F("username"), Value(')'), )), many=True).data
+        stage_counts = Counter(program_registration_stages(program).values())
+        context['stage_counts'] = [
+            (stage, stage_counts[stage]) for stage in [*program.stages.all(), None] if stage_counts[stage]
+        ]
         student_id = self.kwargs.get('student_id')
         context['student_id'] = student_id
         if context['student_id']:
@@ -187,6 +206,64 @@ class StudentCheckinView(PermissionRequiredMixin, View):
         return redirect('manage_students_specific', pk=program_id, student_id=student_id)
 
 
+class StudentCheckinApiView(PermissionRequiredMixin, View):
+    """Checks in the student whose barcode or QR code is posted as ``code``, for scanners (see esp.checkin)"""
+    permission = PermissionType.admin_dashboard_actions
+
+    def post(self, request, *args, **kwargs):
+        try:
+            if request.content_type == "application/json":
+                code = json.loads(request.body)["code"]
+            else:
+                code = request.POST["code"]
+            registration, checked_in, requirements = check_in_student(self.kwargs["pk"], code)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return JsonResponse({}, status=status.HTTP_400_BAD_REQUEST)
+        except StudentRegistration.DoesNotExist:
+            return JsonResponse({}, status=status.HTTP_404_NOT_FOUND)
+        return JsonResponse({"data": {
+            "registration": registration.id,
+            "user": registration.user_id,
+            "name": " ".join(
+                name for name in (registration.user.first_name, registration.user.last_name) if name
+            ) or registration.user.username,
+            "checked_in": registration.checked_in,
+            "already_checked_in": registration.checked_in and not checked_in,
+            "errors": requirements["errors"],
+        }})
+
+
+class StudentCheckinRosterView(PermissionRequiredMixin, View):
+    """The program's check-in roster as a CSV file, for checking students in offline (see esp.checkin)"""
+    permission = PermissionType.admin_dashboard_actions
+
+    def get(self, request, *args, **kwargs):
+        program = get_object_or_404(Program, pk=self.kwargs["pk"])
+        writer = csv.writer(Echo())
+        response = StreamingHttpResponse(
+            (writer.writerow(row) for row in checkin_roster_rows(program.id)), content_type="text/csv"
+        )
+        response["Content-Disposition"] = f'attachment; filename="check_in_roster_{program.id}.csv"'
+        return response
+
+
+class StudentCheckinSyncApiView(PermissionRequiredMixin, View):
+    """
+    Applies check-ins made offline, posted as JSON ``{"codes": [scanned barcode or QR code, ...]}``; safe to retry
+    """
+    permission = PermissionType.admin_dashboard_actions
+
+    def post(self, request, *args, **kwargs):
+        program = get_object_or_404(Program, pk=self.kwargs["pk"])
+        try:
+            codes = json.loads(request.body)["codes"]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+            return JsonResponse({}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({"data": sync_check_ins(program.id, codes)})
+
+
 class StudentCashPaymentView(PermissionRequiredMixin, SingleObjectMixin, View):
     permission = PermissionType.admin_dashboard_actions
     model = StudentRegistration
@@ -220,6 +297,7 @@ class StudentCashPaymentView(PermissionRequiredMixin, SingleObjectMixin, View):
             transaction_datetime=timezone.now(),
         )
         whole_cart.update(payment=payment, purchase_confirmed_on=timezone.now())
+        refresh_checkin_readiness(StudentRegistration.objects.filter(id=registration.id))
         messages.success(request, f"A total payment of ${total_charge} ({num_items} items) has been logged.")
         return redirect("manage_students_specific", pk=registration.program_id, student_id=registration.user_id)
 
@@ -233,17 +311,28 @@ class AdminManageTeachersView(PermissionRequiredMixin, SingleObjectMixin, Templa
         self.object = self.get_object()
         context = super().get_context_data(**kwargs)
         context["program_id"] = self.object.id
-        course_sections = CourseSection.objects.filter(course__program=self.object)
+        course_sections = CourseSection.objects.filter(course__program=self.object).prefetch_related(
+            "meetings__classroom"
+        )
         context["timeslot_dict"] = self.get_time_dict(course_sections)
+        completed_counts, to_do_counts = Counter(), Counter()
+        for visible_steps, completed_step_ids in program_registration_steps(self.object).values():
+            completed_counts.update(completed_step_ids)
+            to_do_counts.update(step.id for step in visible_steps if not step.completed)
+        context["step_progress"] = [
+            (step, completed_counts[step.id], to_do_counts[step.id])
+            for step in self.object.teacher_registration_steps.all()
+        ]
         return context
 
     def get_time_dict(self, sections):
         """organizes the datetimes into a dict of lists with each key being a date and each list
             being the datetimes from that day"""
         time_dict = defaultdict(list)
+        timeslots = {timeslot.start_datetime: timeslot for timeslot in TimeSlot.objects.filter(program=self.object)}
         for section in sections:
             for meeting in section.get_section_times():
-                timeslot = TimeSlot.objects.get(program=self.object, start_datetime=meeting[0])
+                timeslot = timeslots[meeting[0]]
                 if timeslot not in time_dict[meeting[0].date()]:
                     time_dict[meeting[0].date()].append(timeslot)
         for key, value in time_dict.items():
@@ -264,56 +353,18 @@ class AdminCheckinTeachersView(PermissionRequiredMixin, TemplateView):
         context["unit"] = unit
         timeslot_id = self.kwargs["timeslot_id"]
         context["timeslot_id"] = timeslot_id
-        time_slot = TimeSlot.objects.get(id=timeslot_id)
-        context["time_range"] = time_slot.start_datetime.time() if unit == "slot" else time_slot.start_datetime.date()
-        sections = CourseSection.objects.filter(course__program_id=program_id)
-        classroom_timeslots = []
-        if self.kwargs["unit"] == 'day':
-            day = TimeSlot.objects.get(id=timeslot_id).start_datetime.date()
-            sections = sections.filter(time_slots__time_slot__start_datetime__date=day).distinct()
-            for section in sections:
-                course_times = section.get_section_times()
-                for time in course_times:
-                    if time[0].date() == day:
-                        classroom_timeslots.append(ClassroomTimeSlot.objects.get(
-                            course_section=section,
-                            time_slot=TimeSlot.objects.get(program_id=program_id,
-                                                           start_datetime=time[0],
-                                                           ),
-                        ))
-        elif self.kwargs["unit"] == 'slot':
-            sections = sections.filter(time_slots__time_slot_id=timeslot_id).distinct()
-            for section in sections:
-                course_times = section.get_section_times()
-                for time in course_times:
-                    if time[0] == time_slot.start_datetime:
-                        classroom_timeslots.append(ClassroomTimeSlot.objects.get(
-                            course_section=section,
-                            time_slot=time_slot,
-                        ))
+        time_slot = get_object_or_404(TimeSlot, id=timeslot_id, program_id=program_id)
+        start = timezone.localtime(time_slot.start_datetime)
+        if unit == "day":
+            context["time_range"] = start.date()
+            context["courses_list"] = teacher_checkin_roster(program_id, start.date())
+        elif unit == "slot":
+            context["time_range"] = start.time()
+            context["courses_list"] = teacher_checkin_roster(program_id, start.date(), time_slot.start_datetime)
         else:
             raise Http404
-        course_list = self.get_courses_list(classroom_timeslots)
-        context["courses_list"] = sorted(course_list, key=lambda x: x['classroom_info'].time_slot.start_datetime.time())
         return context
 
-    def get_courses_list(self, classroom_timeslots):
-        courses_list = []
-        today = timezone.now().date()
-        for classroom_timeslot in classroom_timeslots:
-            course_dict = {
-                'course': classroom_timeslot.course_section.course,
-                'classroom_info': classroom_timeslot,
-                'teachers': classroom_timeslot.course_section.course.teacher_registrations.annotate(
-                    checked_in=ExpressionWrapper(
-                        Q(checked_in_at__isnull=False, checked_in_at__date=today),
-                        output_field=BooleanField()
-                    )
-                ),
-            }
-            courses_list.append(course_dict)
-        return courses_list
-
 
 class TeacherCheckinView(PermissionRequiredMixin, SingleObjectMixin, View):
     permission = PermissionType.admin_dashboard_actions
@@ -462,19 +513,102 @@ class ProgramLotteryView(PermissionRequiredMixin, SingleObjectMixin, TemplateVie
         ).values(
             "course_section__course__name", "course_section", "course_section__display_id",
         ).annotate(count=Count('id')).distinct().order_by('count')
+        context["lottery_modes"] = LotteryMode.choices
+        context["lottery_runs"] = self.object.lottery_runs.all()
+        context["lottery_job"] = self.object.lottery_jobs.select_related("lottery_run").first()
         return context
 
     def post(self, request, *args, **kwargs):
+        if request.POST.get("submit") == "rollback":
+            return self.roll_back(request.POST.get("lottery_run"))
+        if request.POST.get("submit") == "cancel":
+            return self.cancel(request.POST.get("lottery_job"))
+        form = ProgramLotteryForm(request.POST)
+        if not form.is_valid():
+            for field, errors in form.errors.items():
+                for error in errors:
+                    messages.error(request, f"{form[field].label}: {error}")
+            return redirect("program_lottery", pk=self.kwargs["pk"])
+        mode = form.cleaned_data["mode"]
+        if request.POST.get("submit") == "simulate":
+            return self.simulate(mode, form.cleaned_data["runs"] or 20)
         try:
-            registrations_count = run_program_lottery(self.get_object())
-            if registrations_count == 0:
-                messages.warning(request, "No course registrations created. Have students submitted preferences?")
-            else:
-                messages.success(request, f"{registrations_count} course registrations created")
+            enqueue_lottery_job(
+                self.get_object(), mode=mode, seed=form.cleaned_data["seed"],
+                incremental=request.POST.get("submit") == "incremental", requested_by=request.user,
+            )
+            messages.info(request, "Lottery queued. Its progress is shown below.")
         except LotteryDisallowedError as e:
             messages.error(request, str(e))
         return redirect("program_lottery", pk=self.kwargs["pk"])
 
+    def simulate(self, mode, runs):
+        """Queue a dry run, whose results the lottery page shows once the worker has finished it."""
+        try:
+            enqueue_lottery_job(self.get_object(), mode=mode, simulation_runs=runs, requested_by=self.request.user)
+            messages.info(self.request, "Simulation queued. Its progress is shown below.")
+        except LotteryDisallowedError as e:
+            messages.error(self.request, str(e))
+        return redirect("program_lottery", pk=self.kwargs["pk"])
+
+    def cancel(self, lottery_job_id):
+        try:
+            cancel_lottery_job(self.get_object().lottery_jobs.get(id=lottery_job_id))
+            messages.success(self.request, "Lottery job cancelled")
+        except (LotteryJob.DoesNotExist, ValidationError):
+            messages.error(self.request, "Lottery job not found")
+        except LotteryDisallowedError as e:
+            messages.error(self.request, str(e))
+        return redirect("program_lottery", pk=self.kwargs["pk"])
+
+    def roll_back(self, lottery_run_id):
+        try:
+            lottery_run = self.get_object().lottery_runs.get(id=lottery_run_id)
+            deleted_count = roll_back_lottery_run(lottery_run)
+            messages.success(self.request, f"Lottery run rolled back; {deleted_count} course registrations deleted")
+        except (LotteryRun.DoesNotExist, ValidationError):
+            messages.error(self.request, "Lottery run not found")
+        except LotteryDisallowedError as e:
+            messages.error(self.request, str(e))
+        return redirect("program_lottery", pk=self.kwargs["pk"])
+
+
+class LotteryJobStatusView(PermissionRequiredMixin, View):
+    """Progress of a queued lottery, polled by the lottery page while the job is pending."""
+    permission = PermissionType.run_program_lottery
+
+    def get(self, request, *args, **kwargs):
+        job = LotteryJob.objects.filter(
+            id=self.kwargs["job_pk"], program_id=self.kwargs["pk"]
+        ).values("status", "phase", "error", "lottery_run__placed_count").first()
+        if job is None:
+            raise Http404("Lottery job not found")
+        return JsonResponse({
+            "status": job["status"],
+            "phase": job["phase"],
+            "phase_display": LotteryPhase(job["phase"]).label if job["phase"] else "",
+            "error": job["error"],
+            "placed": job["lottery_run__placed_count"],
+        })
+
+
+class LotteryRunDiffView(PermissionRequiredMixin, SingleObjectMixin, TemplateView):
+    permission = PermissionType.run_program_lottery
+    model = Program
+    template_name = "admin/lottery_run_diff.html"
+
+    def get_context_data(self, **kwargs):
+        self.object = self.get_object()
+        context = super().get_context_data(**kwargs)
+        runs = self.object.lottery_runs.all()
+        try:
+            context["first_run"] = runs.get(id=self.request.GET.get("first"))
+            context["second_run"] = runs.get(id=self.request.GET.get("second"))
+        except (LotteryRun.DoesNotExist, ValidationError):
+            raise Http404("Lottery run not found")
+        context["sections"] = diff_lottery_runs(context["first_run"], context["second_run"])
+        return context
+
 
 class SendEmailsView(PermissionRequiredMixin, FormsView):
     permission = PermissionType.send_email
@@ -517,6 +651,15 @@ class SendEmailsView(PermissionRequiredMixin, FormsView):
             students = students.filter(
                 registrations__completed_steps__step__step_key=form.cleaned_data[
                     'registration_step'])
+        program_stage = form.cleaned_data['program_stage']
+        if program_stage:
+            stages = program_registration_stages(
+                program_stage.program,
+                StudentRegistration.objects.filter(program=program_stage.program, user__in=students),
+            )
+            students = students.filter(registrations__id__in=[
+                registration_id for registration_id, stage in stages.items() if stage == program_stage
+            ])
         only_guardians = form.cleaned_data['only_guardians']
         self._send_emails(students, form, only_guardians)
         return HttpResponseRedirect(self.success_url)
@@ -578,7 +721,8 @@ class PrintStudentSchedulesView(PermissionRequiredMixin, SingleObjectMixin, View
             Prefetch("registrations__class_registrations", queryset=ClassRegistration.objects.annotate(
                 start_time=Min("course_section__time_slots__time_slot__start_datetime")).order_by("start_time")
             ),
-            "registrations__class_registrations__course_section__time_slots",
+            "registrations__class_registrations__course_section__time_slots__classroom",
+            "registrations__class_registrations__course_section__meetings__classroom",
             "registrations__class_registrations__course_section__course__program",
         )
 
@@ -605,6 +749,7 @@ class ApproveFinancialAidView(PermissionRequiredMixin, SingleObjectMixin, Templa
     def post(self, request, *args, **kwargs):
         program = self.get_object()
         requests = FinancialAidRequest.objects.filter(program_registration__program=program, reviewed_on__isnull=True)
+        registration_ids = list(requests.values_list("program_registration_id", flat=True))
         # Update all eligible items already in requesters' carts
         PurchaseLineItem.objects.filter(
             purchase_confirmed_on__isnull=True,
@@ -614,6 +759,7 @@ class ApproveFinancialAidView(PermissionRequiredMixin, SingleObjectMixin, Templa
             item__eligible_for_financial_aid=True,
         ).update(charge_amount=0, purchase_confirmed_on=timezone.now())
         requests.update(reviewed_on=timezone.now(), approved=True)
+        refresh_checkin_readiness(StudentRegistration.objects.filter(id__in=registration_ids))
         return redirect("admin_dashboard")
 
 
@@ -625,39 +771,103 @@ class AdminManageClassroomAvailabilityView(PermissionRequiredMixin, SingleObject
     def get_context_data(self, **kwargs):
         self.object = self.get_object()
         context = super().get_context_data(**kwargs)
-        context["classrooms"] = {
-            classroom: list(classroom.time_slots.values_list("time_slot_id", flat=True))
-            for classroom in Classroom.objects.all()
-        }
+        existing = classroom_availability(self.object.id)
+        time_slots = list(self.object.time_slots.order_by("start_datetime"))
+        context["time_slots"] = time_slots
+        context["classrooms"] = [
+            (classroom, [(time_slot, (classroom.id, time_slot.id) in existing) for time_slot in time_slots])
+            for classroom in Classroom.objects.order_by("name")
+        ]
+        context.setdefault("pattern_form", ClassroomAvailabilityPatternForm(program=self.object))
         return context
 
     def post(self, request, *args, **kwargs):
         program = self.get_object()
-        classroom_ids = [key.split(":")[1] for key in request.POST.keys() if key.startswith("classroom:")]
-        time_slots_to_create = []
-        deleted_count = 0
-        all_time_slot_ids = TimeSlot.objects.filter(program=program).values_list("id", flat=True)
-
-        for classroom in Classroom.objects.all().prefetch_related("time_slots"):
-            existing_time_slots = {time_slot.time_slot_id for time_slot in classroom.time_slots.filter(time_slot__program=program)}
-            new_time_slots = set(UUID(id) for id in request.POST.getlist(f"classroom:{classroom.id}"))
-            for time_slot_id in new_time_slots - existing_time_slots:
-                if time_slot_id in all_time_slot_ids:
-                    time_slots_to_create.append(ClassroomTimeSlot(classroom=classroom, time_slot_id=time_slot_id))
-            to_delete_ids = existing_time_slots - new_time_slots
-            to_delete = classroom.time_slots.filter(time_slot_id__in=to_delete_ids)
-            if any(slot.course_section for slot in to_delete):
-                messages.warning(
-                    request,
-                    "You have deleted at least one classroom time slot that already had a course scheduled. Please re-schedule."
-                )
-            deleted_count += len(to_delete_ids)
-            to_delete.delete()
-
-        created = ClassroomTimeSlot.objects.bulk_create(time_slots_to_create)
-        messages.success(request, f"{len(created)} new availabilities created and {deleted_count} deleted.")
+        existing = classroom_availability(program.id)
+        if "pattern" in request.POST:
+            form = ClassroomAvailabilityPatternForm(request.POST, program=program)
+            if not form.is_valid():
+                return self.render_to_response(self.get_context_data(pattern_form=form))
+            if form.cleaned_data["action"] == "add":
+                available = existing.keys() | form.pattern(program.id)
+            else:
+                available = existing.keys() - form.pattern(program.id)
+        else:
+            try:
+                available = {
+                    (UUID(key.split(":")[1]), UUID(time_slot_id))
+                    for key in request.POST.keys() if key.startswith("classroom:")
+                    for time_slot_id in request.POST.getlist(key)
+                }
+            except ValueError:
+                messages.error(request, "Invalid classroom availability")
+                return redirect("manage_classroom_availability", pk=program.id)
+
+        created_count, deleted_count, unscheduled_section_ids = set_classroom_availability(
+            program.id, available, existing=existing
+        )
+        if unscheduled_section_ids:
+            messages.warning(
+                request,
+                f"You have deleted classroom time slots that {len(unscheduled_section_ids)} scheduled section"
+                f"{'' if len(unscheduled_section_ids) == 1 else 's'} met in. Please re-schedule."
+            )
+        messages.success(request, f"{created_count} new availabilities created and {deleted_count} deleted.")
+        if "pattern" in request.POST:
+            return redirect("manage_classroom_availability", pk=program.id)
         return redirect("admin_dashboard")
 
+
+class ProgramAutoScheduleView(PermissionRequiredMixin, SingleObjectMixin, TemplateView):
+    permission = PermissionType.use_scheduler
+    model = Program
+    template_name = "admin/program_auto_schedule.html"
+
+    def get_context_data(self, **kwargs):
+        self.object = self.get_object()
+        context = super().get_context_data(**kwargs)
+        sections = CourseSection.objects.filter(course__program=self.object, course__status=CourseStatus.accepted)
+        context["section_count"] = sections.count()
+        context["unscheduled_count"] = sections.filter(time_slots__isnull=True).count()
+        return context
+
+    def post(self, request, *args, **kwargs):
+        preview = request.POST.get("submit") == "preview"
+        try:
+            result = schedule_program(self.get_object(), commit=not preview)
+        except ScheduleConflictError as e:
+            messages.error(request, f"{e}; please try again")
+            return redirect("program_auto_schedule", pk=self.kwargs["pk"])
+        unplaced_sections = CourseSection.objects.filter(id__in=result["unplaced"]).select_related("course")
+        unplaced = sorted(
+            ((section, result["unplaced"][section.id]) for section in unplaced_sections),
+            key=lambda item: (item[0].course.name, item[0].display_id),
+        )
+        if preview:
+            # Nothing was saved, so show what would happen instead of redirecting
+            return self.render_to_response(self.get_context_data(preview=result, unplaced=unplaced))
+        messages.success(request, f"{len(result['placed'])} sections scheduled")
+        for section, reason in unplaced:
+            messages.warning(request, f"{section.course.name} (section {section.display_id}) not scheduled: {reason}")
+        return redirect("program_auto_schedule", pk=self.kwargs["pk"])
+
+
+class ProgramScheduleConflictsView(PermissionRequiredMixin, SingleObjectMixin, TemplateView):
+    permission = PermissionType.use_scheduler
+    model = Program
+    template_name = "admin/program_schedule_conflicts.html"
+
+    def get_context_data(self, **kwargs):
+        self.object = self.get_object()
+        context = super().get_context_data(**kwargs)
+        conflicts = schedule_conflict_report(self.object)
+        context["conflict_count"] = len(conflicts)
+        context["conflicts_by_type"] = [
+            (conflict_type.label, [conflict for conflict in conflicts if conflict["type"] == conflict_type])
+            for conflict_type in ScheduleConflictType
+        ]
+        return context
+
 ###########################################################
 
 
@@ -1,10 +1,15 @@
 import json
+from uuid import UUID
 
-from django.http import JsonResponse
+import ujson
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView
 from django.views.generic.list import BaseListView
 from rest_framework import status
@@ -12,10 +17,17 @@ from rest_framework import status
 from common.constants import PermissionType
 from common.utils import csrf_exempt_localhost
 from common.views import PermissionRequiredMixin
+from esp.conflict_report import schedule_conflict_report
+from esp.constants import CourseStatus
+from esp.course_teacher_availability import course_teacher_availability
 from esp.forms import AssignClassroomTimeSlotsForm
-from esp.models.course_scheduling_models import ClassroomTimeSlot
+from esp.models.course_scheduling_models import ClassroomTimeSlot, CourseSection
 from esp.models.program_models import Classroom, Course, Program, TimeSlot
 from esp.models.program_registration_models import TeacherAvailability
+from esp.move_impact import section_move_impact
+from esp.placement_suggestions import placement_index
+from esp.schedule_changes import ScheduleConflictError, schedule_changes, schedule_versions
+from esp.scheduler_payload import build_scheduler_payload, scheduler_payload_etag
 from esp.serializers import ClassroomSerializer, CourseSerializer, TeacherAvailabilitySerializer, TimeSlotSerializer, \
     ClassroomTimeSlotSerializer
 
@@ -44,11 +56,14 @@ class AssignClassroomTimeSlotsApiView(View):
         except:
             # Todo
             return JsonResponse({}, status=status.HTTP_400_BAD_REQUEST)
-        form = AssignClassroomTimeSlotsForm(data)
+        form = AssignClassroomTimeSlotsForm(data, program=get_object_or_404(Program, pk=self.kwargs["pk"]))
         if not form.is_valid():
             return JsonResponse({}, status=status.HTTP_400_BAD_REQUEST)
-        form.save()
-        return JsonResponse({})
+        try:
+            version = form.save()
+        except ScheduleConflictError as e:
+            return JsonResponse({"conflicts": e.classroom_time_slot_ids}, status=status.HTTP_409_CONFLICT)
+        return JsonResponse({"version": version})
 
 
 class ClassroomApiView(SerializerResponseMixin, BaseListView):
@@ -75,6 +90,89 @@ class CourseApiView(SerializerResponseMixin, BaseListView):
         return Course.objects.filter(program=program)
 
 
+@method_decorator(gzip_page, name="dispatch")
+@method_decorator(cache_control(private=True, no_cache=True), name="dispatch")
+@method_decorator(condition(etag_func=lambda request, pk: scheduler_payload_etag(pk)), name="get")
+class SchedulerBootstrapApiView(PermissionRequiredMixin, View):
+    """
+    The whole program schedule in one columnar payload (see esp.scheduler_payload), replacing separate requests for
+    classrooms, courses, time slots and classroom time slots. Clients revalidate with If-None-Match.
+    """
+    permission = PermissionType.use_scheduler
+
+    def get(self, request, pk):
+        program = get_object_or_404(Program, pk=pk)
+        return HttpResponse(
+            ujson.dumps({"data": build_scheduler_payload(program.id)}, ensure_ascii=False),
+            content_type="application/json",
+        )
+
+
+class ScheduleChangesApiView(PermissionRequiredMixin, View):
+    """
+    ClassroomTimeSlots changed since schedule version ``since`` (see esp.schedule_changes). Answers right away; clients
+    poll for changes.
+    """
+    permission = PermissionType.use_scheduler
+
+    def get(self, request, pk):
+        program = get_object_or_404(Program, pk=pk)
+        try:
+            since = int(request.GET["since"])
+        except (KeyError, ValueError):
+            return JsonResponse({}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({"data": schedule_changes(program.id, since)})
+
+
+class ScheduleConflictsApiView(PermissionRequiredMixin, View):
+    """Conflicts in the program's schedule (see esp.conflict_report), with the schedule version they were found at"""
+    permission = PermissionType.use_scheduler
+
+    def get(self, request, pk):
+        program = get_object_or_404(Program, pk=pk)
+        version, _reset_version = schedule_versions(program.id)
+        return JsonResponse({"data": {"version": version, "conflicts": schedule_conflict_report(program)}})
+
+
+class SectionPlacementsApiView(PermissionRequiredMixin, View):
+    """
+    Where a section could be placed, best fit first (see esp.placement_suggestions); ``limit`` caps the number of
+    placements returned.
+    """
+    permission = PermissionType.use_scheduler
+
+    def get(self, request, pk, section_pk):
+        program = get_object_or_404(Program, pk=pk)
+        section = get_object_or_404(
+            CourseSection, pk=section_pk, course__program=program, course__status=CourseStatus.accepted
+        )
+        try:
+            limit = int(request.GET["limit"]) if "limit" in request.GET else None
+        except ValueError:
+            return JsonResponse({}, status=status.HTTP_400_BAD_REQUEST)
+        index = placement_index(program)
+        return JsonResponse({"data": {"version": index.version, "placements": index.suggest(section.id, limit)}})
+
+
+class SectionMoveImpactApiView(PermissionRequiredMixin, View):
+    """
+    Enrolled students of a section who would have a time conflict if it were moved to the ClassroomTimeSlots given
+    as repeated ``classroom_time_slots`` parameters (see esp.move_impact)
+    """
+    permission = PermissionType.use_scheduler
+
+    def get(self, request, pk, section_pk):
+        section = get_object_or_404(
+            CourseSection.objects.select_related("course"), pk=section_pk, course__program_id=pk
+        )
+        try:
+            classroom_time_slot_ids = [UUID(value) for value in request.GET.getlist("classroom_time_slots")]
+            students = section_move_impact(section, classroom_time_slot_ids)
+        except ValueError:
+            return JsonResponse({}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({"data": {"students": students}})
+
+
 class SchedulerView(PermissionRequiredMixin, TemplateView):
     permission = PermissionType.use_scheduler
     template_name = "admin/scheduler.html"
@@ -86,16 +184,19 @@ class TimeSlotApiView(SerializerResponseMixin, BaseListView):
 
     def get_queryset(self, **kwargs):
         program = get_object_or_404(Program, pk=self.kwargs['pk'])
-        return (
-            TimeSlot
-                .objects
-                .filter(program=program)
-                .prefetch_related(
-                    "teacher_availabilities",
-                    "teacher_availabilities__registration__course_teachers",
-                    "teacher_availabilities__registration__user",
-                )
-        )
+        return TimeSlot.objects.filter(program=program)
+
+    def render_to_response(self, *_, **__):
+        """
+        Return the time slots, each with the teachers available per course by user ID, and those users once each
+        """
+        availability = course_teacher_availability(self.kwargs["pk"])
+        return JsonResponse({
+            "data": self.serializer_class(
+                self.object_list, many=True, context={"course_teacher_availability": availability}
+            ).data,
+            "users": availability["users"],
+        })
 
 
 class TeacherAvailabilityApiView(SerializerResponseMixin, BaseListView):
@@ -14,6 +14,7 @@ from requests import HTTPError
 
 from common.constants import PermissionType, UserType
 from common.views import PermissionRequiredMixin
+from esp.checkin import refresh_checkin_readiness
 from esp.constants import PaymentMethod, StudentRegistrationStepType
 from esp.forms import (FinancialAidRequestForm, PaymentForm,
                        UpdateStudentProfileForm)
@@ -21,7 +22,7 @@ from esp.integrations.cybersource import authorize_payment
 from esp.models.course_scheduling_models import CourseSection
 from esp.models.program_models import (Course, PreferenceEntryCategory,
                                        PreferenceEntryRound, Program,
-                                       PurchaseableItem, TimeSlot)
+                                       PurchaseableItem)
 from esp.models.program_registration_models import (ClassRegistration,
                                                     CompletedStudentForm,
                                                     CompletedStudentRegistrationStep,
@@ -31,6 +32,8 @@ from esp.models.program_registration_models import (ClassRegistration,
                                                     StudentAvailability,
                                                     UserPayment)
 from esp.serializers import ClassPreferenceSerializer
+from esp.time_slot_bitsets import TimeSlotBitsets
+from esp.waitlists import promote_from_waitlist
 
 ########################################################
 # STUDENT REGISTRATION GENERAL VIEWS
@@ -181,6 +184,7 @@ class SubmitWaiversView(RegistrationStepBaseView):
         # TODO: Form integrations; handle form completed model creation upon API response/webhook
         for form in self.object.incomplete_forms():
             CompletedStudentForm.objects.create(program_registration=self.object, form=form, completed_on=timezone.now())
+        refresh_checkin_readiness(StudentRegistration.objects.filter(id=self.object.id))
         return redirect("complete_registration_step", registration_id=self.object.id, step_id=self.registration_step.id)
 
 
@@ -283,6 +287,7 @@ class PayProgramFeesView(RegistrationStepBaseView):
                 )
             )
         PurchaseLineItem.objects.bulk_create(purchases_to_create)
+        refresh_checkin_readiness(StudentRegistration.objects.filter(id=self.object.id))
         if purchases_to_create:
             messages.info(request, f"{len(purchases_to_create)} items have been added to your cart.")
         return redirect(self.get_next_url())
@@ -452,27 +457,45 @@ class EditAssignedCoursesView(StudentRegistrationPermissionMixin, TemplateView):
             ClassRegistration.objects.filter(
                 program_registration__program_id=self.object.program_id).select_for_update()
             context = self.get_context_data()
-            try:
-                context["available_courses"].get(id=course_section_id)
-                ClassRegistration.objects.create(
-                    course_section_id=course_section_id, program_registration_id=self.object.id,
-                    created_by_lottery=False, confirmed_on=timezone.now()
-                )
-                if context.get("registration_to_swap"):
-                    registration = context["registration_to_swap"]
-                    registration.delete()
-                if self.request.GET.get('next'):
-                    return redirect(self.request.GET.get('next'))
-                return redirect('current_registration_stage', registration_id=self.object.id)
-            except CourseSection.DoesNotExist:
+            course_section = next((
+                course_section for course_section in context["available_courses"]
+                if str(course_section.id) == course_section_id
+                and not (course_section.student_unavailable or course_section.outside_availability)
+            ), None)
+            if course_section is None:
                 messages.error(self.request, 'This course is no longer available')
+                return redirect(self.request.get_full_path())
+            ClassRegistration.objects.create(
+                course_section_id=course_section.id, program_registration_id=self.object.id,
+                created_by_lottery=False, confirmed_on=timezone.now()
+            )
+            self.object.waitlist_entries.filter(course_section_id=course_section.id).delete()
+            if context.get("registration_to_swap"):
+                registration = context["registration_to_swap"]
+                registration.delete()
+                promote_from_waitlist(registration.course_section_id)
+            if self.request.GET.get('next'):
+                return redirect(self.request.GET.get('next'))
+            return redirect('current_registration_stage', registration_id=self.object.id)
 
     def get_available_courses(self, swap_id):
-        student_unavailable_timeslots = (
-            self.object.class_registrations.exclude(id=swap_id).values("course_section__time_slots__time_slot_id")
+        """
+        Sections with seats left in courses the student isn't taking, flagged with ``student_unavailable`` when they
+        overlap the student's other registrations and ``outside_availability`` when the student marked themselves
+        unavailable for any of their time slots. Both checks are bitwise ANDs of time slot bitsets.
+        """
+        bitsets = TimeSlotBitsets.for_program(self.object.program_id)
+        footprints = bitsets.section_footprints()
+        registered_sections = self.object.class_registrations.exclude(id=swap_id).values_list(
+            "course_section_id", flat=True
         )
+        busy_slots = 0
+        for section_id in registered_sections:
+            busy_slots |= footprints.get(section_id, 0)
+        available_slots = bitsets.student_availability([self.object.id]).get(self.object.id, bitsets.all_slots)
+
         student_courses = self.object.class_registrations.exclude(id=swap_id).values('course_section__course_id')
-        return (
+        course_sections = list(
             CourseSection.objects.exclude(registrations__id=swap_id, registrations__isnull=False)
             .filter(course__program_id=self.object.program_id)
             .exclude(course_id__in=student_courses).distinct()
@@ -480,12 +503,12 @@ class EditAssignedCoursesView(StudentRegistrationPermissionMixin, TemplateView):
             .filter(num_registrations__lt=F('course__max_section_size'))
             .annotate(start_time=Min("time_slots__time_slot__start_datetime"))
             .order_by("start_time")
-            .annotate(student_unavailable=Exists(
-                TimeSlot.objects.filter(
-                    id__in=student_unavailable_timeslots, classrooms__course_section_id=OuterRef('id')
-                ))
-            )
         )
+        for course_section in course_sections:
+            footprint = footprints.get(course_section.id, 0)
+            course_section.student_unavailable = bool(footprint & busy_slots)
+            course_section.outside_availability = bool(footprint & ~available_slots)
+        return course_sections
 
 
 class DeleteCourseRegistrationView(PermissionRequiredMixin, SingleObjectMixin, View):
@@ -499,8 +522,10 @@ class DeleteCourseRegistrationView(PermissionRequiredMixin, SingleObjectMixin, V
 
     def post(self, request, *args, **kwargs):
         try:
-            course_registration = self.get_object()
-            course_registration.delete()
+            with transaction.atomic():
+                course_registration = self.get_object()
+                course_registration.delete()
+                promote_from_waitlist(course_registration.course_section_id)
         except ClassRegistration.DoesNotExist:
             messages.error(request, message='Action not allowed')
         if self.request.GET.get('next'):
@@ -547,6 +572,7 @@ class MakePaymentView(RegistrationStepBaseView, FormView):
     def post(self, request, *args, **kwargs):
         if self.total_charge == 0:
             self.cart.update(purchase_confirmed_on=timezone.now())
+            refresh_checkin_readiness(StudentRegistration.objects.filter(id=self.object.id))
             return self.get_success_url()
         return super().post(request, *args, **kwargs)
 
@@ -567,6 +593,7 @@ class MakePaymentView(RegistrationStepBaseView, FormView):
             transaction_datetime=timezone.now(),
         )
         cart.update(payment=payment, purchase_confirmed_on=timezone.now())
+        refresh_checkin_readiness(StudentRegistration.objects.filter(id=self.object.id))
         return self.get_success_url()
 
     def get_success_url(self):
@@ -9,13 +9,13 @@ from django.views.generic.detail import DetailView, SingleObjectMixin
 from common.constants import PermissionType, UserType
 from common.views import PermissionRequiredMixin
 from esp.constants import TeacherRegistrationStepType
+from esp.course_teacher_availability import invalidate_course_teacher_availability
 from esp.forms import (AddCoTeacherForm, TeacherCourseForm,
                        UpdateTeacherProfileForm)
 from esp.models.program_models import (Course, Program,
                                        TeacherProgramRegistrationStep)
 from esp.models.program_registration_models import (
-    CompletedTeacherRegistrationStep, CourseTeacher, TeacherAvailability,
-    TeacherProfile, TeacherRegistration)
+    CourseTeacher, TeacherAvailability, TeacherProfile, TeacherRegistration)
 
 
 class TeacherProgramRegistrationCreateView(PermissionRequiredMixin, SingleObjectMixin, TemplateView):
@@ -57,7 +57,7 @@ class TeacherProgramDashboardView(PermissionRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["completed_steps"] = self.object.completed_steps.values_list("step_id", flat=True)
+        context["completed_steps"] = self.object.completed_step_ids()
         return context
 
 
@@ -108,13 +108,11 @@ class TeacherRegistrationStepBaseView(PermissionRequiredMixin, DetailView):
 
     def get_success_url(self):
         """Also marks step completed!"""
-        CompletedTeacherRegistrationStep.objects.update_or_create(
-            registration=self.object, step=self.registration_step, defaults={"completed_on": timezone.now()}
-        )
+        self.object.mark_step_completed(self.registration_step)
         next_step = self.registration_step.get_next_in_order()
         if (
             next_step and self.object.has_access_to_step(next_step)
-            and next_step.id not in self.object.completed_steps.values("step_id")
+            and next_step.id not in self.object.completed_step_ids()
         ):
             return reverse(
                 "teacher_registration_step", kwargs={"registration_id": self.object.id, "step_id": next_step.id}
@@ -164,6 +162,8 @@ class TeacherAvailabilityView(TeacherRegistrationStepBaseView):
                 )
             else:
                 TeacherAvailability.objects.filter(time_slot=time_slot, registration=self.object).delete()
+        # Deleting through the queryset skips TeacherAvailability.delete
+        invalidate_course_teacher_availability([self.object.program_id])
         return redirect(self.get_success_url())
 
 
@@ -0,0 +1,58 @@
+from django.db import transaction
+
+from esp.models.course_scheduling_models import CourseSection
+from esp.models.program_registration_models import ClassRegistration, WaitlistEntry
+from esp.time_slot_bitsets import TimeSlotBitsets
+
+
+def promote_from_waitlist(course_section_id):
+    """
+    Fill a section's open seats from its waitlist, in position order. Students already enrolled in the course leave
+    the waitlist; students whose schedule or availability conflicts with the section keep their place for later.
+    Runs in one short transaction that locks the section, so that concurrent seat releases never promote the same
+    student twice or overfill the section. Promotions from a waitlist made by a lottery run are tagged with that run,
+    like its own placements, so that rolling the run back also undoes them. Returns the ClassRegistrations created.
+    """
+    with transaction.atomic():
+        section = CourseSection.objects.select_for_update().select_related("course").get(id=course_section_id)
+        open_seats = section.course.max_section_size - section.registrations.count()
+        if open_seats <= 0:
+            return []
+        entries = list(section.waitlist_entries.order_by("position").values_list(
+            "id", "program_registration_id", "lottery_run_id"
+        ))
+        if not entries:
+            return []
+
+        bitsets = TimeSlotBitsets.for_program(section.course.program_id)
+        footprint = bitsets.from_slot_ids(section.time_slots.values_list("time_slot_id", flat=True))
+        registration_ids = [registration_id for _entry_id, registration_id, _lottery_run_id in entries]
+        busy_slots = {}
+        enrolled_courses = {}
+        for registration_id, course_id, slot_id in ClassRegistration.objects.filter(
+            program_registration_id__in=registration_ids
+        ).values_list(
+            "program_registration_id", "course_section__course_id", "course_section__time_slots__time_slot_id"
+        ):
+            enrolled_courses.setdefault(registration_id, set()).add(course_id)
+            busy_slots[registration_id] = busy_slots.get(registration_id, 0) | bitsets.bit_of.get(slot_id, 0)
+        available_slots = bitsets.student_availability(registration_ids)
+
+        promoted = []
+        finished_entry_ids = []
+        for entry_id, registration_id, lottery_run_id in entries:
+            if section.course_id in enrolled_courses.get(registration_id, ()):
+                finished_entry_ids.append(entry_id)
+            elif not footprint & (
+                busy_slots.get(registration_id, 0) | ~available_slots.get(registration_id, bitsets.all_slots)
+            ):
+                finished_entry_ids.append(entry_id)
+                # Left unconfirmed, so that the student is asked to confirm the new class like lottery placements
+                promoted.append(ClassRegistration.objects.create(
+                    course_section=section, program_registration_id=registration_id,
+                    created_by_lottery=lottery_run_id is not None, lottery_run_id=lottery_run_id,
+                ))
+                if len(promoted) == open_seats:
+                    break
+        WaitlistEntry.objects.filter(id__in=finished_entry_ids).delete()
+    return promoted
@@ -1,6 +1,6 @@
 import {useEffect, useMemo, useState} from "react";
 import dayjs from "dayjs";
-import {getQueryParam, loadData} from "./utils";
+import {applyClassroomTimeSlotChanges, decodeSchedule, getQueryParam, loadData, secureFetch} from "./utils";
 import {CourseSelector} from "./components/courseSelector";
 import {Scheduler} from "./components/scheduler";
 import {DAYS_OF_WEEK} from "./constants";
@@ -26,6 +26,7 @@ const DEFAULT_LOADING = {
   classroomTimeSlots: true,
   timeSlots: true,
 }
+const SCHEDULE_CHANGES_POLL_MILLISECONDS = 3000
 const DEFAULT_SELECTED = {
   assignments: {},  // classroomTimeSlotId<string>:courseSection<object>
   course: null,
@@ -60,18 +61,48 @@ export default function App() {
 
   // eslint-disable-next-line react-hooks/rules-of-hooks
   useEffect(() => {
-    loadData('/api/v0/classrooms/', setDataAndLoadingFunc(setClassrooms, 'classrooms'))
-    loadData(
-      `/api/v0/programs/${programId}/classroom-time-slots/`,
-      setDataAndLoadingFunc(setClassroomTimeSlots, 'classroomTimeSlots'),
-      processTimeSlots,
-    )
-    loadData(`/api/v0/programs/${programId}/courses/`, setDataAndLoadingFunc(setCourses, 'courses'))
-    loadData(
-      `/api/v0/programs/${programId}/time-slots/`,
-      setDataAndLoadingFunc(setTimeSlots, 'timeSlots'),
-      processTimeSlots,
-    )
+    const controller = new AbortController()
+
+    // The whole schedule comes in one request; see esp/scheduler_payload.py
+    const loadSchedule = async () => {
+      const schedule = await loadData(`/api/v0/programs/${programId}/schedule/`, (data) => {
+        setDataAndLoadingFunc(setClassrooms, 'classrooms')(data.classrooms)
+        setDataAndLoadingFunc(setClassroomTimeSlots, 'classroomTimeSlots')(processTimeSlots(data.classroomTimeSlots))
+        setDataAndLoadingFunc(setCourses, 'courses')(data.courses)
+        setDataAndLoadingFunc(setTimeSlots, 'timeSlots')(processTimeSlots(data.timeSlots))
+      }, decodeSchedule)
+      return schedule.version
+    }
+
+    // Then only classroom time slots changed since, by us or by other admins; see esp/schedule_changes.py
+    const followChanges = async () => {
+      let version = await loadSchedule()
+      while (!controller.signal.aborted) {
+        await new Promise((resolve) => setTimeout(resolve, SCHEDULE_CHANGES_POLL_MILLISECONDS))
+        try {
+          const response = await secureFetch(
+            `${process.env.REACT_APP_API_BASE_URL}/api/v0/programs/${programId}/schedule/changes/?since=${version}`,
+            {signal: controller.signal},
+          )
+          const changes = (await response.json()).data
+          if (changes.reset) {
+            version = await loadSchedule()
+            continue
+          }
+          if (changes.classroom_time_slots.length > 0) {
+            setClassroomTimeSlots((previous) => applyClassroomTimeSlotChanges(
+              previous, processTimeSlots(changes.classroom_time_slots),
+            ))
+          }
+          version = changes.version
+        } catch (e) {
+          // Retried on the next poll
+        }
+      }
+    }
+
+    followChanges()
+    return () => controller.abort()
   }, [programId, setDataAndLoadingFunc])
 
   return (
@@ -104,10 +135,8 @@ export default function App() {
           <Actions
             classrooms={classrooms}
             classroomTimeSlots={classroomTimeSlots}
-            processTimeSlots={processTimeSlots}
             programId={programId}
             selected={selected}
-            setClassroomTimeSlots={setClassroomTimeSlots}
             setSelected={setSelected}
             DEFAULT_SELECTED={DEFAULT_SELECTED}
           />
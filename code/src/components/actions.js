@@ -1,6 +1,6 @@
 import {Modal, Toast} from "react-bootstrap";
 import {useMemo, useState} from "react";
-import {loadData, secureFetch, useStateWithCallback} from "../utils";
+import {secureFetch, useStateWithCallback} from "../utils";
 import {BsExclamationCircleFill, BsFillCheckCircleFill, BsInfoCircleFill} from "react-icons/all";
 
 
@@ -23,10 +23,8 @@ export function Actions(props) {
   const {
     classrooms,
     classroomTimeSlots,
-    processTimeSlots,
     programId,
     selected,
-    setClassroomTimeSlots,
     setSelected,
     DEFAULT_SELECTED,
   } = props
@@ -189,9 +187,14 @@ export function Actions(props) {
 
   async function submitData() {
     setSubmitting(true)
+    const scheduleVersionById = Object.fromEntries(classroomTimeSlots.map((classroomTimeSlot) => (
+      [classroomTimeSlot.id, classroomTimeSlot.schedule_version]
+    )))
     const data = Object.entries(selected.assignments).map(([classroomTimeSlotId, courseSection]) => ({
       classroom_time_slot_id: classroomTimeSlotId,
       course_section_id: courseSection?.id ?? null,
+      // Saving fails with a conflict if someone else has changed the slot since
+      expected_version: scheduleVersionById[classroomTimeSlotId],
     }))
 
     let response
@@ -212,23 +215,24 @@ export function Actions(props) {
       return showToast('Oops! There was an issue communicating with the server.', TOAST_TYPES.warning)
     }
 
+    if (response.status === 409) {
+      setSubmitting(false)
+      setShowSubmitModal(false)
+      return showToast(
+        'Someone else has just changed some of these classroom slots, so nothing was saved. '
+        + 'Please review their changes, which will appear shortly, and try again.',
+        TOAST_TYPES.warning,
+      )
+    }
     if (!response.ok) {
       setSubmitting(false)
       return showToast('Oops! Something went wrong with submitting your data.', TOAST_TYPES.warning)
     }
 
-    await loadData(
-      `/api/v0/programs/${programId}/classroom-time-slots/`,
-      setClassroomTimeSlots,
-      _processTimeSlots,
-    )
+    // The saved assignments arrive with the next schedule changes poll (see App)
+    setSelected(DEFAULT_SELECTED)
+    setShowSubmitModal(false)
+    setSubmitting(false)
     showToast('Your changes have been saved!', TOAST_TYPES.success)
-
-    function _processTimeSlots(data) {
-      setSelected(DEFAULT_SELECTED)
-      setShowSubmitModal(false)
-      setSubmitting(false)
-      return processTimeSlots(data)
-    }
   }
 }
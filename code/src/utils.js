@@ -25,6 +25,80 @@ export async function loadData(endpoint, setStateFunc, processFunc) {
     data = processFunc(data)
   }
   setStateFunc(data)
+  return data
+}
+
+/**
+ * Expand the columnar tables of `/api/v0/programs/<program_id>/schedule/` into the row objects returned by the
+ * classroom, classroom time slot, course and time slot endpoints
+ */
+export function decodeSchedule(tables) {
+  const rows = (table) => {
+    const fields = Object.keys(table)
+    const length = fields.length === 0 ? 0 : table[fields[0]].length
+    return Array.from({length}, (_, index) => Object.fromEntries(fields.map((field) => [field, table[field][index]])))
+  }
+
+  const classrooms = rows(tables.classrooms)
+  const teachers = rows(tables.teachers)
+  const courses = rows(tables.courses).map((course) => ({...course, sections: [], sections_count: 0}))
+  const courseSections = rows(tables.course_sections).map((section) => {
+    const course = courses[section.course]
+    const courseSection = {id: section.id, course_id: course.id, display_id: section.display_id}
+    course.sections.push(courseSection)
+    course.sections_count += 1
+    return courseSection
+  })
+
+  // Each time slot lists, by course id, the course's teachers available then
+  const timeSlots = rows(tables.time_slots).map((timeSlot) => ({...timeSlot, course_teacher_availabilities: {}}))
+  const teacherCourses = teachers.map(() => [])
+  tables.course_teachers.teacher.forEach((teacher, index) => {
+    teacherCourses[teacher].push(courses[tables.course_teachers.course[index]].id)
+  })
+  tables.teacher_availabilities.teacher.forEach((teacher, index) => {
+    const availabilities = timeSlots[tables.teacher_availabilities.time_slot[index]].course_teacher_availabilities
+    teacherCourses[teacher].forEach((courseId) => {
+      availabilities[courseId] = availabilities[courseId] || []
+      if (!availabilities[courseId].includes(teachers[teacher])) {
+        availabilities[courseId].push(teachers[teacher])
+      }
+    })
+  })
+
+  const classroomTimeSlots = tables.classroom_time_slots.id.map((id, index) => {
+    const timeSlot = timeSlots[tables.classroom_time_slots.time_slot[index]]
+    const section = tables.classroom_time_slots.course_section[index]
+    const courseSection = section === null ? null : courseSections[section]
+    return {
+      classroom_id: classrooms[tables.classroom_time_slots.classroom[index]].id,
+      course_id: courseSection === null ? null : courseSection.course_id,
+      course_name: courseSection === null ? null : courses[tables.course_sections.course[section]].name,
+      course_section: courseSection,
+      course_section_id: courseSection === null ? null : courseSection.id,
+      end_datetime: timeSlot.end_datetime,
+      id,
+      schedule_version: tables.classroom_time_slots.schedule_version[index],
+      start_datetime: timeSlot.start_datetime,
+      time_slot_id: timeSlot.id,
+    }
+  })
+
+  return {classrooms, classroomTimeSlots, courses, timeSlots, version: tables.version}
+}
+
+/**
+ * Replace classroom time slots by their changed versions from `/api/v0/programs/<program_id>/schedule/changes/`,
+ * adding any that are new
+ */
+export function applyClassroomTimeSlotChanges(classroomTimeSlots, changedClassroomTimeSlots) {
+  const changedById = Object.fromEntries(changedClassroomTimeSlots.map((changed) => [changed.id, changed]))
+  const updated = classroomTimeSlots.map((classroomTimeSlot) => {
+    const changed = changedById[classroomTimeSlot.id]
+    delete changedById[classroomTimeSlot.id]
+    return changed ?? classroomTimeSlot
+  })
+  return [...updated, ...Object.values(changedById)]
 }
 
 /**